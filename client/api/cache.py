@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+"""Persistent on-disk cache of API responses for the desktop client.
+
+Responses are stored in a small SQLite database in the user's profile,
+keyed by request path and filters together with the server's ETag and
+Last-Modified validators. Entries are evicted least-recently-used once the
+cache grows past its size limit.
+"""
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024  # 50 MB
+
+
+def user_data_dir() -> Path:
+    """Return the per-user directory where the client keeps local state."""
+    override = os.environ.get("EDMS_DATA_DIR")
+    if override:
+        return Path(override)
+    local_app_data = os.environ.get("LOCALAPPDATA")
+    if local_app_data:
+        return Path(local_app_data) / "EDMS"
+    return Path.home() / ".edms"
+
+
+class CacheEntry(NamedTuple):
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+
+class ResponseCache:
+    """SQLite-backed, size-bounded LRU cache of response bodies.
+
+    A single connection is shared between the UI thread and background
+    workers, so every access goes through a lock.
+    """
+
+    def __init__(self, path: Optional[Path] = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path) if path else user_data_dir() / "cache.sqlite3"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " body BLOB NOT NULL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " size INTEGER NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_entries_accessed ON entries (accessed_at)"
+        )
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Return the cached entry for key and mark it recently used."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM entries"
+                " WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?",
+                               (time.time(), key))
+        body, etag, last_modified, fetched_at = row
+        return CacheEntry(zlib.decompress(body), etag, last_modified, fetched_at)
+
+    def put(self, key: str, body: bytes, etag: Optional[str] = None,
+            last_modified: Optional[str] = None) -> None:
+        """Store a response body and evict old entries if over the limit."""
+        packed = zlib.compress(body)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries"
+                " (key, body, etag, last_modified, size, fetched_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, packed, etag, last_modified, len(packed), now, now))
+            self._evict()
+
+    def touch(self, key: str) -> None:
+        """Record that the server confirmed the cached entry is current."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE entries SET fetched_at = ?, accessed_at = ? WHERE key = ?",
+                (now, now, key))
+
+    def _evict(self) -> None:
+        """Drop least-recently-used entries until under max_bytes."""
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at").fetchall()
+        doomed = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+
+    def clear(self) -> None:
+        """Remove every cached entry."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def open_default_cache() -> Optional[ResponseCache]:
+    """Open the cache in the user profile, or None if that is not possible."""
+    try:
+        return ResponseCache()
+    except (OSError, sqlite3.Error):
+        return None
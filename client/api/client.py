@@ -0,0 +1,479 @@
+#!/usr/bin/python3
+"""HTTP client for the EDMS server API.
+
+GET requests go through a ResponseCache: the cached body is available
+immediately, and revalidation sends the stored ETag so unchanged data
+comes back as a cheap 304. When the server cannot be reached the cached
+copy is returned and the caller is told it is working offline.
+
+After login() the client holds a refresh token as well as the access token;
+a request rejected with 401 because the access token expired is retried
+once with a freshly refreshed one.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Optional, Tuple
+from urllib.parse import urlencode
+
+import requests
+from urllib3.util.request import ACCEPT_ENCODING
+
+from api.cache import ResponseCache
+
+
+DEFAULT_BASE_URL = os.environ.get("EDMS_API_URL", "http://127.0.0.1:8000")
+
+# Revalidation outcomes reported by ApiClient.get_json
+FRESH = "fresh"          # server sent a new body
+UNCHANGED = "unchanged"  # server answered 304, cached body is current
+OFFLINE = "offline"      # server unreachable, cached body returned
+
+
+class ApiError(Exception):
+    """Raised when the server rejects a request."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class OfflineError(ApiError):
+    """Raised when the server is unreachable and nothing is cached."""
+
+
+class ApiClient:
+    """Thin wrapper around requests.Session for the EDMS API."""
+
+    def __init__(self, base_url: Optional[str] = None, token: Optional[str] = None,
+                 cache: Optional[ResponseCache] = None, timeout: float = 10):
+        self.base_url = (base_url or DEFAULT_BASE_URL).rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        # Advertise brotli only when urllib3 can decode it
+        self.session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        self.cache = cache
+        self.token = None
+        self.refresh_token: Optional[str] = None
+        self.on_tokens: Optional[Callable[[dict], None]] = None
+        self._refresh_lock = threading.Lock()
+        self.session.hooks["response"].append(self._retry_unauthorized)
+        self.set_token(token)
+
+    def set_token(self, token: Optional[str]) -> None:
+        """Use token as the bearer credential for later requests."""
+        self.token = token
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+        else:
+            self.session.headers.pop("Authorization", None)
+
+    def login(self, username: str, password: str) -> dict:
+        """Sign in with a password; returns the token response."""
+        try:
+            response = self.session.post(self.url("/token"), timeout=self.timeout,
+                                         data={"username": username, "password": password})
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise OfflineError(f"Cannot connect to server: {e}") from e
+        if response.status_code != 200:
+            raise ApiError(_error_detail(response), response.status_code)
+        return self._use_tokens(response.json())
+
+    def resume(self, refresh_token: str) -> dict:
+        """Sign in again with a saved refresh token; no password needed."""
+        self.refresh_token = refresh_token
+        return self.refresh()
+
+    def refresh(self) -> dict:
+        """Trade the refresh token for a new token pair."""
+        if not self.refresh_token:
+            raise ApiError("Not signed in", 401)
+        try:
+            response = requests.post(self.url("/token/refresh"), timeout=self.timeout,
+                                     json={"refresh_token": self.refresh_token})
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise OfflineError(f"Cannot connect to server: {e}") from e
+        if response.status_code != 200:
+            raise ApiError(_error_detail(response), response.status_code)
+        return self._use_tokens(response.json())
+
+    def logout(self) -> None:
+        self.refresh_token = None
+        self.set_token(None)
+
+    def _use_tokens(self, tokens: dict) -> dict:
+        self.refresh_token = tokens.get("refresh_token")
+        self.set_token(tokens["access_token"])
+        if self.on_tokens is not None:
+            self.on_tokens(tokens)
+        return tokens
+
+    def _retry_unauthorized(self, response, *args, **kwargs):
+        """Response hook: on 401, refresh the access token and resend once."""
+        request = response.request
+        if (response.status_code != 401 or not self.refresh_token
+                or "Authorization" not in request.headers
+                or getattr(request, "_edms_retried", False)
+                or not isinstance(request.body, (type(None), str, bytes))):
+            return response  # streamed uploads cannot be replayed
+        if not self._refresh_rejected(request.headers["Authorization"]):
+            return response
+        retry = request.copy()
+        retry.headers["Authorization"] = self.session.headers["Authorization"]
+        retry._edms_retried = True
+        response.content  # release the connection before resending
+        response.close()
+        return self.session.send(retry, **kwargs)
+
+    def _refresh_rejected(self, sent_with: str) -> bool:
+        """Refresh after a 401 for a request sent with sent_with.
+
+        Returns True if the client now holds a different access token.
+        """
+        with self._refresh_lock:
+            # Another thread may have refreshed while this request was out
+            if self.session.headers.get("Authorization") == sent_with:
+                try:
+                    self.refresh()
+                except ApiError:
+                    return False
+        return self.session.headers.get("Authorization") != sent_with
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def cache_key(self, path: str, params: Optional[dict] = None) -> str:
+        """Build a stable cache key from the path and non-empty params."""
+        items = sorted((k, v) for k, v in (params or {}).items()
+                       if v not in (None, ""))
+        query = urlencode(items)
+        return f"{self.base_url}{path}?{query}" if query else f"{self.base_url}{path}"
+
+    def cached(self, path: str, params: Optional[dict] = None) -> Optional[Any]:
+        """Return the cached JSON for a request without touching the network."""
+        if self.cache is None:
+            return None
+        entry = self.cache.get(self.cache_key(path, params))
+        return json.loads(entry.body) if entry else None
+
+    def get_json(self, path: str, params: Optional[dict] = None) -> Tuple[Any, str]:
+        """GET path, revalidating any cached copy.
+
+        Returns (data, outcome) where outcome is FRESH, UNCHANGED or OFFLINE.
+        """
+        params = {k: v for k, v in (params or {}).items() if v not in (None, "")}
+        key = self.cache_key(path, params)
+        entry = self.cache.get(key) if self.cache is not None else None
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        try:
+            response = self.session.get(self.url(path), params=params,
+                                        headers=headers, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if entry is not None:
+                return json.loads(entry.body), OFFLINE
+            raise OfflineError(f"Cannot connect to server: {e}") from e
+
+        if response.status_code == 304 and entry is not None:
+            self.cache.touch(key)
+            return json.loads(entry.body), UNCHANGED
+        if response.status_code != 200:
+            raise ApiError(_error_detail(response), response.status_code)
+
+        if self.cache is not None:
+            self.cache.put(key, response.content,
+                           etag=response.headers.get("ETag"),
+                           last_modified=response.headers.get("Last-Modified"))
+        return response.json(), FRESH
+
+    def health(self, timeout: float = 2) -> dict:
+        """Check that the server is up; also opens the pooled connection."""
+        try:
+            response = self.session.get(self.url("/health"), timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise OfflineError(f"Cannot connect to server: {e}") from e
+        if response.status_code != 200:
+            raise ApiError(_error_detail(response), response.status_code)
+        return response.json()
+
+    # Convenience wrappers for the endpoints used by the UI
+    def search_records(self, **filters) -> Tuple[Any, str]:
+        return self.get_json("/records", filters)
+
+    def record_stats(self) -> Tuple[Any, str]:
+        return self.get_json("/records/stats")
+
+    def record_facets(self, **filters) -> Tuple[Any, str]:
+        return self.get_json("/records/facets", filters)
+
+    def stream_events(self, types: Optional[str] = None, year=None,
+                      last_event_id: Optional[str] = None,
+                      on_response: Optional[Callable[[Any], None]] = None,
+                      read_timeout: float = 45):
+        """Yield change events from the server's Server-Sent Events feed.
+
+        Each event is a dict with "id", "type" and "data". on_response is
+        called with the open response so another thread can close it to
+        stop the stream. The server sends a keep-alive at least every 15 s,
+        so read_timeout only expires on a dead connection.
+        """
+        # A dedicated session keeps the long-lived connection out of the pool
+        # shared with ordinary requests
+        session = requests.Session()
+        session.headers.update(self.session.headers)
+        session.headers["Accept"] = "text/event-stream"
+        if last_event_id:
+            session.headers["Last-Event-ID"] = str(last_event_id)
+        params = {k: v for k, v in {"types": types, "year": year}.items() if v}
+        try:
+            response = session.get(self.url("/events"), params=params, stream=True,
+                                   timeout=(self.timeout, read_timeout))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            session.close()
+            raise OfflineError(f"Cannot connect to server: {e}") from e
+        if response.status_code != 200:
+            session.close()
+            if response.status_code == 401 and self.refresh_token:
+                # The worker reconnects with the refreshed token
+                self._refresh_rejected(session.headers.get("Authorization", ""))
+            raise ApiError(_error_detail(response), response.status_code)
+        if on_response is not None:
+            on_response(response)
+
+        event = {"id": None, "type": "message", "data": []}
+        try:
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if line is None:
+                        continue
+                    if not line:
+                        if event["data"]:
+                            yield {"id": event["id"], "type": event["type"],
+                                   "data": json.loads("\n".join(event["data"]))}
+                        event = {"id": None, "type": "message", "data": []}
+                        continue
+                    if line.startswith(":"):
+                        continue  # keep-alive comment
+                    field, _, value = line.partition(":")
+                    value = value[1:] if value.startswith(" ") else value
+                    if field == "id":
+                        event["id"] = value
+                    elif field == "event":
+                        event["type"] = value
+                    elif field == "data":
+                        event["data"].append(value)
+        except (requests.ConnectionError, requests.Timeout, AttributeError) as e:
+            # AttributeError: urllib3 after the response was closed elsewhere
+            raise OfflineError(f"Event stream interrupted: {e}") from e
+        finally:
+            session.close()
+
+    def record_preview(self, record_id: int, sha256: str) -> Tuple[Optional[bytes], float]:
+        """Return (png bytes, 0) for a record's document thumbnail.
+
+        Thumbnails are keyed by blob digest and never change, so a cached
+        copy is used without asking the server. While the server is still
+        rendering it, returns (None, seconds to wait before asking again,
+        from Retry-After). Raises ApiError (404) if there is no preview.
+        """
+        key = f"preview:{sha256}"
+        entry = self.cache.get(key) if self.cache is not None else None
+        if entry is not None:
+            return entry.body, 0.0
+        try:
+            response = self.session.get(self.url(f"/records/{record_id}/preview"),
+                                        timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise OfflineError(f"Cannot connect to server: {e}") from e
+        if response.status_code == 202:
+            try:
+                retry_after = float(response.headers.get("Retry-After", 1))
+            except ValueError:
+                retry_after = 1.0  # an HTTP date; not sent by this server
+            return None, max(retry_after, 0.0)
+        if response.status_code != 200:
+            raise ApiError(_error_detail(response), response.status_code)
+        if self.cache is not None:
+            self.cache.put(key, response.content)
+        return response.content, 0.0
+
+    def upload_document(self, record_id: int, file_path: str) -> dict:
+        """Stream a scanned document to the server and link it to a record."""
+        path = Path(file_path)
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        try:
+            with open(path, "rb") as f:
+                # Passing the file object makes requests stream it in chunks
+                response = self.session.put(
+                    self.url(f"/records/{record_id}/document"),
+                    params={"filename": path.name}, data=f,
+                    headers={"Content-Type": content_type,
+                             "Content-Length": str(path.stat().st_size)},
+                    timeout=self.timeout * 30)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise OfflineError(f"Cannot connect to server: {e}") from e
+        if response.status_code != 200:
+            raise ApiError(_error_detail(response), response.status_code)
+        return response.json()
+
+    def workbook_headers(self) -> dict:
+        """Return the server's accepted column headers ({"aliases", "required"})."""
+        return self.get_json("/api/workbook/headers")[0]
+
+    def find_upload(self, sha256: str, year) -> Optional[dict]:
+        """Return the server's record of an earlier upload of this workbook."""
+        try:
+            response = self.session.get(self.url(f"/api/uploads/{sha256}"),
+                                        params={"year": year}, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise OfflineError(f"Cannot connect to server: {e}") from e
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise ApiError(_error_detail(response), response.status_code)
+        return response.json()
+
+    def upload_workbook(self, file_path: str, year,
+                        progress: Optional[Callable[[int], None]] = None,
+                        url: Optional[str] = None,
+                        content_type: Optional[str] = None,
+                        content_encoding: Optional[str] = None,
+                        filename: Optional[str] = None,
+                        source_sha256: Optional[str] = None) -> dict:
+        """Stream a workbook (or its CSV.gz conversion) for ingestion into year.
+
+        progress, if given, is called with the number of bytes sent by each
+        read so callers can track per-file progress and throughput. When a
+        converted payload is sent, filename and source_sha256 describe the
+        original workbook so the server can recognise re-uploads of it.
+        """
+        path = Path(file_path)
+        size = path.stat().st_size
+        content_type = (content_type or mimetypes.guess_type(path.name)[0]
+                        or "application/octet-stream")
+        headers = {"Content-Type": content_type, "Content-Length": str(size)}
+        if content_encoding:
+            headers["Content-Encoding"] = content_encoding
+        params = {"year": year, "filename": filename or path.name}
+        if source_sha256:
+            params["source_sha256"] = source_sha256
+        try:
+            with open(path, "rb") as f:
+                body = _ProgressReader(f, size, progress) if progress else f
+                response = self.session.post(url or self.url("/api/upload"),
+                                             params=params, data=body, headers=headers,
+                                             timeout=self.timeout * 30)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise OfflineError(f"Cannot connect to server: {e}") from e
+        if response.status_code != 200:
+            raise ApiError(_error_detail(response), response.status_code)
+        return response.json()
+
+    def download_document(self, record_id: int, dest_path: str,
+                          sha256: Optional[str] = None,
+                          progress: Optional[Callable[[int, int], None]] = None,
+                          should_stop: Optional[Callable[[], bool]] = None) -> bool:
+        """Download a record's document to dest_path, resuming if possible.
+
+        Bytes are written to ``dest_path + ".part"``. If that file exists the
+        request asks only for the missing range, guarded by If-Range on the
+        blob digest so a changed document restarts from scratch. The finished
+        file is checked against sha256 when given.
+
+        Returns False if should_stop() asked for the download to pause; the
+        partial file is kept for the next attempt.
+        """
+        part_path = Path(str(dest_path) + ".part")
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        headers = {"Accept-Encoding": "identity"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if sha256:
+                headers["If-Range"] = f'"{sha256}"'
+
+        url = self.url(f"/records/{record_id}/document")
+        try:
+            response = self.session.get(url, headers=headers, stream=True,
+                                        timeout=self.timeout)
+            if response.status_code == 416:
+                # Our partial file is unusable (e.g. longer than the blob)
+                response.close()
+                part_path.unlink()
+                offset = 0
+                response = self.session.get(url, headers={"Accept-Encoding": "identity"},
+                                            stream=True, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise OfflineError(f"Cannot connect to server: {e}") from e
+
+        with response:
+            if response.status_code == 206:
+                total = int(response.headers["Content-Range"].rsplit("/", 1)[1])
+                mode = "ab"
+            elif response.status_code == 200:
+                total = int(response.headers.get("Content-Length", 0))
+                offset, mode = 0, "wb"
+            else:
+                raise ApiError(_error_detail(response), response.status_code)
+
+            received = offset
+            try:
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=256 * 1024):
+                        f.write(chunk)
+                        received += len(chunk)
+                        if progress is not None:
+                            progress(received, total)
+                        if should_stop is not None and should_stop():
+                            return False
+            except (requests.ConnectionError, requests.Timeout) as e:
+                raise OfflineError(f"Download interrupted: {e}") from e
+
+        if sha256 and file_sha256(part_path) != sha256:
+            part_path.unlink()
+            raise ApiError("Downloaded document is corrupt; please retry")
+        os.replace(part_path, dest_path)
+        return True
+
+
+class _ProgressReader:
+    """File wrapper that reports how many bytes requests has read."""
+
+    def __init__(self, f, size: int, callback: Callable[[int], None]):
+        self._f = f
+        self._size = size
+        self._callback = callback
+
+    def __len__(self):
+        return self._size
+
+    def read(self, n: int = -1) -> bytes:
+        chunk = self._f.read(n)
+        if chunk:
+            self._callback(len(chunk))
+        return chunk
+
+
+def file_sha256(path) -> str:
+    """Hash a file in 1 MB chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _error_detail(response) -> str:
+    """Extract the FastAPI error detail from a response, if present."""
+    try:
+        detail = response.json().get("detail")
+    except ValueError:
+        detail = None
+    return str(detail or f"Server error: {response.status_code}")
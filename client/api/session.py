@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+"""Remembered sign-in for the desktop client.
+
+Only the refresh token is kept; the access token is short-lived and is
+fetched again on the next launch. When the keyring package is installed
+the token goes into the operating system's credential store (Windows
+Credential Manager, macOS Keychain, Secret Service) and the JSON file
+holds just the server and user name. Otherwise the token is written to the
+file, which is readable by the current user only.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+from api.cache import user_data_dir
+
+KEYRING_SERVICE = "EDMS"
+
+
+def _keyring():
+    """Return the keyring module, or None to fall back to the private file.
+
+    Imported on first use; keyring loads its backends at import time.
+    """
+    try:
+        import keyring
+    except ImportError:
+        return None
+    return keyring
+
+
+class SessionStore:
+    """Save, load and forget the signed-in user's refresh token."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else user_data_dir() / "session.json"
+
+    def load(self, base_url: str) -> Optional[dict]:
+        """Return {"username", "role", "refresh_token"} saved for base_url."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("base_url") != base_url:
+            return None
+        token = data.get("refresh_token")
+        keyring = _keyring() if token is None else None
+        if keyring is not None:
+            try:
+                token = keyring.get_password(KEYRING_SERVICE, self._account(data))
+            except Exception:  # no usable backend
+                token = None
+        if not token:
+            return None
+        return {"username": data.get("username"), "role": data.get("role"),
+                "refresh_token": token}
+
+    def save(self, base_url: str, username: str, role: str, refresh_token: str) -> None:
+        data = {"base_url": base_url, "username": username, "role": role}
+        stored = False
+        keyring = _keyring()
+        if keyring is not None:
+            try:
+                keyring.set_password(KEYRING_SERVICE, self._account(data), refresh_token)
+                stored = True
+            except Exception:  # no usable backend
+                pass
+        if not stored:
+            data["refresh_token"] = refresh_token
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Create the file owner-only before anything secret is written to it
+        tmp = self.path.with_suffix(".tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        """Forget the saved session, including any keyring entry."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+        keyring = _keyring() if data and "refresh_token" not in data else None
+        if keyring is not None:
+            try:
+                keyring.delete_password(KEYRING_SERVICE, self._account(data))
+            except Exception:  # no usable backend, or nothing stored
+                pass
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _account(data: dict) -> str:
+        return f"{data.get('username')}@{data.get('base_url')}"
@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+"""Local validation and compaction of workbooks before upload.
+
+Workbooks are parsed on the client so obviously bad files are rejected
+without a round trip, and can be rewritten as a gzip-compressed CSV with
+canonical headers, which is much smaller than .xlsx and far cheaper for
+the server to parse. The accepted header spellings come from the server
+(ApiClient.workbook_headers), so both sides map columns the same way.
+"""
+import csv
+import gzip
+import io
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+
+# Canonical column order of the compact CSV payload
+COLUMNS = ("file_no", "name", "department", "year", "lga", "status")
+
+COLUMN_LABELS = {
+    "file_no": "File No", "name": "Name", "department": "Department",
+    "year": "Year", "lga": "LGA", "status": "Status",
+}
+
+MAX_REPORTED_ERRORS = 5
+
+
+class WorkbookError(Exception):
+    """Raised when a workbook fails local validation."""
+
+
+class PreparedUpload(NamedTuple):
+    path: str                     # file to send
+    content_type: str
+    content_encoding: Optional[str]
+    rows: int
+    temporary: bool               # True if path should be deleted afterwards
+
+
+def _normalize(header) -> str:
+    return " ".join(str(header or "").replace("_", " ").replace(".", " ").lower().split())
+
+
+def map_headers(headers, aliases: Dict[str, Sequence[str]],
+                required: Sequence[str]) -> dict:
+    """Map fields to column indexes using the server's aliases.
+
+    Raises WorkbookError if a required field has no column.
+    """
+    lookup = {_normalize(alias): field
+              for field, spellings in aliases.items() for alias in spellings}
+    mapping = {}
+    for index, header in enumerate(headers):
+        field = lookup.get(_normalize(header))
+        if field and field not in mapping:
+            mapping[field] = index
+    missing = [COLUMN_LABELS.get(f, f) for f in required if f not in mapping]
+    if missing:
+        raise WorkbookError(f"Missing required columns: {', '.join(missing)}")
+    return mapping
+
+
+def _cell(row, index):
+    value = row[index] if index < len(row) else None
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # Excel stores years and numbers as floats
+    return str(value).strip()
+
+
+def prepare_workbook(file_path: str, year, compress: bool = True,
+                     headers: Optional[dict] = None) -> PreparedUpload:
+    """Validate a workbook and optionally convert it to CSV.gz.
+
+    headers is the server's column mapping (ApiClient.workbook_headers).
+    Checks that the header row has every required column, that there is at
+    least one data row, that every row has a file number and name, and that
+    the Year column matches the target year. Raises WorkbookError listing
+    the first few problems. Columns the workbook leaves out are sent empty.
+
+    If openpyxl is not installed, or headers is None (the server could not
+    supply them), the file is passed through unchecked and the server
+    validates it instead.
+    """
+    path = Path(file_path)
+    passthrough = PreparedUpload(str(path), "application/vnd.openxmlformats-"
+                                 "officedocument.spreadsheetml.sheet", None, 0, False)
+    if path.suffix.lower() == ".xls":
+        raise WorkbookError("Legacy .xls files are not supported; save as .xlsx")
+    if headers is None:
+        return passthrough
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        return passthrough
+
+    try:
+        workbook = load_workbook(path, read_only=True, data_only=True)
+    except Exception as e:
+        raise WorkbookError(f"Cannot read workbook: {e}")
+
+    out = None
+    tmp_path = None
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        try:
+            mapping = map_headers(next(rows), headers["aliases"], headers["required"])
+        except StopIteration:
+            raise WorkbookError("Workbook is empty")
+
+        if compress:
+            fd, tmp_path = tempfile.mkstemp(suffix=".csv.gz")
+            os.close(fd)
+            # mtime=0 keeps the output identical for identical input
+            out = io.TextIOWrapper(gzip.GzipFile(tmp_path, "wb", compresslevel=6, mtime=0),
+                                   encoding="utf-8", newline="")
+            writer = csv.writer(out)
+            writer.writerow(COLUMNS)
+
+        errors: List[str] = []
+        count = 0
+        for line_no, row in enumerate(rows, start=2):
+            values = [_cell(row, mapping[field]) if field in mapping else ""
+                      for field in COLUMNS]
+            if not any(values):
+                continue  # blank line
+            record = dict(zip(COLUMNS, values))
+            if not record["file_no"] or not record["name"]:
+                errors.append(f"Row {line_no}: missing file number or name")
+            elif record["year"] and record["year"] != str(year):
+                errors.append(f"Row {line_no}: year {record['year']} does not match "
+                              f"target year {year}")
+            if len(errors) >= MAX_REPORTED_ERRORS:
+                break
+            count += 1
+            if out is not None:
+                writer.writerow(values)
+
+        if errors:
+            raise WorkbookError("\n".join(errors))
+        if count == 0:
+            raise WorkbookError("Workbook has no data rows")
+    except BaseException:
+        if out is not None:
+            out.close()
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    finally:
+        workbook.close()
+
+    if out is None:
+        return passthrough._replace(rows=count)
+    out.close()
+    return PreparedUpload(tmp_path, "text/csv", "gzip", count, True)
@@ -1,11 +1,106 @@
 # client/main.py
+import os
 import sys
 import time
+from datetime import datetime
+
+_STARTED = time.perf_counter()
+
 from PySide6.QtWidgets import QApplication, QMessageBox, QSplashScreen
-from PySide6.QtCore import Qt, QTimer
+from PySide6.QtCore import Qt, QThread, Signal
 from PySide6.QtGui import QPixmap, QFont, QColor, QPainter, QBrush, QPen
 from ui.login_window import LoginWindow
-from ui.main_window import MainWindow
+from api.session import SessionStore
+
+# The main window and the HTTP client are imported in the background while
+# the login window is up (see StartupWorker)
+
+# Start-up slower than this (process start to login window) is flagged in
+# the log
+STARTUP_BUDGET_MS = float(os.environ.get("EDMS_STARTUP_BUDGET_MS", "500"))
+
+
+class StartupTimer:
+    """Record when each start-up stage finished and log the result.
+
+    Each launch appends one line to startup.log in the user data directory
+    so start-up time can be tracked across releases and machines.
+    """
+
+    def __init__(self, started: float):
+        self.started = started
+        self.marks = []
+
+    def mark(self, stage: str):
+        self.marks.append((stage, (time.perf_counter() - self.started) * 1000))
+
+    def report(self, note: str = ""):
+        total = self.marks[-1][1] if self.marks else 0.0
+        stages = ", ".join(f"{stage} {ms:.0f} ms" for stage, ms in self.marks)
+        line = f"EDMS client ready in {total:.0f} ms ({stages})"
+        if note:
+            line += f"; {note}"
+        if total > STARTUP_BUDGET_MS:
+            line += f"; over the {STARTUP_BUDGET_MS:.0f} ms budget"
+        print(line)
+        try:
+            from api.cache import user_data_dir
+            log_path = user_data_dir() / "startup.log"
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(log_path, "a", encoding="utf-8") as f:
+                f.write(f"{datetime.now().isoformat(timespec='seconds')} {line}\n")
+        except OSError:
+            pass
+
+
+class StartupWorker(QThread):
+    """Warm up the API client off the UI thread.
+
+    Emits ready(api, health, user) once the response cache is open and a
+    first connection to the server has been made (health is None when the
+    server cannot be reached). If a remembered session is still valid, user
+    is its token response and the login window can be skipped; otherwise
+    it is None. Then imports the main window so that it opens without a
+    pause after login.
+
+    ready is emitted even if the warm-up fails unexpectedly (say the cache
+    cannot be opened); api and health are then None.
+    """
+    ready = Signal(object, object, object)
+
+    def __init__(self, session_store, parent=None):
+        super().__init__(parent)
+        self.session_store = session_store
+
+    def run(self):
+        api = health = user = None
+        try:
+            api, health, user = self._warm_up()
+        except Exception as e:
+            print("Client start-up failed:", e)
+        finally:
+            self.ready.emit(api, health, user)
+        import ui.main_window  # noqa: F401
+
+    def _warm_up(self):
+        from api.cache import open_default_cache
+        from api.client import ApiClient, ApiError, OfflineError
+
+        api = ApiClient(cache=open_default_cache())
+        user = None
+        try:
+            health = api.health(timeout=(1, 2))
+        except ApiError:
+            health = None
+        saved = self.session_store.load(api.base_url) if health else None
+        if saved:
+            try:
+                user = api.resume(saved["refresh_token"])
+            except OfflineError:
+                pass
+            except ApiError:
+                self.session_store.clear()  # expired or revoked
+        return api, health, user
 
 
 class EDMSApp:
@@ -15,6 +110,7 @@ class EDMSApp:
     """
 
     def __init__(self):
+        self.timer = StartupTimer(_STARTED)
         self.app = QApplication(sys.argv)
         self.app.setStyle('Fusion')  # Modern cross-platform style
         # Keep default palette but apply only if explicitly desired
@@ -26,7 +122,18 @@ class EDMSApp:
         self.current_user = None
         self.login_window = None
         self.main_window = None
-        
+        self.api = None
+        self.server_health = None
+        self.session_store = SessionStore()
+        self._api_ready = False
+        self._resumed_user = None
+        self.timer.mark("qt")
+
+        # Warm up the API client while the splash and login window are built
+        self.startup_worker = StartupWorker(self.session_store)
+        self.startup_worker.ready.connect(self._on_startup_ready)
+        self.startup_worker.start()
+
         # Show splash screen
         self.show_splash_screen()
 
@@ -77,40 +184,88 @@ class EDMSApp:
         self.splash.setMask(splash_pix.mask())
         self.splash.show()
         self.app.processEvents()
+        self.timer.mark("splash")
 
-        # Shorter, non-blocking splash
-        QTimer.singleShot(900, self.initialize_app)
+        self.initialize_app()
 
     def initialize_app(self):
-        """Initialize application components after splash screen"""
+        """Build the login window while the API client warms up.
+
+        The splash closes as soon as both are done.
+        """
         self.splash.showMessage(
             "Electronic Document Management System\n\nLoading components...\n\n Powered by Rashnotech Solutions",
             Qt.AlignCenter | Qt.AlignBottom,
             QColor(255, 255, 255)
         )
         self.app.processEvents()
-        
+
         # Initialize login window
-        self.login_window = LoginWindow()
+        self.login_window = LoginWindow(api_client=self.api)
         self.login_window.login_success.connect(self.launch_main_window)
-        
-        # Close splash and show login
-        QTimer.singleShot(1000, self.show_login)
+        self.timer.mark("login window")
+        if self._api_ready:
+            self._finish_startup()
+
+    def _on_startup_ready(self, api, health, user):
+        if api is None:
+            # Warm-up failed; log in without the response cache
+            from api.client import ApiClient
+            api = ApiClient()
+        self.api = api
+        self.server_health = health
+        self._resumed_user = user
+        self._api_ready = True
+        self.timer.mark("api")
+        if self.login_window is not None:
+            self.login_window.api = api
+            self._finish_startup()
+
+    def _finish_startup(self):
+        """Go straight to the dashboard for a remembered session, else log in."""
+        if self._resumed_user is None:
+            self.show_login()
+            return
+        self.launch_main_window({**self._resumed_user, "remember": True})
+        self.splash.finish(self.main_window)
+        self.timer.mark("session resumed")
+        self.timer.report()
 
     def show_login(self):
         """Show login window and close splash"""
-        self.splash.finish(self.login_window)
+        # finish() waits until the window is on screen, so show it first
         self.login_window.show()
+        self.splash.finish(self.login_window)
+        self.timer.mark("login shown")
+        self.timer.report("" if self.server_health else "server unreachable")
 
     def launch_main_window(self, user_data: dict):
         """Open the main dashboard after successful login."""
+        from ui.main_window import MainWindow
+
         self.current_user = user_data
         self.login_window.close()
 
-        self.main_window = MainWindow(user=self.current_user)
+        if self.api is not None:
+            self.api.set_token(user_data.get("access_token"))
+            if user_data.get("remember"):
+                # Refresh tokens rotate, so keep the stored one current
+                self.api.on_tokens = self._remember_session
+                self._remember_session(user_data)
+            else:
+                self.api.on_tokens = None
+                self.session_store.clear()
+        self.main_window = MainWindow(user=self.current_user, api_client=self.api)
         self.main_window.logout_signal.connect(self.handle_logout)
         self.main_window.show()
 
+    def _remember_session(self, tokens: dict):
+        try:
+            self.session_store.save(self.api.base_url, tokens["username"],
+                                    tokens.get("role", "staff"), tokens["refresh_token"])
+        except OSError as e:
+            print("Could not save the session:", e)
+
     def handle_logout(self):
         """Handle logout and return to login screen"""
         if self.main_window:
@@ -118,7 +273,11 @@ class EDMSApp:
             self.main_window = None
         
         self.current_user = None
-        self.login_window = LoginWindow()
+        if self.api is not None:
+            self.api.on_tokens = None
+            self.api.logout()
+        self.session_store.clear()
+        self.login_window = LoginWindow(api_client=self.api)
         self.login_window.login_success.connect(self.launch_main_window)
         self.login_window.show()
 
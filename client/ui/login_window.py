@@ -2,18 +2,50 @@
 """Enhanced login window with modern design (desktop-friendly)"""
 
 from PySide6.QtWidgets import (
-    QWidget, QLabel, QLineEdit, QPushButton,
+    QWidget, QLabel, QLineEdit, QPushButton, QCheckBox,
     QVBoxLayout, QHBoxLayout, QMessageBox, QFrame, QSizePolicy
 )
-from PySide6.QtCore import Qt, Signal, QPropertyAnimation, QEasingCurve, QPoint
+from PySide6.QtCore import Qt, Signal, QThread, QPropertyAnimation, QEasingCurve, QPoint
 from PySide6.QtGui import QFont
 
 
+class LoginWorker(QThread):
+    """Sign in against the server off the UI thread.
+
+    The server checks the password with bcrypt, which takes a noticeable
+    fraction of a second; running it here keeps the window responsive.
+    """
+    succeeded = Signal(dict)
+    failed = Signal(str)
+
+    def __init__(self, api, username, password, parent=None):
+        super().__init__(parent)
+        self.api = api
+        self.username = username
+        self.password = password
+
+    def run(self):
+        from api.client import ApiError, OfflineError
+        try:
+            tokens = self.api.login(self.username, self.password)
+        except OfflineError:
+            self.failed.emit("Cannot reach the server. Check your connection.")
+        except ApiError as e:
+            if e.status_code == 400:
+                self.failed.emit("Invalid username or password.")
+            else:
+                self.failed.emit(str(e))
+        else:
+            self.succeeded.emit(tokens)
+
+
 class LoginWindow(QWidget):
     login_success = Signal(dict)
 
-    def __init__(self):
+    def __init__(self, api_client=None):
         super().__init__()
+        self.api = api_client
+        self._login_worker = None
         self.setWindowTitle("EDMS Login")
         # Desktop-friendly minimum size
         self.setMinimumSize(520, 560)
@@ -99,6 +131,10 @@ class LoginWindow(QWidget):
         form_layout.addWidget(password_label)
         form_layout.addWidget(self.password_input)
 
+        self.remember_check = QCheckBox("Keep me signed in on this computer")
+        self.remember_check.setChecked(True)
+        form_layout.addWidget(self.remember_check)
+
         form_layout.addSpacing(12)
 
         # Buttons
@@ -142,7 +178,7 @@ class LoginWindow(QWidget):
         main_layout.addLayout(center_layout)
 
         # Info text at bottom
-        info_label = QLabel("Default credentials:\nAdmin: admin/1234 | Staff: staff/1234")
+        info_label = QLabel("Accounts are managed by your EDMS administrator")
         info_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         info_label.setObjectName("infoLabel")
         main_layout.addWidget(info_label)
@@ -267,21 +303,40 @@ class LoginWindow(QWidget):
             self.show_error("Please enter both username and password.")
             return
 
-        # Simulated credentials
-        if username == "admin" and password == "1234":
-            user_data = {"username": username, "role": "admin"}
-            self.status_label.setText("Login successful")
-            self.status_label.setStyleSheet("color: #28a745; font-weight: 600;")
-            self.login_success.emit(user_data)
-
-        elif username == "staff" and password == "1234":
-            user_data = {"username": username, "role": "staff"}
-            self.status_label.setText("Login successful")
-            self.status_label.setStyleSheet("color: #28a745; font-weight: 600;")
-            self.login_success.emit(user_data)
-
-        else:
-            self.show_error("Invalid username or password.")
+        if self.api is None:
+            self.show_error("Still connecting to the server, please try again.")
+            return
+        if self._login_worker is not None:
+            return  # a sign-in is already in progress
+
+        self.login_btn.setEnabled(False)
+        self.status_label.setText("Signing in...")
+        self.status_label.setStyleSheet("color: #666; font-weight: 600;")
+        self._login_worker = LoginWorker(self.api, username, password, parent=self)
+        self._login_worker.succeeded.connect(self._on_login_succeeded)
+        self._login_worker.failed.connect(self._on_login_failed)
+        self._login_worker.finished.connect(self._on_login_finished)
+        self._login_worker.start()
+
+    def _on_login_succeeded(self, tokens):
+        user_data = {
+            "username": tokens.get("username"),
+            "role": tokens.get("role", "staff"),
+            "access_token": tokens.get("access_token"),
+            "refresh_token": tokens.get("refresh_token"),
+            "remember": self.remember_check.isChecked(),
+        }
+        self.password_input.clear()
+        self.status_label.setText("Login successful")
+        self.status_label.setStyleSheet("color: #28a745; font-weight: 600;")
+        self.login_success.emit(user_data)
+
+    def _on_login_failed(self, message):
+        self.show_error(message)
+
+    def _on_login_finished(self):
+        self._login_worker = None
+        self.login_btn.setEnabled(True)
 
     def show_error(self, message):
         """Display error message with animation"""
@@ -7,27 +7,167 @@ from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QPushButton, QLineEdit, QTableWidget, QTableWidgetItem,
     QComboBox, QFileDialog, QMessageBox, QStatusBar,
-    QSplitter, QFrame, QHeaderView, QSizePolicy
+    QSplitter, QFrame, QHeaderView, QSizePolicy, QProgressBar
 )
-from PySide6.QtCore import Qt, Signal
-from PySide6.QtGui import QAction, QFont
-from ui.uploader import UploadDialog
-from ui.user_admin import UserAdminWindow
+from PySide6.QtCore import Qt, Signal, QThread, QTimer
+from PySide6.QtGui import QAction, QFont, QColor
+# Dialogs (ui.uploader, ui.user_admin, ui.record_details) are imported when
+# first opened so the main window appears sooner
+from api.cache import open_default_cache
+from api.client import ApiClient, ApiError, OfflineError, FRESH, OFFLINE, UNCHANGED
+
+# Pause before reopening an event stream the server closed without sending
+# any events, so a connection that keeps being cut does not spin
+CLEAN_CLOSE_DELAY_MS = 1000
+
+
+class FetchWorker(QThread):
+    """Background worker that revalidates an API request.
+
+    ``seq`` is echoed back so the window can ignore answers to searches the
+    user has already replaced with a newer one.
+    """
+    fetched = Signal(int, object, str)
+    failed = Signal(int, str, bool)
+
+    def __init__(self, seq, fetch, parent=None):
+        super().__init__(parent)
+        self.seq = seq
+        self.fetch = fetch
+
+    def run(self):
+        try:
+            data, outcome = self.fetch()
+            self.fetched.emit(self.seq, data, outcome)
+        except OfflineError as e:
+            self.failed.emit(self.seq, str(e), True)
+        except ApiError as e:
+            self.failed.emit(self.seq, str(e), False)
+        except Exception as e:
+            self.failed.emit(self.seq, str(e), False)
+
+
+class DownloadWorker(QThread):
+    """Background worker that downloads a record's document with resume."""
+    progress = Signal(object, object)
+    done = Signal(str)
+    failed = Signal(str)
+
+    def __init__(self, api, record, dest_path, parent=None):
+        super().__init__(parent)
+        self.api = api
+        self.record = record
+        self.dest_path = dest_path
+
+    def run(self):
+        try:
+            completed = self.api.download_document(
+                self.record["id"], self.dest_path,
+                sha256=self.record.get("document_sha256"),
+                progress=self.progress.emit,
+                should_stop=self.isInterruptionRequested,
+            )
+            if completed:
+                self.done.emit(self.dest_path)
+        except ApiError as e:
+            self.failed.emit(str(e))
+        except Exception as e:
+            self.failed.emit(str(e))
+
+
+class EventStreamWorker(QThread):
+    """Background listener for the server's change feed.
+
+    Reconnects with exponential backoff and resumes from the last event id
+    so nothing published while reconnecting is lost.
+    """
+    event_received = Signal(str, object)
+    live = Signal(bool)
+
+    TYPES = "records,uploads"
+
+    def __init__(self, api, parent=None):
+        super().__init__(parent)
+        self.api = api
+        self._response = None
+        self._last_event_id = None
+
+    def _opened(self, response):
+        self._response = response
+        self.live.emit(True)
+
+    def stop(self):
+        """Interrupt the worker and close the open stream to unblock it."""
+        self.requestInterruption()
+        response = self._response
+        if response is not None:
+            response.close()
+
+    def run(self):
+        delay = 1
+        while not self.isInterruptionRequested():
+            delivered = 0
+            try:
+                for event in self.api.stream_events(self.TYPES, last_event_id=self._last_event_id,
+                                                    on_response=self._opened):
+                    delay = 1
+                    delivered += 1
+                    if event["id"]:
+                        self._last_event_id = event["id"]
+                    self.event_received.emit(event["type"], event["data"])
+                # The server ends streams periodically; resume right away
+                # if this one delivered anything, else after a short pause
+                if delivered:
+                    continue
+                if not self._pause(CLEAN_CLOSE_DELAY_MS):
+                    return
+                continue
+            except Exception:
+                pass  # reconnect below
+            finally:
+                self._response = None
+            if self.isInterruptionRequested():
+                break
+            self.live.emit(False)
+            if not self._pause(delay * 1000):
+                return
+            delay = min(delay * 2, 30)
+
+    def _pause(self, ms):
+        """Sleep in small steps so stop() is honoured promptly.
+
+        Returns False if the worker was interrupted meanwhile.
+        """
+        for _ in range(max(ms // 100, 1)):
+            if self.isInterruptionRequested():
+                return False
+            self.msleep(100)
+        return not self.isInterruptionRequested()
 
 
 class MainWindow(QMainWindow):
     logout_signal = Signal()
 
-    def __init__(self, user=None):
+    def __init__(self, user=None, api_client=None):
         super().__init__()
 
         # Handle user data
         if isinstance(user, dict):
             self.role = user.get('role', 'staff')
             self.username = user.get('username', 'Guest')
+            token = user.get('access_token')
         else:
             self.role = 'staff'
             self.username = 'Guest'
+            token = None
+
+        self.api = api_client or ApiClient(token=token, cache=open_default_cache())
+        self._online = True
+        self._live = False
+        self._searched = False
+        self._search_seq = 0
+        self._workers = set()
+        self._download_worker = None
 
         self.setWindowTitle("EDMS - Electronic Document Management System")
         self.resize(1200, 700)
@@ -36,6 +176,20 @@ class MainWindow(QMainWindow):
         self._create_status_bar()
         self._init_ui()
         self.apply_styles()
+        self._facet_seq = 0
+        self._known_years = []
+        self.refresh_facets()
+        self.refresh_stats()
+
+        # Coalesce bursts of change events into one background refresh
+        self._change_timer = QTimer(self)
+        self._change_timer.setSingleShot(True)
+        self._change_timer.setInterval(750)
+        self._change_timer.timeout.connect(self._refresh_after_change)
+        self._event_worker = EventStreamWorker(self.api, parent=self)
+        self._event_worker.event_received.connect(self._on_server_event)
+        self._event_worker.live.connect(self._set_live)
+        self._event_worker.start()
 
     def _create_menu_bar(self):
         """Create a clean, professional menu bar."""
@@ -44,10 +198,10 @@ class MainWindow(QMainWindow):
         # File Menu
         file_menu = menubar.addMenu("File")
 
-        upload_action = QAction("Upload Workbook", self)
-        upload_action.setShortcut("Ctrl+U")
-        upload_action.triggered.connect(self.open_upload_dialog)
-        file_menu.addAction(upload_action)
+        self.upload_action = QAction("Upload Workbook", self)
+        self.upload_action.setShortcut("Ctrl+U")
+        self.upload_action.triggered.connect(self.open_upload_dialog)
+        file_menu.addAction(self.upload_action)
 
         file_menu.addSeparator()
 
@@ -99,6 +253,12 @@ class MainWindow(QMainWindow):
         user_label = QLabel(f"{self.username} ({self.role.title()})")
         status.addPermanentWidget(user_label)
 
+        self.transfer_bar = QProgressBar()
+        self.transfer_bar.setMaximumWidth(200)
+        self.transfer_bar.setTextVisible(True)
+        self.transfer_bar.hide()
+        status.addPermanentWidget(self.transfer_bar)
+
         self.conn_label = QLabel("Connected")
         status.addPermanentWidget(self.conn_label)
 
@@ -149,17 +309,17 @@ class MainWindow(QMainWindow):
 
         layout.addStretch()
 
-        upload_btn = QPushButton("Upload")
-        upload_btn.setObjectName("quickActionBtn")
-        upload_btn.setCursor(Qt.PointingHandCursor)
-        upload_btn.clicked.connect(self.open_upload_dialog)
+        self.upload_btn = QPushButton("Upload")
+        self.upload_btn.setObjectName("quickActionBtn")
+        self.upload_btn.setCursor(Qt.PointingHandCursor)
+        self.upload_btn.clicked.connect(self.open_upload_dialog)
 
         export_btn = QPushButton("Export")
         export_btn.setObjectName("quickActionBtn")
         export_btn.setCursor(Qt.PointingHandCursor)
         export_btn.clicked.connect(self.export_results)
 
-        layout.addWidget(upload_btn)
+        layout.addWidget(self.upload_btn)
         layout.addWidget(export_btn)
 
         header.setLayout(layout)
@@ -179,20 +339,25 @@ class MainWindow(QMainWindow):
         title.setObjectName("panelTitle")
         layout.addWidget(title)
 
-        layout.addWidget(self._create_filter_section("Year",
-            ["All Years", "2023", "2024", "2025", "2026"]))
+        # Combo contents come from the server's facet counts; only the
+        # "All" entries are known up front.
+        layout.addWidget(self._create_filter_section("Year", ["All Years"]))
         self.year_combo = layout.itemAt(layout.count()-1).widget().findChild(QComboBox)
 
-        layout.addWidget(self._create_filter_section("Department",
-            ["All Departments", "Admin", "Account", "Audit", "Agriculture",
-             "Education", "Environmental", "Health", "Works"]))
+        layout.addWidget(self._create_filter_section("Department", ["All Departments"]))
         self.dept_combo = layout.itemAt(layout.count()-1).widget().findChild(QComboBox)
 
-        layout.addWidget(self._create_filter_section("Local Government",
-            ["All LGAs", "Ajingi", "Albasu", "Bagwai", "Bebeji", "Bichi",
-             "Bunkure", "Dala", "Dambatta", "Dawakin Kudu", "Dawakin Tofa"]))
+        layout.addWidget(self._create_filter_section("Local Government", ["All LGAs"]))
         self.lga_combo = layout.itemAt(layout.count()-1).widget().findChild(QComboBox)
 
+        self._facet_combos = {
+            "year": self.year_combo,
+            "department": self.dept_combo,
+            "lga": self.lga_combo,
+        }
+        for combo in self._facet_combos.values():
+            combo.currentIndexChanged.connect(self.refresh_facets)
+
         search_label = QLabel("Keyword Search")
         search_label.setObjectName("filterLabel")
         layout.addWidget(search_label)
@@ -255,9 +420,9 @@ class MainWindow(QMainWindow):
         title.setObjectName("statsTitle")
         layout.addWidget(title)
 
-        stats_text = QLabel("Total Records: 1,234\nThis Year: 567\nPending: 45")
-        stats_text.setObjectName("statsText")
-        layout.addWidget(stats_text)
+        self.stats_text = QLabel("Total Records: -\nThis Year: -\nPending: -")
+        self.stats_text.setObjectName("statsText")
+        layout.addWidget(self.stats_text)
 
         card.setLayout(layout)
         return card
@@ -313,8 +478,14 @@ class MainWindow(QMainWindow):
         download_btn.setCursor(Qt.PointingHandCursor)
         download_btn.clicked.connect(self.download_record)
 
+        self.attach_btn = QPushButton("Attach Document")
+        self.attach_btn.setObjectName("actionButton")
+        self.attach_btn.setCursor(Qt.PointingHandCursor)
+        self.attach_btn.clicked.connect(self.attach_document)
+
         action_layout.addWidget(view_btn)
         action_layout.addWidget(download_btn)
+        action_layout.addWidget(self.attach_btn)
 
         layout.addLayout(action_layout)
 
@@ -497,52 +668,245 @@ class MainWindow(QMainWindow):
         """)
 
     # Action handlers
-    def perform_search(self):
-        """Simulate a record search and populate table."""
-        self.statusBar().showMessage("Searching records...")
+    def _current_filters(self):
+        """Translate the filter widgets into API query parameters."""
+        return {
+            "year": self.year_combo.currentData(),
+            "department": self.dept_combo.currentData(),
+            "lga": self.lga_combo.currentData(),
+            "q": self.search_input.text().strip() or None,
+        }
+
+    def _start_worker(self, seq, fetch, on_fetched, on_failed):
+        """Run fetch on a FetchWorker and keep it alive until it finishes."""
+        worker = FetchWorker(seq, fetch, parent=self)
+        worker.fetched.connect(on_fetched)
+        worker.failed.connect(on_failed)
+        worker.finished.connect(self._worker_done)
+        self._workers.add(worker)
+        worker.start()
+
+    def _worker_done(self):
+        worker = self.sender()
+        self._workers.discard(worker)
+        if worker is not None:
+            worker.deleteLater()
+
+    def _set_online(self, online):
+        """Reflect server reachability; uploads are disabled while offline."""
+        self._online = online
+        if online and self._live:
+            self.conn_label.setText("● Live")
+            self.conn_label.setStyleSheet("color: #28a745; font-weight: 600;")
+        elif online:
+            self.conn_label.setText("Connected")
+            self.conn_label.setStyleSheet("")
+        else:
+            self.conn_label.setText("Offline (read-only)")
+            self.conn_label.setStyleSheet("color: #dc3545; font-weight: 600;")
+        self.upload_action.setEnabled(online)
+        self.upload_btn.setEnabled(online)
+        self.attach_btn.setEnabled(online)
+
+    def _set_live(self, live):
+        """Track whether the change feed is connected."""
+        self._live = live
+        self._set_online(live or self._online)
+
+    def _on_server_event(self, event_type, data):
+        """Apply a change event from the server without a full reload."""
+        if event_type == "records.changed":
+            if data.get("stats"):
+                self._show_stats(data["stats"])
+            year = self.year_combo.currentData()
+            if not year or data.get("year") == year:
+                self._change_timer.start()
+            upload = data.get("upload")
+            if upload:
+                self.statusBar().showMessage(
+                    f"{upload.get('filename') or 'Workbook'} imported into {data.get('year')}: "
+                    f"{upload.get('inserted', 0)} added, {upload.get('updated', 0)} updated, "
+                    f"{upload.get('deleted', 0)} removed", 5000)
+            else:
+                self.statusBar().showMessage(
+                    f"Records for {data.get('year')} {data.get('action', 'changed')}", 5000)
+        elif event_type == "records.updated":
+            self._update_record_row(data.get("record") or {})
+        elif event_type == "uploads.progress":
+            self.statusBar().showMessage(
+                f"Importing {data.get('filename') or 'workbook'}: "
+                f"{data.get('applied', 0):,}/{data.get('total', 0):,} rows", 3000)
+        elif event_type == "resync":
+            self.refresh_stats()
+            self._change_timer.start()
+
+    def _refresh_after_change(self):
+        """Revalidate the visible results and filter counts after a change."""
+        self.refresh_facets()
+        if self._searched:
+            self.perform_search()
+        else:
+            self.refresh_stats()
+
+    def _update_record_row(self, record):
+        """Replace one row in place if the updated record is on screen."""
+        for row in range(self.table.rowCount()):
+            item = self.table.item(row, 0)
+            current = item.data(Qt.UserRole) if item is not None else None
+            if current and current.get("id") == record.get("id"):
+                self._fill_row(row, {**current, **record})
+                return
+
+    def _fill_row(self, row, rec):
+        values = [rec.get("file_no"), rec.get("name"), rec.get("department"),
+                  rec.get("year"), rec.get("lga"), rec.get("status")]
+        for col, value in enumerate(values):
+            item = QTableWidgetItem("" if value is None else str(value))
+            if col == 0:
+                item.setData(Qt.UserRole, rec)
+            if col == 5:  # Status column
+                if value == "Active":
+                    item.setForeground(Qt.darkGreen)
+                elif value == "Pending":
+                    item.setForeground(Qt.darkYellow)
+                else:
+                    item.setForeground(Qt.gray)
+            self.table.setItem(row, col, item)
+
+    def _populate_table(self, records):
+        """Fill the results table from a list of record dicts."""
+        self.table.setUpdatesEnabled(False)
         self.table.setRowCount(0)
+        self.table.setRowCount(len(records))
+        for row, rec in enumerate(records):
+            self._fill_row(row, rec)
+        self.table.setUpdatesEnabled(True)
+        self.result_count.setText(f"{len(records)} records")
+
+    def perform_search(self):
+        """Show cached results at once, then revalidate them in the background."""
+        filters = self._current_filters()
+        self._search_seq += 1
+        self._searched = True
+
+        cached = self.api.cached("/records", filters)
+        if cached is not None:
+            self._populate_table(cached)
+            self.statusBar().showMessage("Showing cached results, refreshing...")
+        else:
+            self.table.setRowCount(0)
+            self.statusBar().showMessage("Searching records...")
+
+        self._start_worker(self._search_seq,
+                           lambda: self.api.search_records(**filters),
+                           self._search_fetched, self._search_failed)
+        self.refresh_stats()
+
+    def _search_fetched(self, seq, records, outcome):
+        if seq != self._search_seq:
+            return  # superseded by a newer search
+        self._set_online(outcome != OFFLINE)
+        if outcome != UNCHANGED:
+            self._populate_table(records)
+        if outcome == OFFLINE:
+            self.statusBar().showMessage(
+                f"Server unreachable - showing {len(records)} cached records")
+        else:
+            self.statusBar().showMessage(f"Found {len(records)} records", 3000)
+
+    def _search_failed(self, seq, message, offline):
+        if seq != self._search_seq:
+            return
+        if offline:
+            self._set_online(False)
+            self.statusBar().showMessage("Server unreachable - no cached results for this search")
+        else:
+            self.statusBar().showMessage(f"Search failed: {message}", 5000)
+
+    def refresh_stats(self):
+        """Update the Quick Stats card from cache, then from the server."""
+        cached = self.api.cached("/records/stats")
+        if cached is not None:
+            self._show_stats(cached)
+        self._start_worker(0, self.api.record_stats,
+                           self._stats_fetched, self._stats_failed)
+
+    def _show_stats(self, stats):
+        self.stats_text.setText(
+            f"Total Records: {stats.get('total', 0):,}\n"
+            f"This Year: {stats.get('this_year', 0):,}\n"
+            f"Pending: {stats.get('pending', 0):,}"
+        )
 
-        fake_data = [
-            ["WRK-001", "John Doe", "Works", "2025", "Dala", "Active"],
-            ["ACC-002", "Jane Smith", "Account", "2025", "Albasu", "Pending"],
-            ["EDU-003", "Abdul Rasheed", "Education", "2024", "Bichi", "Active"],
-            ["HLT-004", "Fatima Abubakar", "Health", "2025", "Dambatta", "Active"],
-            ["AGR-005", "Muhammad Ali", "Agriculture", "2024", "Bebeji", "Archived"],
-            ["AUD-006", "Aisha Bello", "Audit", "2025", "Ajingi", "Pending"],
-            ["ENV-007", "Ibrahim Hassan", "Environmental", "2024", "Bagwai", "Active"],
-            ["ADM-008", "Zainab Usman", "Admin", "2025", "Bunkure", "Active"],
-        ]
-
-        for row_data in fake_data:
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            for col, value in enumerate(row_data):
-                item = QTableWidgetItem(value)
-                if col == 5:  # Status column
-                    if value == "Active":
-                        item.setForeground(Qt.darkGreen)
-                    elif value == "Pending":
-                        item.setForeground(Qt.darkYellow)
-                    else:
-                        item.setForeground(Qt.gray)
-                self.table.setItem(row, col, item)
-
-        self.result_count.setText(f"{len(fake_data)} records")
-        self.statusBar().showMessage(f"Found {len(fake_data)} records", 3000)
+    def _stats_fetched(self, seq, stats, outcome):
+        self._set_online(outcome != OFFLINE)
+        if outcome != UNCHANGED:
+            self._show_stats(stats)
+
+    def _stats_failed(self, seq, message, offline):
+        if offline:
+            self._set_online(False)
+
+    def refresh_facets(self):
+        """Refill the filter combos from cached, then live, facet counts."""
+        params = {k: v for k, v in self._current_filters().items() if k != "q"}
+        self._facet_seq += 1
+        cached = self.api.cached("/records/facets", params)
+        if cached is not None:
+            self._apply_facets(cached)
+        self._start_worker(self._facet_seq,
+                           lambda: self.api.record_facets(**params),
+                           self._facets_fetched, self._facets_failed)
+
+    def _apply_facets(self, facets):
+        """Rebuild each combo as "value (count)", keeping the selection."""
+        self._known_years = [f["value"] for f in facets.get("year", [])]
+        for name, combo in self._facet_combos.items():
+            current = combo.currentData()
+            all_label = combo.itemText(0)
+            combo.blockSignals(True)
+            combo.clear()
+            combo.addItem(all_label, None)
+            for facet in facets.get(name, []):
+                combo.addItem(f"{facet['value']} ({facet['count']:,})", facet["value"])
+                if facet["count"] == 0:
+                    combo.setItemData(combo.count() - 1, QColor("#aaaaaa"),
+                                      Qt.ForegroundRole)
+            index = combo.findData(current) if current is not None else 0
+            combo.setCurrentIndex(max(index, 0))
+            combo.blockSignals(False)
+
+    def _facets_fetched(self, seq, facets, outcome):
+        if seq != self._facet_seq:
+            return
+        if outcome != UNCHANGED:
+            self._apply_facets(facets)
+
+    def _facets_failed(self, seq, message, offline):
+        if offline:
+            self._set_online(False)
 
     def clear_filters(self):
         """Clear all filters"""
-        self.year_combo.setCurrentIndex(0)
-        self.dept_combo.setCurrentIndex(0)
-        self.lga_combo.setCurrentIndex(0)
+        for combo in self._facet_combos.values():
+            combo.blockSignals(True)
+            combo.setCurrentIndex(0)
+            combo.blockSignals(False)
+        self.refresh_facets()
         self.search_input.clear()
         self.table.setRowCount(0)
+        self._searched = False
         self.result_count.setText("0 records")
         self.statusBar().showMessage("Filters cleared", 2000)
 
     def open_upload_dialog(self):
         """Open file upload dialog."""
-        dialog = UploadDialog(parent=self)
+        if not self._online:
+            QMessageBox.warning(self, "Offline",
+                                "Uploads are unavailable while the server is unreachable.")
+            return
+        from ui.uploader import UploadDialog
+        dialog = UploadDialog(parent=self, years=self._known_years, api_client=self.api)
         if dialog.exec():
             self.statusBar().showMessage("Upload completed successfully", 3000)
             self.perform_search()
@@ -562,29 +926,106 @@ class MainWindow(QMainWindow):
 
     def view_record(self):
         """View details of selected record"""
-        row = self.table.currentRow()
-        if row < 0:
+        record = self._selected_record()
+        if record is None:
             QMessageBox.warning(self, "No Selection", "Please select a record to view.")
             return
 
-        file_no = self.table.item(row, 0).text()
-        name = self.table.item(row, 1).text()
+        from ui.record_details import RecordDetailsDialog
+        dialog = RecordDetailsDialog(record, self.api, parent=self)
+        dialog.exec()
 
-        QMessageBox.information(
-            self, "Record Details",
-            f"File Number: {file_no}\nName: {name}\n\n[Full details would appear here]"
+    def download_record(self):
+        """Download the selected record's document in the background.
+
+        Interrupted downloads leave a .part file next to the target; choosing
+        the same target again resumes from where it stopped.
+        """
+        record = self._selected_record()
+        if record is None:
+            QMessageBox.warning(self, "No Selection", "Please select a record to download.")
+            return
+        if not record.get("document_sha256"):
+            QMessageBox.information(self, "Download",
+                                    f"No document is attached to {record['file_no']}.")
+            return
+        if self._download_worker is not None:
+            QMessageBox.information(self, "Download", "A download is already in progress.")
+            return
+
+        dest_path, _ = QFileDialog.getSaveFileName(
+            self, "Save Document", record.get("document_name") or record["file_no"]
         )
+        if not dest_path:
+            return
 
-    def download_record(self):
-        """Download selected record"""
+        worker = DownloadWorker(self.api, record, dest_path, parent=self)
+        worker.progress.connect(self._download_progress)
+        worker.done.connect(self._download_done)
+        worker.failed.connect(self._download_failed)
+        worker.finished.connect(self._download_finished)
+        self._download_worker = worker
+        self._download_label = record["file_no"]
+        self.transfer_bar.setValue(0)
+        self.transfer_bar.show()
+        self.statusBar().showMessage(f"Downloading {record['file_no']}...")
+        worker.start()
+
+    def _download_progress(self, received, total):
+        percent = int(received * 100 / total) if total else 0
+        self.transfer_bar.setValue(percent)
+        self.statusBar().showMessage(
+            f"Downloading {self._download_label}: "
+            f"{received / 1048576:.1f} of {total / 1048576:.1f} MB")
+
+    def _download_done(self, dest_path):
+        self.statusBar().showMessage(f"Downloaded {self._download_label} to {dest_path}", 5000)
+
+    def _download_failed(self, message):
+        self.statusBar().showMessage(
+            f"Download of {self._download_label} failed: {message} "
+            "(download again to resume)", 8000)
+
+    def _download_finished(self):
+        self.transfer_bar.hide()
+        self._download_worker.deleteLater()
+        self._download_worker = None
+
+    def _selected_record(self):
+        """Return the record dict behind the selected row, or None."""
         row = self.table.currentRow()
         if row < 0:
-            QMessageBox.warning(self, "No Selection", "Please select a record to download.")
+            return None
+        return self.table.item(row, 0).data(Qt.UserRole)
+
+    def attach_document(self):
+        """Upload a scanned document for the selected record."""
+        record = self._selected_record()
+        if record is None:
+            QMessageBox.warning(self, "No Selection", "Please select a record first.")
             return
 
-        file_no = self.table.item(row, 0).text()
-        QMessageBox.information(self, "Download", f"Downloading file: {file_no}")
-        self.statusBar().showMessage(f"Downloaded {file_no}", 3000)
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Attach Document", "",
+            "Documents (*.pdf *.png *.jpg *.jpeg *.tif *.tiff);;All Files (*)"
+        )
+        if not file_path:
+            return
+
+        self.statusBar().showMessage(f"Uploading document for {record['file_no']}...")
+        self._start_worker(0,
+                           lambda: (self.api.upload_document(record["id"], file_path), FRESH),
+                           self._document_attached, self._document_attach_failed)
+
+    def _document_attached(self, seq, result, outcome):
+        note = " (already stored, linked existing copy)" if result.get("deduplicated") else ""
+        self.statusBar().showMessage(f"Document attached{note}", 5000)
+        self.perform_search()
+
+    def _document_attach_failed(self, seq, message, offline):
+        if offline:
+            self._set_online(False)
+        QMessageBox.critical(self, "Attach Failed", message)
 
     def open_user_admin(self):
         """Open user admin window (only for admins)."""
@@ -595,6 +1036,7 @@ class MainWindow(QMainWindow):
             )
             return
 
+        from ui.user_admin import UserAdminWindow
         self.user_admin = UserAdminWindow()
         self.user_admin.show()
 
@@ -623,6 +1065,18 @@ class MainWindow(QMainWindow):
             "<p>© 2025 Rashnotech Solutions</p>"
         )
 
+    def closeEvent(self, event):
+        """Let background requests finish before the window is destroyed."""
+        self._event_worker.stop()
+        self._event_worker.wait(2000)
+        if self._download_worker is not None:
+            # The partial file is kept, so the download resumes next time
+            self._download_worker.requestInterruption()
+            self._download_worker.wait(5000)
+        for worker in list(self._workers):
+            worker.wait(2000)
+        super().closeEvent(event)
+
     def logout(self):
         """Return to login screen."""
         reply = QMessageBox.question(
@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+"""Record details dialog with a document thumbnail preview"""
+import time
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QFormLayout, QFrame
+)
+from PySide6.QtCore import Qt, QThread, Signal
+from PySide6.QtGui import QPixmap
+from api.client import ApiError
+
+
+class PreviewWorker(QThread):
+    """Fetch a thumbnail, polling briefly while the server renders it.
+
+    Only a 202 (still rendering) is retried, after its Retry-After; a 404
+    means there is no preview and ends the attempt at once.
+    """
+    loaded = Signal(bytes)
+    unavailable = Signal(str)
+
+    def __init__(self, api, record, attempts=5, parent=None):
+        super().__init__(parent)
+        self.api = api
+        self.record = record
+        self.attempts = attempts
+
+    def run(self):
+        try:
+            for _ in range(self.attempts):
+                data, retry_after = self.api.record_preview(self.record["id"],
+                                                            self.record["document_sha256"])
+                if data:
+                    self.loaded.emit(data)
+                    return
+                if self.isInterruptionRequested():
+                    return
+                time.sleep(retry_after)
+            self.unavailable.emit("No preview available")
+        except ApiError as e:
+            if e.status_code == 404:
+                self.unavailable.emit("No preview available")
+            else:
+                self.unavailable.emit(str(e))
+        except Exception as e:
+            self.unavailable.emit(str(e))
+
+
+class RecordDetailsDialog(QDialog):
+    """Show a record's fields at once and its thumbnail when it arrives."""
+
+    def __init__(self, record, api, parent=None):
+        super().__init__(parent)
+        self.record = record
+        self.api = api
+        self.preview_worker = None
+        self.setWindowTitle(f"Record Details - {record.get('file_no', '')}")
+        self.setMinimumSize(720, 520)
+
+        self._init_ui()
+        self.apply_styles()
+        self._load_preview()
+
+    def _init_ui(self):
+        layout = QHBoxLayout()
+        layout.setContentsMargins(20, 20, 20, 20)
+        layout.setSpacing(20)
+
+        self.preview_label = QLabel("Loading preview...")
+        self.preview_label.setObjectName("previewLabel")
+        self.preview_label.setAlignment(Qt.AlignCenter)
+        self.preview_label.setMinimumSize(360, 480)
+        layout.addWidget(self.preview_label)
+
+        info = QFrame()
+        info.setObjectName("infoFrame")
+        info_layout = QVBoxLayout()
+
+        form = QFormLayout()
+        fields = [
+            ("File Number", "file_no"), ("Name", "name"),
+            ("Department", "department"), ("Year", "year"),
+            ("LGA", "lga"), ("Status", "status"),
+            ("Document", "document_name"),
+        ]
+        for label, key in fields:
+            value = self.record.get(key)
+            form.addRow(f"{label}:", QLabel("" if value is None else str(value)))
+        info_layout.addLayout(form)
+        info_layout.addStretch()
+
+        close_btn = QPushButton("Close")
+        close_btn.setObjectName("closeButton")
+        close_btn.setCursor(Qt.PointingHandCursor)
+        close_btn.clicked.connect(self.accept)
+        info_layout.addWidget(close_btn)
+
+        info.setLayout(info_layout)
+        layout.addWidget(info)
+        self.setLayout(layout)
+
+    def _load_preview(self):
+        if not self.record.get("document_sha256"):
+            self.preview_label.setText("No document attached")
+            return
+        self.preview_worker = PreviewWorker(self.api, self.record, parent=self)
+        self.preview_worker.loaded.connect(self._show_preview)
+        self.preview_worker.unavailable.connect(self.preview_label.setText)
+        self.preview_worker.start()
+
+    def _show_preview(self, data):
+        pixmap = QPixmap()
+        if pixmap.loadFromData(data):
+            self.preview_label.setPixmap(pixmap.scaled(
+                self.preview_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        else:
+            self.preview_label.setText("Preview could not be displayed")
+
+    def done(self, result):
+        if self.preview_worker is not None:
+            self.preview_worker.requestInterruption()
+            self.preview_worker.wait(2000)
+        super().done(result)
+
+    def apply_styles(self):
+        self.setStyleSheet("""
+            QDialog {
+                background-color: #f5f5f7;
+            }
+
+            #previewLabel {
+                background-color: white;
+                border: 1px solid #e0e0e0;
+                border-radius: 8px;
+                color: #999;
+            }
+
+            #infoFrame {
+                background-color: white;
+                border-radius: 8px;
+            }
+
+            #closeButton {
+                background-color: #2a82da;
+                color: white;
+                border: none;
+                border-radius: 6px;
+                padding: 10px 20px;
+                font-size: 14px;
+                font-weight: 600;
+            }
+
+            #closeButton:hover {
+                background-color: #1e6bb8;
+            }
+        """)
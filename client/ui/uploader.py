@@ -1,59 +1,124 @@
 #!/usr/bin/python3
 """Enhanced upload dialog with modern design"""
 import sys
-import requests
+import time
+from collections import deque
+from datetime import date
 from pathlib import Path
 from PySide6.QtWidgets import (
     QApplication, QDialog, QVBoxLayout, QHBoxLayout, QLabel,
     QPushButton, QFileDialog, QComboBox, QMessageBox, QProgressBar, QFrame,
-    QSizePolicy
+    QSizePolicy, QTableWidget, QTableWidgetItem, QHeaderView, QSpinBox, QCheckBox
 )
 from PySide6.QtCore import Qt, QThread, Signal
 from PySide6.QtGui import QIcon
+from api.client import ApiClient, ApiError, OfflineError, file_sha256
+from api.workbook import WorkbookError, prepare_workbook
+
+
+WORKBOOK_SUFFIXES = (".xlsx", ".xlsm", ".xls")
+
+# Columns of the per-file progress table
+COL_FILE, COL_SIZE, COL_PROGRESS, COL_STATUS = range(4)
+
+
+def describe_delta(result):
+    """Summarise what an ingested upload changed, e.g. "3 added, 1 updated"."""
+    parts = [f"{result.get(key, 0)} {label}"
+             for key, label in (("inserted", "added"), ("updated", "updated"),
+                                ("deleted", "removed"))
+             if result.get(key)]
+    if not parts:
+        return f"No changes ({result.get('rows', 0)} rows)"
+    return ", ".join(parts)
 
 
 class UploadWorker(QThread):
-    """Background worker for file upload"""
-    progress = Signal(int)
-    finished = Signal(bool, str)
-    
-    def __init__(self, file_path, year, api_url):
+    """Background worker that uploads one workbook.
+
+    The workbook is hashed first; if the server already ingested identical
+    content for the target year the upload is skipped. Otherwise it is
+    validated locally, optionally converted to CSV.gz, and sent.
+    """
+    progress = Signal(int, int)          # row, percent
+    sent = Signal(int)                   # bytes sent since the last report
+    completed = Signal(int, str, str)    # row, outcome, message
+
+    def __init__(self, row, file_path, year, api, api_url=None, compress=True):
         super().__init__()
+        self.row = row
         self.file_path = file_path
         self.year = year
+        self.api = api
         self.api_url = api_url
-    
+        self.compress = compress
+        self._size = max(Path(file_path).stat().st_size, 1)
+        self._done = 0
+
+    def _on_read(self, nbytes):
+        self._done += nbytes
+        self.sent.emit(nbytes)
+        self.progress.emit(self.row, min(99, int(self._done * 100 / self._size)))
+
     def run(self):
         try:
-            self.progress.emit(10)
-            with open(self.file_path, "rb") as f:
-                files = {"file": (Path(self.file_path).name, f)}
-                data = {"year": self.year}
-                
-                self.progress.emit(30)
-                response = requests.post(self.api_url, files=files, data=data, timeout=30)
-                self.progress.emit(80)
-                
-                if response.status_code == 200:
-                    self.progress.emit(100)
-                    self.finished.emit(True, "Upload successful!")
-                else:
-                    self.finished.emit(False, f"Server error: {response.status_code}")
-                    
-        except requests.ConnectionError:
-            self.finished.emit(False, "Cannot connect to server")
+            sha256 = file_sha256(self.file_path)
+            earlier = self.api.find_upload(sha256, self.year)
+            if earlier is not None:
+                self.progress.emit(self.row, 100)
+                self.completed.emit(self.row, "skipped",
+                                    f"Already uploaded ({earlier.get('rows', 0)} rows)")
+                return
+
+            try:
+                headers = self.api.workbook_headers()
+            except ApiError:
+                headers = None  # older server; it validates the upload itself
+            try:
+                prepared = prepare_workbook(self.file_path, self.year, compress=self.compress,
+                                            headers=headers)
+            except WorkbookError as e:
+                self.completed.emit(self.row, "failed", f"Invalid workbook: {e}")
+                return
+
+            self._size = max(Path(prepared.path).stat().st_size, 1)
+            try:
+                result = self.api.upload_workbook(
+                    prepared.path, self.year, progress=self._on_read, url=self.api_url,
+                    content_type=prepared.content_type,
+                    content_encoding=prepared.content_encoding,
+                    filename=Path(self.file_path).name, source_sha256=sha256)
+            finally:
+                if prepared.temporary:
+                    Path(prepared.path).unlink(missing_ok=True)
+            self.progress.emit(self.row, 100)
+            if result.get("skipped"):
+                self.completed.emit(self.row, "skipped", "Already uploaded")
+            else:
+                self.completed.emit(self.row, "uploaded", describe_delta(result))
+        except OfflineError:
+            self.completed.emit(self.row, "failed", "Cannot connect to server")
+        except ApiError as e:
+            self.completed.emit(self.row, "failed", str(e))
         except Exception as e:
-            self.finished.emit(False, str(e))
+            self.completed.emit(self.row, "failed", str(e))
 
 
 class UploadDialog(QDialog):
-    def __init__(self, api_url="http://127.0.0.1:8000/api/upload", parent=None):
+    def __init__(self, api_url=None, parent=None, years=None, api_client=None,
+                 parallel_uploads=3):
         super().__init__(parent)
+        # api_url overrides the upload endpoint; by default the client's
+        # base URL is used
         self.api_url = api_url
-        self.setWindowTitle("Upload Workbook")
+        self.api = api_client or ApiClient()
+        # Offer the years that already hold records plus the current window
+        this_year = date.today().year
+        self.years = sorted(set(years or []) | set(range(this_year - 2, this_year + 2)))
+        self.setWindowTitle("Upload Workbooks")
         # allow the dialog to resize so nothing is clipped on smaller screens or
         # when the user has larger fonts / scaling
-        self.setMinimumSize(520, 420)
+        self.setMinimumSize(640, 520)
         self.setModal(True)
         try:
             # show a size grip on platforms that support it
@@ -61,8 +126,15 @@ class UploadDialog(QDialog):
         except Exception:
             pass
 
-        self.file_path = None
-        self.upload_worker = None
+        self.file_paths = []
+        self.parallel_uploads = parallel_uploads
+        self._queue = deque()
+        self._active = {}
+        self._results = {}
+        self._file_percent = {}
+        self._bytes_sent = 0
+        self._started_at = None
+        self._cancelled = False
         self._init_ui()
         self.apply_styles()
 
@@ -76,12 +148,12 @@ class UploadDialog(QDialog):
         header_frame.setObjectName("headerFrame")
         header_layout = QVBoxLayout()
 
-        title = QLabel("Upload Excel Workbook")
+        title = QLabel("Upload Excel Workbooks")
         title.setAlignment(Qt.AlignmentFlag.AlignCenter)
         title.setObjectName("dialogTitle")
         header_layout.addWidget(title)
 
-        subtitle = QLabel("Select an Excel file to import into the system")
+        subtitle = QLabel("Select workbooks or a whole folder to import into the system")
         subtitle.setAlignment(Qt.AlignmentFlag.AlignCenter)
         subtitle.setObjectName("dialogSubtitle")
         header_layout.addWidget(subtitle)
@@ -95,27 +167,48 @@ class UploadDialog(QDialog):
         file_layout = QVBoxLayout()
         file_layout.setContentsMargins(20, 20, 20, 20)
 
-        file_label = QLabel("Selected File:")
+        file_label = QLabel("Selected Files:")
         file_label.setObjectName("fieldLabel")
         file_layout.addWidget(file_label)
 
-        self.file_display = QLabel("No file selected")
-        self.file_display.setObjectName("fileDisplay")
-        self.file_display.setWordWrap(True)
-        # allow the file display to stretch horizontally so long file names are visible
-        self.file_display.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
-        file_layout.addWidget(self.file_display)
-
+        self.file_table = QTableWidget(0, 4)
+        self.file_table.setObjectName("fileTable")
+        self.file_table.setHorizontalHeaderLabels(["File", "Size", "Progress", "Status"])
+        self.file_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.file_table.setSelectionMode(QTableWidget.NoSelection)
+        self.file_table.verticalHeader().setVisible(False)
+        self.file_table.horizontalHeader().setSectionResizeMode(COL_FILE, QHeaderView.Stretch)
+        self.file_table.horizontalHeader().setSectionResizeMode(COL_STATUS, QHeaderView.Stretch)
+        self.file_table.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        file_layout.addWidget(self.file_table)
+
+        browse_layout = QHBoxLayout()
         browse_btn = QPushButton("Browse Files")
         browse_btn.setObjectName("browseButton")
         browse_btn.setCursor(Qt.PointingHandCursor)
         browse_btn.clicked.connect(self.select_file)
-        file_layout.addWidget(browse_btn)
+        browse_layout.addWidget(browse_btn)
+
+        folder_btn = QPushButton("Add Folder")
+        folder_btn.setObjectName("browseButton")
+        folder_btn.setCursor(Qt.PointingHandCursor)
+        folder_btn.clicked.connect(self.select_folder)
+        browse_layout.addWidget(folder_btn)
+
+        clear_btn = QPushButton("Clear List")
+        clear_btn.setObjectName("browseButton")
+        clear_btn.setCursor(Qt.PointingHandCursor)
+        clear_btn.clicked.connect(self.clear_files)
+        browse_layout.addWidget(clear_btn)
+        file_layout.addLayout(browse_layout)
 
         file_card.setLayout(file_layout)
         layout.addWidget(file_card)
 
-        # Year selection
+        # Year and parallelism selection
+        options_layout = QHBoxLayout()
+        options_layout.setSpacing(20)
+
         year_layout = QVBoxLayout()
         year_layout.setSpacing(8)
 
@@ -125,15 +218,35 @@ class UploadDialog(QDialog):
 
         self.year_combo = QComboBox()
         self.year_combo.setObjectName("yearCombo")
-        self.year_combo.addItems(["2023", "2024", "2025", "2026", "2027"])
-        self.year_combo.setCurrentText("2025")
+        self.year_combo.addItems([str(y) for y in self.years])
+        self.year_combo.setCurrentText(str(date.today().year))
         # make the combo expand so it doesn't get cropped on high-DPI/fullscreen
         self.year_combo.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
         year_layout.addWidget(self.year_combo)
+        options_layout.addLayout(year_layout)
+
+        parallel_layout = QVBoxLayout()
+        parallel_layout.setSpacing(8)
 
-        layout.addLayout(year_layout)
+        parallel_label = QLabel("Parallel Uploads:")
+        parallel_label.setObjectName("fieldLabel")
+        parallel_layout.addWidget(parallel_label)
 
-        # Progress bar
+        self.parallel_spin = QSpinBox()
+        self.parallel_spin.setObjectName("yearCombo")
+        self.parallel_spin.setRange(1, 8)
+        self.parallel_spin.setValue(self.parallel_uploads)
+        parallel_layout.addWidget(self.parallel_spin)
+        options_layout.addLayout(parallel_layout)
+
+        layout.addLayout(options_layout)
+
+        self.compress_check = QCheckBox("Compress before upload (validated CSV.gz)")
+        self.compress_check.setObjectName("fieldLabel")
+        self.compress_check.setChecked(True)
+        layout.addWidget(self.compress_check)
+
+        # Overall progress bar
         self.progress = QProgressBar()
         self.progress.setObjectName("progressBar")
         self.progress.setValue(0)
@@ -158,14 +271,14 @@ class UploadDialog(QDialog):
         self.upload_btn.setMinimumHeight(45)
         self.upload_btn.clicked.connect(self.upload_file)
 
-        cancel_btn = QPushButton("Cancel")
-        cancel_btn.setObjectName("cancelButton")
-        cancel_btn.setCursor(Qt.PointingHandCursor)
-        cancel_btn.setMinimumHeight(45)
-        cancel_btn.clicked.connect(self.reject)
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.setObjectName("cancelButton")
+        self.cancel_btn.setCursor(Qt.PointingHandCursor)
+        self.cancel_btn.setMinimumHeight(45)
+        self.cancel_btn.clicked.connect(self.reject)
 
         btn_layout.addWidget(self.upload_btn)
-        btn_layout.addWidget(cancel_btn)
+        btn_layout.addWidget(self.cancel_btn)
         layout.addLayout(btn_layout)
 
         self.setLayout(layout)
@@ -224,15 +337,6 @@ class UploadDialog(QDialog):
                 margin-bottom: 5px;
             }
             
-            #fileDisplay {
-                font-size: 14px;
-                color: #2a82da;
-                padding: 15px;
-                background-color: #f8f9fa;
-                border-radius: 6px;
-                min-height: 40px;
-            }
-            
             #browseButton {
                 background-color: #f5f5f5;
                 color: #333;
@@ -309,62 +413,200 @@ class UploadDialog(QDialog):
             #cancelButton:hover {
                 background-color: #e8e8e8;
             }
+
+            #fileTable {
+                background-color: white;
+                border: 1px solid #e0e0e0;
+                border-radius: 6px;
+                gridline-color: #f0f0f0;
+            }
         """)
 
-    def select_file(self):
-        """Open file dialog to select Excel file"""
-        file_path, _ = QFileDialog.getOpenFileName(
-            self, "Select Excel Workbook", "",
-            "Excel Files (*.xls *.xlsx);;All Files (*)"
-        )
-        if file_path:
-            self.file_path = file_path
-            file_name = Path(file_path).name
-            file_size = Path(file_path).stat().st_size / 1024  # KB
-            
-            self.file_display.setText(f"📄 {file_name}\n({file_size:.1f} KB)")
-            self.status_label.setText("✓ File ready to upload")
+    def _add_files(self, paths):
+        """Append workbooks to the upload list, ignoring duplicates."""
+        added = 0
+        for path in paths:
+            path = str(path)
+            if path in self.file_paths:
+                continue
+            self.file_paths.append(path)
+            row = self.file_table.rowCount()
+            self.file_table.insertRow(row)
+            self.file_table.setItem(row, COL_FILE, QTableWidgetItem(Path(path).name))
+            size_kb = Path(path).stat().st_size / 1024
+            self.file_table.setItem(row, COL_SIZE, QTableWidgetItem(f"{size_kb:,.1f} KB"))
+            bar = QProgressBar()
+            bar.setObjectName("progressBar")
+            bar.setValue(0)
+            self.file_table.setCellWidget(row, COL_PROGRESS, bar)
+            self.file_table.setItem(row, COL_STATUS, QTableWidgetItem("Queued"))
+            added += 1
+
+        if self.file_paths:
+            self.status_label.setText(f"✓ {len(self.file_paths)} file(s) ready to upload")
             self.status_label.setStyleSheet("color: #28a745; font-weight: 600;")
         else:
             self.status_label.setText("No file selected")
             self.status_label.setStyleSheet("color: #666;")
+        return added
+
+    def select_file(self):
+        """Open file dialog to select one or more Excel workbooks"""
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self, "Select Excel Workbooks", "",
+            "Excel Files (*.xls *.xlsx *.xlsm);;All Files (*)"
+        )
+        self._add_files(file_paths)
+
+    def select_folder(self):
+        """Add every workbook found in a folder and its sub-folders"""
+        folder = QFileDialog.getExistingDirectory(self, "Select Folder of Workbooks")
+        if not folder:
+            return
+        paths = sorted(p for p in Path(folder).rglob("*")
+                       if p.is_file() and p.suffix.lower() in WORKBOOK_SUFFIXES
+                       and not p.name.startswith("~$"))  # skip Excel lock files
+        if not self._add_files(paths):
+            QMessageBox.information(self, "No Workbooks",
+                                    "No new Excel workbooks were found in that folder.")
+
+    def clear_files(self):
+        """Empty the upload list (not allowed while uploading)."""
+        if self._active:
+            return
+        self.file_paths = []
+        self.file_table.setRowCount(0)
+        self.progress.setValue(0)
+        self.status_label.setText("No file selected")
+        self.status_label.setStyleSheet("color: #666;")
 
     def upload_file(self):
-        """Handle file upload with background worker"""
-        if not self.file_path:
+        """Upload all listed workbooks through a bounded worker queue"""
+        if not self.file_paths:
             QMessageBox.warning(self, "No File", "Please select a file first.")
             return
 
         year = self.year_combo.currentText()
-        
+
         # Disable UI during upload
         self.upload_btn.setEnabled(False)
-        self.status_label.setText(f"Uploading to {year} records...")
+        self.year_combo.setEnabled(False)
+        self.parallel_spin.setEnabled(False)
+        self.compress_check.setEnabled(False)
         self.status_label.setStyleSheet("color: #2a82da; font-weight: 600;")
         self.progress.setValue(0)
-        
-        # Create and start worker
-        self.upload_worker = UploadWorker(self.file_path, year, self.api_url)
-        self.upload_worker.progress.connect(self.update_progress)
-        self.upload_worker.finished.connect(self.upload_finished)
-        self.upload_worker.start()
-
-    def update_progress(self, value):
-        """Update progress bar"""
-        self.progress.setValue(value)
-
-    def upload_finished(self, success, message):
-        """Handle upload completion"""
+
+        self._results = {}
+        self._cancelled = False
+        self._queue = deque(range(len(self.file_paths)))
+        self._file_percent = {}
+        self._bytes_sent = 0
+        self._started_at = time.monotonic()
+        for row in range(len(self.file_paths)):
+            self.file_table.cellWidget(row, COL_PROGRESS).setValue(0)
+            self.file_table.item(row, COL_STATUS).setText("Queued")
+
+        self._year = year
+        self._fill_workers()
+
+    def _fill_workers(self):
+        """Start queued uploads until the parallelism limit is reached"""
+        while self._queue and len(self._active) < self.parallel_spin.value():
+            row = self._queue.popleft()
+            worker = UploadWorker(row, self.file_paths[row], self._year, self.api,
+                                  api_url=self.api_url,
+                                  compress=self.compress_check.isChecked())
+            worker.progress.connect(self.update_progress)
+            worker.sent.connect(self._bytes_uploaded)
+            worker.completed.connect(self.upload_finished)
+            self._active[row] = worker
+            self.file_table.item(row, COL_STATUS).setText("Uploading...")
+            worker.start()
+        self._update_summary()
+
+    def update_progress(self, row, value):
+        """Update a file's progress bar"""
+        self.file_table.cellWidget(row, COL_PROGRESS).setValue(value)
+        self._file_percent[row] = value
+        self._update_summary()
+
+    def _bytes_uploaded(self, nbytes):
+        self._bytes_sent += nbytes
+
+    def _update_summary(self):
+        """Show overall progress and aggregate throughput"""
+        done = len(self._results)
+        total = len(self.file_paths)
+        self.progress.setValue(int(sum(self._file_percent.values()) / max(total, 1)))
+        elapsed = max(time.monotonic() - (self._started_at or time.monotonic()), 0.001)
+        rate = self._bytes_sent / elapsed / 1048576
+        self.status_label.setText(
+            f"Uploading to {self._year} records: {done}/{total} files done, "
+            f"{len(self._active)} in progress, {rate:.2f} MB/s")
+
+    def upload_finished(self, row, outcome, message):
+        """Record one file's result and start the next queued upload"""
+        worker = self._active.pop(row, None)
+        if worker is not None:
+            worker.wait()
+            worker.deleteLater()
+        self._results[row] = outcome
+        labels = {"uploaded": "✓ ", "skipped": "↷ ", "failed": "✗ "}
+        item = self.file_table.item(row, COL_STATUS)
+        item.setText(labels.get(outcome, "") + message)
+        colors = {"uploaded": Qt.darkGreen, "skipped": Qt.gray, "failed": Qt.red}
+        item.setForeground(colors.get(outcome, Qt.black))
+        if outcome == "failed":
+            self.file_table.cellWidget(row, COL_PROGRESS).setValue(0)
+        self._file_percent[row] = 100
+
+        if self._queue:
+            self._fill_workers()
+        elif not self._active:
+            self._all_finished()
+        else:
+            self._update_summary()
+
+    def _all_finished(self):
+        """Summarise the batch once every upload has completed"""
         self.upload_btn.setEnabled(True)
-        
-        if success:
+        self.year_combo.setEnabled(True)
+        self.parallel_spin.setEnabled(True)
+        self.compress_check.setEnabled(True)
+
+        outcomes = list(self._results.values())
+        uploaded = outcomes.count("uploaded")
+        skipped = outcomes.count("skipped")
+        failed = outcomes.count("failed")
+        elapsed = time.monotonic() - self._started_at
+        message = (f"{uploaded} uploaded, {skipped} skipped, {failed} failed "
+                   f"in {elapsed:.1f}s")
+
+        if self._cancelled:
+            self.done(QDialog.Accepted if uploaded else QDialog.Rejected)
+            return
+
+        if failed:
+            self.progress.setValue(0)
+            self.status_label.setText("✗ " + message)
+            self.status_label.setStyleSheet("color: #dc3545; font-weight: 600;")
+            QMessageBox.critical(self, "Upload Failed",
+                                 message + "\n\nFix the failed files and upload again;"
+                                 " completed files will be skipped.")
+        else:
             self.progress.setValue(100)
             self.status_label.setText("✓ " + message)
             self.status_label.setStyleSheet("color: #28a745; font-weight: 600;")
             QMessageBox.information(self, "Success", message)
             self.accept()
-        else:
-            self.progress.setValue(0)
-            self.status_label.setText("✗ " + message)
-            self.status_label.setStyleSheet("color: #dc3545; font-weight: 600;")
-            QMessageBox.critical(self, "Upload Failed", message)
\ No newline at end of file
+
+    def reject(self):
+        """Closing the dialog waits for uploads already in flight"""
+        if self._active:
+            self._queue.clear()
+            self._cancelled = True
+            QMessageBox.information(self, "Uploads in Progress",
+                                    "Remaining files were cancelled; the dialog will "
+                                    "close when the current uploads finish.")
+            return
+        super().reject()
@@ -1,7 +1,24 @@
 #!/usr/bin/python3
 """a module for db storage"""
+import time
+
+# Start of the server's own imports, for the startup report in server.app
+import_started = time.perf_counter()
+
 from .engine.database import DBStorage
+from .engine.blobstore import BlobStore
+from .engine.previews import PreviewRenderer
+from .engine.analytics import AnalyticsStore
+from .engine.auditlog import AuditLog
+from .events import EventBus
+from .ratelimit import RateLimiter
 
 
+# The schema is checked by the app's startup event (storage.reload())
 storage = DBStorage()
-storage.reload()
\ No newline at end of file
+blobs = BlobStore()
+previews = PreviewRenderer(blobs)
+analytics = AnalyticsStore()
+events = EventBus()
+rate_limiter = RateLimiter()
+audit_log = AuditLog(storage)
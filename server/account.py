@@ -15,8 +15,11 @@ class Account(Base):
     password_hash = Column(String(255), nullable=False)
     role = Column(String(32), default="staff", nullable=False)
     status = Column(String(32), default="active", nullable=False)
+    # Bumped by every update; tokens carry it and are refused once it moves
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow,
+                        onupdate=datetime.utcnow, nullable=False)
 
     def to_dict(self):
         return {
@@ -2,18 +2,68 @@
 
 
 """app main entry point"""
+import time
+
 from fastapi import FastAPI
 from server.routes import router as api_router
+from server.middleware import CompressionMiddleware
+from server.utils import ORJSONResponse
 
+import asyncio
 import os
-from server import crud
+from datetime import datetime, timedelta
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from server import analytics, audit_log, auth, crud, events, previews, storage, import_started
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+app.add_middleware(CompressionMiddleware,
+                   minimum_size=int(os.environ.get("EDMS_COMPRESS_MIN_SIZE", "1024")))
 app.include_router(api_router)
+app.state.import_ms = (time.perf_counter() - import_started) * 1000
 
 
 @app.on_event("startup")
+def check_schema():
+    """Create missing tables if the models changed, and report startup time."""
+    started = time.perf_counter()
+    created = storage.reload()
+    app.state.schema_ms = (time.perf_counter() - started) * 1000
+    app.state.ready_at = datetime.utcnow()
+    print(f"EDMS ready in {app.state.import_ms + app.state.schema_ms:.0f} ms "
+          f"(imports {app.state.import_ms:.0f} ms, schema check {app.state.schema_ms:.0f} ms"
+          f"{', tables created' if created else ''})")
+
+
+@app.on_event("startup")
+def start_audit_writer():
+    """Write queued audit entries in the background (one thread per worker)."""
+    audit_log.start()
+
+
+@app.on_event("startup")
+async def schedule_first_run_setup():
+    """Run first-run chores after the server starts accepting requests."""
+    app.state.setup_task = asyncio.create_task(run_in_threadpool(first_run_setup))
+
+
+def first_run_setup():
+    ensure_admin_user()
+    # Load bcrypt and jose now rather than during the first login
+    auth.warm_up()
+
+
+@app.get("/health")
+def health():
+    """Liveness check with the startup timings of this worker."""
+    return {"status": "ok",
+            "pid": os.getpid(),
+            "import_ms": round(app.state.import_ms, 1),
+            "schema_check_ms": round(getattr(app.state, "schema_ms", 0.0), 1),
+            "ready_at": getattr(app.state, "ready_at", None)}
+
+
 def ensure_admin_user():
     """If there are no accounts and ADMIN_USER/ADMIN_PASS are set, create an admin.
 
@@ -34,10 +84,88 @@ def ensure_admin_user():
                 crud.create_account(username=admin_user, password=admin_pass,
                                     email=admin_email, role="admin")
                 print("Created initial admin user from ADMIN_USER/ADMIN_PASS")
+            except (IntegrityError, ValueError):
+                # Another worker created it first
+                storage.close()
             except Exception as e:
                 print("Failed to create admin user:", e)
 
 
+def _seconds_until(hour: int) -> float:
+    """Seconds from now until the next local hour:00."""
+    now = datetime.now()
+    run_at = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if run_at <= now:
+        run_at += timedelta(days=1)
+    return (run_at - now).total_seconds()
+
+
+async def nightly_snapshots(hour: int):
+    """Refresh the analytics snapshot every night at hour.
+
+    A server without any snapshot takes its first one shortly after start.
+    """
+    delay = 5 if analytics.current() is None else _seconds_until(hour)
+    while True:
+        await asyncio.sleep(delay)
+        delay = _seconds_until(hour)
+        # With several workers each runs this job; the first one to get
+        # there takes the snapshot and the others find it fresh
+        current = analytics.current()
+        if current is not None and datetime.utcnow() - datetime.fromisoformat(
+                current["generated_at"]) < timedelta(hours=1):
+            continue
+        try:
+            await run_in_threadpool(crud.snapshot_records)
+        except Exception as e:
+            print("Analytics snapshot failed:", e)
+
+
+@app.on_event("startup")
+async def schedule_analytics_snapshots():
+    """Start the nightly snapshot job unless EDMS_SNAPSHOT_HOUR is "off"."""
+    hour = os.environ.get("EDMS_SNAPSHOT_HOUR", "2")
+    if not analytics.available or hour.lower() == "off":
+        return
+    app.state.snapshot_task = asyncio.create_task(nightly_snapshots(int(hour)))
+
+
+@app.on_event("startup")
+async def start_event_relay():
+    """Share change events with sibling workers when run by the launcher."""
+    relay_dir = os.environ.get("EDMS_EVENT_RELAY_DIR")
+    if relay_dir:
+        await events.enable_relay(relay_dir)
+
+
+@app.on_event("shutdown")
+def stop_event_relay():
+    """Remove this worker's relay socket."""
+    events.disable_relay()
+
+
+@app.on_event("shutdown")
+def stop_audit_writer():
+    """Flush the remaining audit entries."""
+    audit_log.stop()
+
+
+@app.on_event("shutdown")
+def stop_preview_workers():
+    """Shut down the thumbnail process pool."""
+    previews.shutdown()
+
+
+@app.on_event("shutdown")
+def stop_analytics_snapshots():
+    """Cancel the nightly snapshot job."""
+    task = getattr(app.state, "snapshot_task", None)
+    if task is not None:
+        task.cancel()
+
+
 if __name__ == "__main__":
+    # Single-process development server; use `python -m server.serve` to run
+    # several workers in production
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
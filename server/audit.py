@@ -0,0 +1,41 @@
+#!/usr/bin/python3
+"""AuditEvent SQLAlchemy model for EDMS"""
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Index, Text
+from server.base import Base
+
+
+class AuditEvent(Base):
+    """One audited action: a search, view, download, upload or account change.
+
+    Rows are only ever inserted (in batches, see server.engine.auditlog).
+    The indexes serve the audit query endpoint, which filters by account
+    or action and always orders by time.
+    """
+    __tablename__ = "audit_events"
+    __table_args__ = (
+        Index("ix_audit_events_account_at", "account_id", "at"),
+        Index("ix_audit_events_action_at", "action", "at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    account_id = Column(Integer, nullable=True)
+    username = Column(String(128), nullable=True)
+    action = Column(String(64), nullable=False)
+    target = Column(String(255), nullable=True)
+    address = Column(String(64), nullable=True)
+    # JSON object with action-specific details (filters, counts, ...)
+    detail = Column(Text, nullable=True)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "at": self.at.isoformat() if self.at else None,
+            "account_id": self.account_id,
+            "username": self.username,
+            "action": self.action,
+            "target": self.target,
+            "address": self.address,
+            "detail": self.detail,
+        }
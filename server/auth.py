@@ -1,9 +1,36 @@
 #!/usr/bin/python3
-"""Authentication helpers: password hashing and JWT tokens."""
+"""Authentication helpers: password hashing and JWT tokens.
+
+passlib's bcrypt backend and python-jose are imported on first use (or by
+warm_up() once the server is accepting requests) to keep startup fast.
+
+A login issues a short-lived access token and a long-lived refresh token.
+Clients trade the refresh token at /token/refresh for a new pair, so the
+password (and its deliberately slow bcrypt check) is only needed again
+once the refresh token expires.
+
+The hashing cost is set per deployment: EDMS_BCRYPT_ROUNDS, or
+EDMS_PASSWORD_SCHEME=argon2 with EDMS_ARGON2_TIME_COST and
+EDMS_ARGON2_MEMORY_KB (needs argon2-cffi). ``python -m server.calibrate``
+suggests values for the target login time on the machine it runs on.
+Stored hashes made with other settings are upgraded at the next
+successful login.
+
+Access tokens carry the account's id, role and token version, so requests
+are authorized from the token alone. The version changes whenever the
+account is updated; TokenVersions keeps the current version of each
+account in memory and tokens with an older one are refused. Refresh
+tokens carry the version too, so an account change (a new password, a
+demotion) also revokes them and the user has to sign in again. Cached
+versions expire after EDMS_TOKEN_VERSION_TTL seconds, which bounds how
+long a worker that missed an accounts.changed event keeps accepting
+revoked tokens.
+"""
+import time
+import secrets
+import threading
 from datetime import datetime, timedelta
-from typing import Optional
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
 from fastapi import Depends, HTTPException, status
 from os import getenv
 
@@ -11,17 +38,167 @@ from os import getenv
 # Secret configuration - for production keep this in env vars / secrets manager
 SECRET_KEY = getenv("SECRET_KEY", None)
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 1 day
+ACCESS_TOKEN_EXPIRE_MINUTES = int(getenv("EDMS_ACCESS_TOKEN_MINUTES", "60"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(getenv("EDMS_REFRESH_TOKEN_DAYS", "30"))
+# Seconds a cached token version is trusted before it is read again
+TOKEN_VERSION_TTL = float(getenv("EDMS_TOKEN_VERSION_TTL", "30"))
+
+PASSWORD_SCHEME = getenv("EDMS_PASSWORD_SCHEME", "bcrypt")
+BCRYPT_ROUNDS = int(getenv("EDMS_BCRYPT_ROUNDS", "12"))
+ARGON2_TIME_COST = int(getenv("EDMS_ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_KB = int(getenv("EDMS_ARGON2_MEMORY_KB", "65536"))
+
+_pwd_context = None
+_dummy_hash = None
+
+
+def context_settings(scheme: str = PASSWORD_SCHEME, bcrypt_rounds: int = BCRYPT_ROUNDS,
+                     argon2_time_cost: int = ARGON2_TIME_COST,
+                     argon2_memory_kb: int = ARGON2_MEMORY_KB) -> dict:
+    """CryptContext keyword arguments for the given hashing cost.
+
+    Min and max are pinned to the configured cost so that needs_update()
+    flags hashes made with a lower or a higher one.
+    """
+    schemes = [scheme] + (["bcrypt"] if scheme != "bcrypt" else [])
+    settings = {
+        "schemes": schemes,
+        "deprecated": "auto",
+        "bcrypt__default_rounds": bcrypt_rounds,
+        "bcrypt__min_rounds": bcrypt_rounds,
+        "bcrypt__max_rounds": bcrypt_rounds,
+    }
+    if scheme == "argon2":
+        settings.update({
+            "argon2__time_cost": argon2_time_cost,
+            "argon2__memory_cost": argon2_memory_kb,
+        })
+    return settings
+
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def pwd_context():
+    """Return the shared CryptContext, creating it on first use."""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(**context_settings())
+    return _pwd_context
+
+
+def warm_up() -> None:
+    """Load the hashing and JWT libraries ahead of the first login."""
+    dummy_hash()
+    import jose.jwt  # noqa: F401
 
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return pwd_context().verify(plain_password, hashed_password)
+
+
+def dummy_hash() -> str:
+    """A hash of a random password, verified in place of a missing account's."""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_urlsafe(16))
+    return _dummy_hash
+
+
+def verify_login(plain_password: str,
+                 hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """Check a login password; unknown users (hashed_password None) fail.
+
+    Returns (ok, new_hash). new_hash is set when the password was right
+    but its stored hash uses an outdated scheme or cost and should be
+    replaced. An unknown username still costs one verification, so response
+    time does not reveal which usernames exist.
+    """
+    if hashed_password is None:
+        pwd_context().verify(plain_password, dummy_hash())
+        return False, None
+    return pwd_context().verify_and_update(plain_password, hashed_password)
+
+
+class TokenUser(NamedTuple):
+    """The caller of a request, as described by its access token."""
+    id: int
+    username: str
+    role: str
+
+
+def token_version(account) -> int:
+    """Version of an account's claims, incremented by every update.
+
+    A stored counter rather than updated_at, whose precision depends on
+    the database (whole seconds on MySQL), so two changes can never share
+    a version.
+    """
+    return account.token_version or 0
+
+
+class TokenVersions:
+    """In-memory map of account id to current token version.
+
+    A missing or expired entry is loaded with loader(account_id), which
+    returns the version or None for an account that no longer exists.
+    Entries expire after ttl seconds, so a change made by another process
+    is picked up even if its accounts.changed event never arrives.
+    """
+
+    def __init__(self, loader: Callable[[int], Optional[int]],
+                 ttl: float = TOKEN_VERSION_TTL):
+        self._loader = loader
+        self._ttl = ttl
+        self._versions: Dict[int, Tuple[Optional[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, account_id: int) -> Optional[int]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._versions.get(account_id)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+        version = self._loader(account_id)
+        with self._lock:
+            self._versions[account_id] = (version, now + self._ttl)
+        return version
+
+    def set(self, account_id: int, version: Optional[int]) -> None:
+        """Record a new version, or None once the account is deleted."""
+        with self._lock:
+            self._versions[account_id] = (version, time.monotonic() + self._ttl)
+
+    def forget(self, account_id: int) -> None:
+        """Drop the cached version so the next check reloads it."""
+        with self._lock:
+            self._versions.pop(account_id, None)
+
+
+def _decode(token: str) -> Optional[dict]:
+    from jose import JWTError, jwt
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+
+
+def decode_access_token(token: str) -> Optional[dict]:
+    """Return the claims of a valid access token, or None."""
+    payload = _decode(token)
+    if payload is None or payload.get("type") == "refresh":
+        return None
+    return payload
+
+
+def decode_refresh_token(token: str) -> Optional[dict]:
+    """Return the claims of a valid refresh token, or None."""
+    payload = _decode(token)
+    if payload is None or payload.get("type") != "refresh":
+        return None
+    return payload
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -32,10 +209,31 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire, "iat": now})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
+    """Create a refresh token; it is only accepted by /token/refresh."""
+    expires_delta = expires_delta or timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    return create_access_token({**data, "type": "refresh",
+                                "jti": secrets.token_urlsafe(12)}, expires_delta)
+
+
+def issue_tokens(account) -> dict:
+    """Return the access/refresh token pair sent to a client after login."""
+    claims = {"sub": account.username, "uid": account.id, "ver": token_version(account)}
+    return {
+        "access_token": create_access_token({**claims, "role": account.role}),
+        "refresh_token": create_refresh_token(claims),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "username": account.username,
+        "role": account.role,
+    }
+
+
 def get_current_user(token: str = Depends(lambda: None)):
     # This is a placeholder for FastAPI's OAuth2 dependency wiring in routes.
     # Real dependency will use OAuth2PasswordBearer to extract the token.
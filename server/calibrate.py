@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+"""Pick a password hashing cost for this machine.
+
+    python -m server.calibrate --target-ms 250
+    python -m server.calibrate --scheme argon2 --target-ms 400
+
+Times a verification at increasing cost and prints the setting whose
+verification takes closest to, without exceeding, the target. Put the
+printed variables in the server's environment. Existing hashes are moved
+to the new cost as their users next log in (see server.auth).
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from passlib.exc import MissingBackendError
+
+from server import auth
+
+SAMPLE_PASSWORD = "calibration-Passw0rd!"
+
+
+def _time_verify(handler, samples: int) -> float:
+    """Median milliseconds to verify a password hashed with handler."""
+    hashed = handler.hash(SAMPLE_PASSWORD)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        handler.verify(SAMPLE_PASSWORD, hashed)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate_bcrypt(target_ms: float, samples: int):
+    """Yield (rounds, ms) from 10 rounds up until the target is passed."""
+    from passlib.hash import bcrypt
+    for rounds in range(10, 18):
+        ms = _time_verify(bcrypt.using(rounds=rounds), samples)
+        yield rounds, ms
+        # Each extra round doubles the work; stop once it is clearly too slow
+        if ms > target_ms:
+            return
+
+
+def calibrate_argon2(target_ms: float, samples: int, memory_kb: int):
+    """Yield (time_cost, ms) at a fixed memory cost until the target is passed."""
+    from passlib.hash import argon2
+    for time_cost in range(1, 21):
+        ms = _time_verify(argon2.using(time_cost=time_cost, memory_cost=memory_kb), samples)
+        yield time_cost, ms
+        if ms > target_ms:
+            return
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate the password hashing cost")
+    parser.add_argument("--target-ms", type=float, default=250,
+                        help="longest acceptable time for one login verification")
+    parser.add_argument("--scheme", choices=("bcrypt", "argon2"), default=auth.PASSWORD_SCHEME)
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--memory-kb", type=int, default=auth.ARGON2_MEMORY_KB,
+                        help="argon2 memory cost, kept fixed while time cost varies")
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.scheme == "bcrypt":
+        name, variable = "rounds", "EDMS_BCRYPT_ROUNDS"
+        results = calibrate_bcrypt(args.target_ms, args.samples)
+    else:
+        name, variable = "time cost", "EDMS_ARGON2_TIME_COST"
+        results = calibrate_argon2(args.target_ms, args.samples, args.memory_kb)
+
+    chosen = None
+    try:
+        for cost, ms in results:
+            print(f"{args.scheme} {name} {cost:>2}: {ms:8.1f} ms")
+            if ms <= args.target_ms:
+                chosen = cost
+    except (ImportError, MissingBackendError) as e:
+        print(f"{args.scheme} is not available: {e}")
+        return 1
+
+    if chosen is None:
+        print(f"Even the lowest cost takes longer than {args.target_ms:.0f} ms on this machine.")
+        return 1
+    print(f"\nEDMS_PASSWORD_SCHEME={args.scheme}")
+    print(f"{variable}={chosen}")
+    if args.scheme == "argon2":
+        print(f"EDMS_ARGON2_MEMORY_KB={args.memory_kb}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,36 @@
 #!/usr/bin/python3
-"""CRUD helpers for server models (Account)."""
-from typing import Optional, Dict, Any, List
-from server import storage
+"""CRUD helpers for server models (Account, Record)."""
+import heapq
+import json
+import re
+from datetime import datetime
+from itertools import islice
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
+from server import storage, analytics, events
 from server.account import Account
-from server.auth import hash_password, verify_password as _verify_password
+from server.document import Document
+from server.record import Record
+from server.upload import Upload
+from server.audit import AuditEvent
+from server.rows import AccountRow, AuditEventRow, RecordRow
+from server.auth import (TokenVersions, hash_password, token_version, verify_login,
+                         verify_password as _verify_password)
+
+
+# Columns selected by the fast list/search paths. Querying these directly
+# returns plain tuples, which skips ORM identity-map bookkeeping per row;
+# they are then wrapped in the matching server.rows class, in this order.
+ACCOUNT_COLUMNS = (Account.id, Account.username, Account.email, Account.role,
+                   Account.status, Account.created_at, Account.updated_at)
+RECORD_COLUMNS = (Record.id, Record.file_no, Record.name, Record.department,
+                  Record.year, Record.lga, Record.status, Record.document_sha256,
+                  Record.document_name, Record.created_at, Record.updated_at)
+AUDIT_COLUMNS = (AuditEvent.id, AuditEvent.at, AuditEvent.account_id, AuditEvent.username,
+                 AuditEvent.action, AuditEvent.target, AuditEvent.address,
+                 AuditEvent.detail)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -11,29 +38,127 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return _verify_password(plain_password, hashed_password)
 
 
+# Error codes raised as ValueError when a unique column is taken
+CONFLICT_MESSAGES = {
+    "username_exists": "Username already exists",
+    "email_exists": "Email already exists",
+}
+
+
+# Names each backend gives the accounts table's unique constraints:
+# PostgreSQL "accounts_email_key", MySQL "email" (8.0: "accounts.email"),
+# SQLite reports the column as "accounts.email"
+ACCOUNT_UNIQUE_KEYS = {
+    f"{prefix}{field}{suffix}": field
+    for field in ("username", "email")
+    for prefix, suffix in (("", ""), ("accounts.", ""), ("accounts_", "_key"))
+}
+
+_MYSQL_DUP_ENTRY = 1062
+_MYSQL_DUP_KEY = re.compile(r"for key '([^']*)'\s*$")
+_SQLITE_UNIQUE = "UNIQUE constraint failed: "
+
+
+def _unique_key(error: IntegrityError) -> Optional[str]:
+    """Return the constraint or column a uniqueness violation names.
+
+    Reads the driver's error code rather than guessing from the message,
+    and returns None for any other integrity error (NOT NULL, foreign
+    keys, ...).
+    """
+    orig = error.orig
+    sqlstate = getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)
+    if sqlstate:
+        # PostgreSQL (psycopg 3 / psycopg2)
+        if sqlstate != "23505":
+            return None
+        return getattr(getattr(orig, "diag", None), "constraint_name", None)
+    args = getattr(orig, "args", ())
+    if len(args) >= 2 and isinstance(args[0], int):
+        # MySQL: (1062, "Duplicate entry '...' for key '...'")
+        if args[0] != _MYSQL_DUP_ENTRY:
+            return None
+        match = _MYSQL_DUP_KEY.search(str(args[1]))
+        return match.group(1) if match else None
+    message = str(orig)
+    if message.startswith(_SQLITE_UNIQUE):
+        # SQLite lists the columns: "UNIQUE constraint failed: accounts.email"
+        return message[len(_SQLITE_UNIQUE):].split(",")[0].strip()
+    return None
+
+
+def _conflict(error: IntegrityError) -> Optional[ValueError]:
+    """Name the unique account column an insert or update collided with.
+
+    Returns None when the error is not a username/email uniqueness
+    violation; the caller should re-raise the original error then.
+    """
+    field = ACCOUNT_UNIQUE_KEYS.get(_unique_key(error) or "")
+    return ValueError(f"{field}_exists") if field else None
+
+
 def create_account(username: str, password: str, email: Optional[str] = None,
                    role: str = "staff", status: str = "active") -> Account:
     """Create and persist a new Account.
 
-    Raises ValueError if username already exists.
+    Raises ValueError("username_exists" or "email_exists") if the username
+    or email is taken. The insert itself detects this (no lookup first);
+    inside an outer transaction, wrap the call in storage.savepoint().
     """
-    existing = get_account_by_username(username)
-    if existing:
-        raise ValueError("username_exists")
+    return _insert_account(username, hash_password(password), email, role, status)
+
 
+def _insert_account(username: str, password_hash: str, email: Optional[str] = None,
+                    role: str = "staff", status: str = "active") -> Account:
+    """Insert an account whose password is already hashed."""
     account = Account()
     account.username = username
     account.email = email
-    account.password_hash = hash_password(password)
+    account.password_hash = password_hash
     account.role = role
     account.status = status
 
-    # persist via storage
-    storage.new(account)
-    storage.save()
+    # persist via storage (commits here unless an outer transaction is open)
+    try:
+        with storage.transaction():
+            storage.new(account)
+            storage.save()
+    except IntegrityError as e:
+        conflict = _conflict(e)
+        if conflict is None:
+            raise
+        raise conflict from None
     return account
 
 
+def create_accounts(items: List[Dict[str, Any]]) -> Tuple[List[Account], List[Dict[str, Any]]]:
+    """Create several accounts in one transaction.
+
+    Each account gets its own savepoint, so a duplicate username only
+    skips that entry. Returns the created accounts and an error entry
+    ({"index", "username", "detail"}) for each one skipped.
+
+    Passwords are hashed before the transaction starts, so its write
+    locks are not held across the (deliberately slow) hashing.
+    """
+    hashed = []
+    for item in items:
+        item = dict(item)
+        item["password_hash"] = hash_password(item.pop("password"))
+        hashed.append(item)
+    created, errors = [], []
+    with storage.transaction():
+        for index, item in enumerate(hashed):
+            try:
+                with storage.savepoint():
+                    created.append(_insert_account(**item))
+                continue
+            except ValueError as e:
+                detail = CONFLICT_MESSAGES.get(str(e), str(e))
+            errors.append({"index": index, "username": item.get("username"), "detail": detail})
+    return created, errors
+
+
 def get_account_by_id(account_id: int) -> Optional[Account]:
     """Retrieve an Account by its id."""
     try:
@@ -54,38 +179,101 @@ def get_account_by_username(username: str) -> Optional[Account]:
         return None
 
 
-def update_account(account_id: int, updates: Dict[str, Any]) -> Optional[Account]:
-    """Update fields on an account. Returns updated account or None.
+def _load_token_version(account_id: int) -> Optional[int]:
+    acct = get_account_by_id(account_id)
+    return token_version(acct) if acct else None
+
+
+# Current token version of each account, so requests are authorized from
+# their token without loading the account
+token_versions = TokenVersions(_load_token_version)
+
+
+def _forget_token_version(event: Dict[str, Any]) -> None:
+    """Reload an account's version after any worker reports a change to it."""
+    if event["type"] == "accounts.changed" and event["data"].get("id") is not None:
+        token_versions.forget(event["data"]["id"])
+
+
+events.add_listener(_forget_token_version)
+
+
+def _forget_archive(event: Dict[str, Any]) -> None:
+    """Reopen a year's archive after any worker archives, restores or drops it."""
+    if (event["type"] == "records.changed"
+            and event["data"].get("action") in ("archived", "restored", "dropped")):
+        storage.forget_archive(event["data"]["year"])
+
+
+events.add_listener(_forget_archive)
+
 
-    Supported update keys: username, email, password, role, status
+def authenticate(username: str, password: str) -> Optional[Account]:
+    """Return the account if password is right, upgrading its stored hash.
+
+    An outdated hash (other scheme or cost) is replaced in place without
+    touching updated_at, so account listings keep their ETag.
     """
-    acct = get_account_by_id(account_id)
-    if not acct:
+    acct = get_account_by_username(username)
+    ok, new_hash = verify_login(password, acct.password_hash if acct else None)
+    if not ok:
         return None
+    if new_hash:
+        with storage.transaction() as sess:
+            sess.execute(update(Account).where(Account.id == acct.id)
+                         .values(password_hash=new_hash, updated_at=Account.updated_at)
+                         .execution_options(synchronize_session=False))
+        set_committed_value(acct, "password_hash", new_hash)
+    return acct
 
-    if "username" in updates:
-        acct.username = updates["username"]
-    if "email" in updates:
-        acct.email = updates["email"]
+
+def update_account(account_id: int, updates: Dict[str, Any]) -> Optional[Account]:
+    """Update fields on an account. Returns updated account or None.
+
+    Supported update keys: username, email, password, role, status.
+    A single UPDATE ... RETURNING both applies the change and reads the
+    row back. Raises ValueError like create_account on a taken username.
+    """
+    values = {key: updates[key] for key in ("username", "email", "role", "status")
+              if key in updates}
     if "password" in updates:
-        acct.password_hash = hash_password(updates["password"])
-    if "role" in updates:
-        acct.role = updates["role"]
-    if "status" in updates:
-        acct.status = updates["status"]
-
-    # commit
-    storage.save()
+        values["password_hash"] = hash_password(updates["password"])
+    if not values:
+        # Nothing to change; leave updated_at (and issued tokens) alone
+        return get_account_by_id(account_id)
+
+    # Revoke issued tokens in the same statement that changes the account
+    values["token_version"] = Account.token_version + 1
+    stmt = update(Account).where(Account.id == account_id).values(**values)
+    try:
+        with storage.transaction() as sess:
+            if sess.get_bind().dialect.update_returning:
+                acct = sess.execute(stmt.returning(Account),
+                                    execution_options={"populate_existing": True}
+                                    ).scalar_one_or_none()
+            elif sess.execute(stmt).rowcount:
+                # MySQL has no UPDATE ... RETURNING; read the row back instead
+                acct = sess.get(Account, account_id, populate_existing=True)
+            else:
+                acct = None
+    except IntegrityError as e:
+        conflict = _conflict(e)
+        if conflict is None:
+            raise
+        raise conflict from None
+    if acct is None:
+        return None
+    token_versions.set(acct.id, token_version(acct))
     return acct
 
 
 def delete_account(account_id: int) -> bool:
-    """Delete an account by id. Returns True if deleted."""
-    acct = get_account_by_id(account_id)
-    if not acct:
+    """Delete an account by id in one statement. Returns True if deleted."""
+    with storage.transaction() as sess:
+        deleted = sess.execute(delete(Account).where(Account.id == account_id)).rowcount
+    if not deleted:
         return False
-    storage.delete(acct)
-    storage.save()
+    token_versions.set(account_id, None)
     return True
 
 
@@ -100,3 +288,342 @@ def list_accounts(limit: Optional[int] = None, offset: int = 0) -> List[Account]
     if limit:
         q = q.limit(limit)
     return q.all()
+
+
+def list_account_rows(limit: Optional[int] = None, offset: int = 0) -> List[AccountRow]:
+    """Return accounts as compact rows, ordered by id."""
+    sess = getattr(storage, "_DBStorage__session", None)
+    if sess is None:
+        return []
+    q = sess.query(*ACCOUNT_COLUMNS).order_by(Account.id)
+    if offset:
+        q = q.offset(offset)
+    if limit:
+        q = q.limit(limit)
+    return [AccountRow(*r) for r in q]
+
+
+def iter_account_rows() -> Iterator[AccountRow]:
+    """Stream every account as compact rows, ordered by id."""
+    for r in storage.stream(select(*ACCOUNT_COLUMNS).order_by(Account.id)):
+        yield AccountRow(*r)
+
+
+def _record_filters(q, year: Optional[int] = None,
+                    department: Optional[str] = None,
+                    lga: Optional[str] = None, status: Optional[str] = None,
+                    keyword: Optional[str] = None):
+    """Apply the search filters used by the client to a Record query."""
+    if year:
+        q = q.filter(Record.year == year)
+    if department:
+        q = q.filter(Record.department == department)
+    if lga:
+        q = q.filter(Record.lga == lga)
+    if status:
+        q = q.filter(Record.status == status)
+    if keyword:
+        pattern = f"%{keyword}%"
+        q = q.filter(Record.file_no.ilike(pattern) | Record.name.ilike(pattern))
+    return q
+
+
+def _record_page(build, limit: Optional[int], offset: int,
+                 year: Optional[int] = None) -> list:
+    """Run build(session) on the partitions of year and return one id-ordered page.
+
+    A year (or a tree without archives) means a single partition, which is
+    paged in SQL. Otherwise each partition returns at most offset + limit
+    rows and the id-ordered streams are merged.
+    """
+    if year or not storage.archived_years():
+        for sess in storage.partition_sessions(year):
+            q = build(sess).order_by(Record.id)
+            if offset:
+                q = q.offset(offset)
+            if limit:
+                q = q.limit(limit)
+            return q.all()
+        return []
+    window = offset + limit if limit else None
+    pages = []
+    for sess in storage.partition_sessions():
+        q = build(sess).order_by(Record.id)
+        if window:
+            q = q.limit(window)
+        pages.append(q.all())
+    return list(islice(heapq.merge(*pages, key=lambda r: r.id), offset, window))
+
+
+def search_record_rows(limit: Optional[int] = None, offset: int = 0,
+                       **filters) -> List[RecordRow]:
+    """Return records matching filters as compact rows, ordered by id."""
+    if getattr(storage, "_DBStorage__session", None) is None:
+        return []
+    rows = _record_page(lambda sess: _record_filters(sess.query(*RECORD_COLUMNS), **filters),
+                        limit, offset, filters.get("year"))
+    return [RecordRow(*r) for r in rows]
+
+
+def iter_record_rows(**filters) -> Iterator[RecordRow]:
+    """Stream all records matching filters as compact rows, ordered by id.
+
+    Each partition the filters can touch is streamed on its own connection
+    and the id-ordered streams are merged, so only a batch per partition is
+    in memory at a time. The partitions are chosen when this is called.
+    """
+    stmt = _record_filters(select(*RECORD_COLUMNS), **filters).order_by(Record.id)
+    year = filters.get("year")
+    archived = storage.archived_years()
+    if year:
+        streams = [storage.stream(stmt, archived_year=year if year in archived else None)]
+    else:
+        streams = [storage.stream(stmt)]
+        streams.extend(storage.stream(stmt, archived_year=y) for y in sorted(archived))
+    return (RecordRow(*r) for r in heapq.merge(*streams, key=lambda r: r.id))
+
+
+def account_version() -> Tuple[int, Optional[datetime]]:
+    """Return (row count, latest updated_at) for the accounts table.
+
+    This single aggregate is enough to tell whether a cached account list
+    is still current.
+    """
+    sess = getattr(storage, "_DBStorage__session", None)
+    if sess is None:
+        return 0, None
+    count, latest = sess.query(func.count(Account.id),
+                               func.max(Account.updated_at)).one()
+    return count, latest
+
+
+def record_version(**filters) -> Tuple[int, Optional[datetime]]:
+    """Return (row count, latest updated_at) for records matching filters.
+
+    The pair only serves as a cache validator. Archived years are immutable,
+    so their stored whole-year summary stands in for a query against the
+    archive.
+    """
+    sess = getattr(storage, "_DBStorage__session", None)
+    if sess is None:
+        return 0, None
+    year = filters.get("year")
+    archived = storage.archived_years()
+    count, latest = 0, None
+    if not year or year not in archived:
+        q = sess.query(func.count(Record.id), func.max(Record.updated_at))
+        count, latest = _record_filters(q, **filters).one()
+    for archived_year, summary in archived.items():
+        if year and archived_year != year:
+            continue
+        count += summary.rows
+        if summary.last_modified and (latest is None or summary.last_modified > latest):
+            latest = summary.last_modified
+    return count, latest
+
+
+def record_stats(year: Optional[int] = None) -> Dict[str, int]:
+    """Return the summary counts shown on the client dashboard."""
+    sess = getattr(storage, "_DBStorage__session", None)
+    if sess is None:
+        return {"total": 0, "this_year": 0, "pending": 0}
+    year = year or datetime.utcnow().year
+    archived = storage.archived_years()
+    total = sess.query(func.count(Record.id)).scalar() or 0
+    if year in archived:
+        this_year = archived[year].rows
+    else:
+        this_year = sess.query(func.count(Record.id)).filter(
+            Record.year == year).scalar() or 0
+    pending = sess.query(func.count(Record.id)).filter(
+        Record.status == "Pending").scalar() or 0
+    total += sum(a.rows for a in archived.values())
+    pending += sum(a.pending for a in archived.values())
+    return {"total": total, "this_year": this_year, "pending": pending}
+
+
+FACET_FIELDS = ("year", "department", "lga", "status")
+
+
+def record_facets(year: Optional[int] = None, department: Optional[str] = None,
+                  lga: Optional[str] = None, status: Optional[str] = None,
+                  keyword: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """Return distinct values with counts for each filterable field.
+
+    Each field is counted with every *other* selected filter applied, so a
+    client can show how many records each alternative would return. Values
+    that exist but match nothing under the current selection are reported
+    with a count of 0.
+
+    All facets are derived from one GROUP BY over the facet columns per
+    partition, which the ix_records_facets index answers without touching
+    the table.
+    """
+    selected = {"year": year, "department": department, "lga": lga,
+                "status": status}
+    facets = {field: {} for field in FACET_FIELDS}
+    sess = getattr(storage, "_DBStorage__session", None)
+    if sess is None:
+        return {field: [] for field in FACET_FIELDS}
+
+    columns = [getattr(Record, field) for field in FACET_FIELDS]
+    for part in storage.partition_sessions():
+        q = part.query(*columns, func.count(Record.id)).group_by(*columns)
+        _accumulate_facets(facets, selected, _record_filters(q, keyword=keyword))
+
+    return {
+        field: [{"value": value, "count": count}
+                for value, count in sorted(facets[field].items())]
+        for field in FACET_FIELDS
+    }
+
+
+def _accumulate_facets(facets: Dict[str, Dict[Any, int]], selected: Dict[str, Any],
+                       rows) -> None:
+    """Add grouped (facet values..., count) rows into the per-field counts."""
+    for row in rows:
+        values = dict(zip(FACET_FIELDS, row[:-1]))
+        count = row[-1]
+        for field in FACET_FIELDS:
+            value = values[field]
+            if value is None:
+                continue
+            matches = all(
+                not selected[other] or values[other] == selected[other]
+                for other in FACET_FIELDS if other != field
+            )
+            facets[field][value] = facets[field].get(value, 0) + (count if matches else 0)
+
+
+def get_record_by_id(record_id: int) -> Optional[Record]:
+    """Retrieve a Record by its id."""
+    try:
+        return storage.get(Record, record_id)
+    except Exception:
+        return None
+
+
+def list_partitions() -> List[Dict[str, Any]]:
+    """Return one entry per year with its row count and where it is stored."""
+    sess = getattr(storage, "_DBStorage__session", None)
+    if sess is None:
+        return []
+    partitions = {
+        year: {"year": year, "rows": rows, "archived": False}
+        for year, rows in sess.query(Record.year, func.count(Record.id)).group_by(Record.year)
+    }
+    for year, archived in storage.archived_years().items():
+        partitions[year] = {**archived.to_dict(), "archived": True}
+    return [partitions[year] for year in sorted(partitions)]
+
+
+def snapshot_records() -> Dict[str, Any]:
+    """Write an analytics snapshot of every year; return its manifest.
+
+    Each year is versioned by its row count and latest change, so years that
+    did not change since the last snapshot are not read again.
+    """
+    columns = [c.key for c in RECORD_COLUMNS]
+    sources = []
+    for partition in list_partitions():
+        year = partition["year"]
+        count, latest = record_version(year=year)
+        version = [count, latest.isoformat() if latest else None]
+        # Streamed, so memory does not grow with the size of a year
+        stmt = select(*RECORD_COLUMNS).where(Record.year == year).order_by(Record.id)
+        sources.append((year, version,
+                        lambda stmt=stmt, year=year, archived=partition["archived"]: (
+                            columns, storage.stream(stmt, archived_year=year if archived else None))))
+    return analytics.write_snapshot(sources)
+
+
+def find_record(record_id: int) -> Optional[Record]:
+    """Retrieve a Record by id from the live table or any archived year.
+
+    Archived records come back detached and must be treated as read-only.
+    """
+    record = get_record_by_id(record_id)
+    if record is not None or getattr(storage, "_DBStorage__session", None) is None:
+        return record
+    for sess in storage.partition_sessions():
+        if sess is getattr(storage, "_DBStorage__session"):
+            continue
+        record = sess.get(Record, record_id)
+        if record is not None:
+            return record
+    return None
+
+
+def is_archived(year: int) -> bool:
+    """Tell whether year has been moved to a read-only archive."""
+    return year in storage.archived_years()
+
+
+def get_document(sha256: str) -> Optional[Document]:
+    """Retrieve stored document metadata by digest."""
+    sess = getattr(storage, "_DBStorage__session", None)
+    if sess is None:
+        return None
+    return sess.query(Document).filter_by(sha256=sha256).first()
+
+
+def attach_document(record_id: int, sha256: str, size: int,
+                    content_type: Optional[str] = None,
+                    filename: Optional[str] = None) -> Optional[Record]:
+    """Link a stored blob to a record, registering the blob if it is new.
+
+    Returns the updated record, or None if the record does not exist.
+    """
+    record = get_record_by_id(record_id)
+    if record is None:
+        return None
+    with storage.transaction():
+        if get_document(sha256) is None:
+            doc = Document()
+            doc.sha256 = sha256
+            doc.size = size
+            doc.content_type = content_type
+            try:
+                with storage.savepoint():
+                    storage.new(doc)
+                    storage.save()
+            except IntegrityError:
+                pass  # a concurrent upload of the same blob registered it first
+        record.document_sha256 = sha256
+        record.document_name = filename
+    return record
+
+
+def get_upload(sha256: str, year: int) -> Optional[Upload]:
+    """Return the Upload of the workbook with sha256 into year, if any."""
+    sess = getattr(storage, "_DBStorage__session", None)
+    if sess is None:
+        return None
+    return sess.query(Upload).filter_by(sha256=sha256, year=year).first()
+
+
+def list_audit_events(account_id: Optional[int] = None, username: Optional[str] = None,
+                      action: Optional[str] = None, since: Optional[datetime] = None,
+                      until: Optional[datetime] = None, limit: int = 100,
+                      offset: int = 0) -> List[AuditEventRow]:
+    """Return audit entries as compact rows, newest first, with detail decoded.
+
+    action matches a prefix ("account" matches "account.update").
+    """
+    sess = getattr(storage, "_DBStorage__session", None)
+    if sess is None:
+        return []
+    q = sess.query(*AUDIT_COLUMNS)
+    if account_id is not None:
+        q = q.filter(AuditEvent.account_id == account_id)
+    if username:
+        q = q.filter(AuditEvent.username == username)
+    if action:
+        q = q.filter((AuditEvent.action == action)
+                     | AuditEvent.action.startswith(action + ".", autoescape=True))
+    if since is not None:
+        q = q.filter(AuditEvent.at >= since)
+    if until is not None:
+        q = q.filter(AuditEvent.at < until)
+    q = q.order_by(AuditEvent.at.desc(), AuditEvent.id.desc()).offset(offset).limit(limit)
+    return [AuditEventRow(*r[:-1], json.loads(r.detail) if r.detail else None) for r in q]
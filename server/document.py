@@ -0,0 +1,27 @@
+#!/usr/bin/python3
+"""Document SQLAlchemy model for EDMS"""
+from datetime import datetime
+from sqlalchemy import Column, BigInteger, String, DateTime
+from server.base import Base
+
+
+class Document(Base):
+    """Metadata for a stored blob, keyed by its SHA-256 digest.
+
+    Several records may point at the same document when identical files are
+    uploaded; the bytes themselves live once in the blob store.
+    """
+    __tablename__ = "documents"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    content_type = Column(String(128), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            "sha256": self.sha256,
+            "size": self.size,
+            "content_type": self.content_type,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
@@ -0,0 +1,249 @@
+#!/usr/bin/python3
+"""Columnar snapshots of the records table for reporting.
+
+A snapshot copies every year of records into its own Parquet file
+(``snapshots/<id>/year=<year>/records.parquet``) and is published by
+rewriting the ``CURRENT`` pointer, so readers always see a complete
+snapshot. Years whose contents did not change since the previous snapshot
+are hard-linked instead of rewritten, which keeps the nightly run cheap
+once old years settle.
+
+Reports are group-by counts over the snapshot, answered by DuckDB when it
+is installed and by PyArrow's compute kernels otherwise. Only the files of
+the requested year are read, and none of the work touches the database.
+pyarrow is needed for snapshots; without it analytics is unavailable.
+Both libraries are imported on first use so they do not slow server start.
+"""
+import importlib.util
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from os import getenv
+from pathlib import Path
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshots are only serialised per process
+    fcntl = None
+
+# Columns reports may group or filter by
+DIMENSIONS = ("year", "department", "lga", "status")
+
+SNAPSHOT_FILE = "records.parquet"
+MANIFEST_FILE = "manifest.json"
+
+
+class AnalyticsUnavailable(Exception):
+    """Raised when no snapshot exists or pyarrow is not installed."""
+
+
+# Rows per Parquet row group; a year is converted this many rows at a time
+SNAPSHOT_BATCH_ROWS = int(getenv("EDMS_SNAPSHOT_BATCH", "65536"))
+
+# A year to snapshot: (year, version, loader). version is any JSON-able value
+# that changes when the year's records change; loader returns (columns, rows)
+# where rows may be a lazy iterable of tuples.
+SnapshotSource = Tuple[int, Any, Callable[[], Tuple[List[str], Iterable[tuple]]]]
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def _arrow():
+    """Import and return (pyarrow, pyarrow.compute, pyarrow.parquet)."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    return pa, pc, pq
+
+
+def _arrow_schema(columns: Sequence[str]):
+    pa = _arrow()[0]
+    types = {
+        "id": pa.int64(),
+        "year": pa.int32(),
+        "created_at": pa.timestamp("us"),
+        "updated_at": pa.timestamp("us"),
+    }
+    return pa.schema([(name, types.get(name, pa.string())) for name in columns])
+
+
+class AnalyticsStore:
+    """Writes Parquet snapshots and runs group-by reports over the current one."""
+
+    def __init__(self, root: Optional[str] = None, engine: Optional[str] = None,
+                 keep: Optional[int] = None):
+        self.root = Path(root or getenv("EDMS_ANALYTICS_DIR") or "./analytics")
+        self.snapshots_dir = self.root / "snapshots"
+        self.engine = engine or getenv("EDMS_ANALYTICS_ENGINE") or (
+            "duckdb" if _installed("duckdb") else "arrow")
+        self.keep = max(1, keep or int(getenv("EDMS_ANALYTICS_KEEP", "2")))
+        self._write_lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return _installed("pyarrow")
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        """Return the manifest of the published snapshot, or None."""
+        try:
+            name = (self.root / "CURRENT").read_text().strip()
+            with open(self.snapshots_dir / name / MANIFEST_FILE) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_snapshot(self, sources: Iterable[SnapshotSource]) -> Dict[str, Any]:
+        """Write a new snapshot from sources and publish it; return its manifest."""
+        if not self.available:
+            raise AnalyticsUnavailable("pyarrow is not installed")
+        pa, _, pq = _arrow()
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._write_lock, open(self.root / ".lock", "a") as lock_file:
+            if fcntl is not None:
+                # Serialise snapshot runs across worker processes too
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            previous = self.current()
+            previous_years = previous["years"] if previous else {}
+            generated_at = datetime.utcnow()
+            name = generated_at.strftime("%Y%m%dT%H%M%S%f")
+            target = self.snapshots_dir / name
+            target.mkdir(parents=True)
+            manifest = {"snapshot": name, "generated_at": generated_at.isoformat(),
+                        "years": {}}
+            try:
+                for year, version, load in sources:
+                    dest = target / f"year={int(year)}" / SNAPSHOT_FILE
+                    dest.parent.mkdir()
+                    entry = previous_years.get(str(year))
+                    if entry and entry["version"] == version and self._reuse(
+                            previous["snapshot"], year, dest):
+                        manifest["years"][str(year)] = entry
+                        continue
+                    columns, rows = load()
+                    count = self._write_year(dest, columns, rows)
+                    manifest["years"][str(year)] = {"version": version, "rows": count}
+                with open(target / MANIFEST_FILE, "w") as f:
+                    json.dump(manifest, f)
+                pointer = self.root / "CURRENT.tmp"
+                pointer.write_text(name)
+                os.replace(pointer, self.root / "CURRENT")
+            except BaseException:
+                shutil.rmtree(target, ignore_errors=True)
+                raise
+            self._prune(name)
+        return manifest
+
+    def _write_year(self, dest: Path, columns: Sequence[str], rows: Iterable[tuple]) -> int:
+        """Write rows to a Parquet file one row group at a time; return the count."""
+        pa, _, pq = _arrow()
+        schema = _arrow_schema(columns)
+        rows = iter(rows)
+        count = 0
+        with pq.ParquetWriter(dest, schema, compression="zstd") as writer:
+            while True:
+                batch = list(islice(rows, SNAPSHOT_BATCH_ROWS))
+                if not batch:
+                    break
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(values, type=field.type)
+                     for values, field in zip(zip(*batch), schema)],
+                    schema=schema))
+                count += len(batch)
+        return count
+
+    def _reuse(self, snapshot: str, year: int, dest: Path) -> bool:
+        """Link the previous snapshot's file for an unchanged year into dest."""
+        src = self.snapshots_dir / snapshot / f"year={int(year)}" / SNAPSHOT_FILE
+        try:
+            os.link(src, dest)
+        except OSError:
+            try:
+                shutil.copyfile(src, dest)
+            except OSError:
+                return False
+        return True
+
+    def _prune(self, current: str) -> None:
+        """Delete all but the newest keep snapshots."""
+        names = sorted(p.name for p in self.snapshots_dir.iterdir() if p.is_dir())
+        for name in names[:-self.keep]:
+            if name != current:
+                shutil.rmtree(self.snapshots_dir / name, ignore_errors=True)
+
+    def query(self, group_by: Sequence[str] = (), **filters) -> Dict[str, Any]:
+        """Count records (and attached documents) per combination of group_by.
+
+        filters maps dimensions to required values; falsy values are ignored.
+        Raises ValueError for unknown dimensions and AnalyticsUnavailable when
+        there is no snapshot to read.
+        """
+        group_by = list(dict.fromkeys(group_by))
+        unknown = [d for d in list(group_by) + list(filters) if d not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"unknown dimension: {', '.join(unknown)}")
+        filters = {k: v for k, v in filters.items() if v}
+        manifest = self.current()
+        if not self.available or manifest is None:
+            raise AnalyticsUnavailable("no analytics snapshot available")
+
+        # Prune to the requested year's file before either engine runs
+        base = self.snapshots_dir / manifest["snapshot"]
+        years = [y for y in manifest["years"]
+                 if "year" not in filters or int(y) == int(filters["year"])]
+        files = [str(base / f"year={y}" / SNAPSHOT_FILE) for y in years]
+        if self.engine == "duckdb" and _installed("duckdb"):
+            rows = self._query_duckdb(files, group_by, filters)
+            engine = "duckdb"
+        else:
+            rows = self._query_arrow(files, group_by, filters)
+            engine = "arrow"
+        return {"snapshot": manifest["snapshot"], "generated_at": manifest["generated_at"],
+                "engine": engine, "group_by": group_by, "rows": rows}
+
+    @staticmethod
+    def _query_duckdb(files: List[str], group_by: List[str],
+                      filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if not files:
+            return [] if group_by else [{"records": 0, "documents": 0}]
+        import duckdb
+        select = [f'"{d}"' for d in group_by]
+        sql = (f"SELECT {', '.join(select + ['count(*) AS records', 'count(document_sha256) AS documents'])} "
+               "FROM read_parquet(?)")
+        params: List[Any] = [files]
+        if filters:
+            sql += " WHERE " + " AND ".join(f'"{d}" = ?' for d in filters)
+            params.extend(int(v) if d == "year" else v for d, v in filters.items())
+        if group_by:
+            sql += f" GROUP BY {', '.join(select)} ORDER BY {', '.join(select)}"
+        with duckdb.connect() as conn:
+            cursor = conn.execute(sql, params)
+            names = [c[0] for c in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    @staticmethod
+    def _query_arrow(files: List[str], group_by: List[str],
+                     filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        pa, pc, pq = _arrow()
+        columns = list(dict.fromkeys(group_by + list(filters) + ["document_sha256"]))
+        tables = [pq.read_table(path, columns=columns) for path in files]
+        if not tables:
+            return [] if group_by else [{"records": 0, "documents": 0}]
+        table = pa.concat_tables(tables)
+        for dimension, value in filters.items():
+            table = table.filter(pc.equal(table[dimension],
+                                          int(value) if dimension == "year" else value))
+        if not group_by:
+            return [{"records": table.num_rows,
+                     "documents": pc.count(table["document_sha256"]).as_py()}]
+        result = table.group_by(group_by).aggregate([
+            ([], "count_all"), ("document_sha256", "count")])
+        result = result.sort_by([(d, "ascending") for d in group_by])
+        return [{**{d: row[d] for d in group_by}, "records": row["count_all"],
+                 "documents": row["document_sha256_count"]}
+                for row in result.to_pylist()]
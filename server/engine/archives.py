@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+"""Compressed, read-only archive partitions for cold years of records.
+
+Each archived year lives in its own SQLite database holding a ``records``
+table with the live schema (and its indexes), gzip-compressed on disk as
+``records_<year>.sqlite.gz``. To query a year the file is decompressed once
+into a cache directory and opened read-only, so the ORM queries used for
+the live table run unchanged against it.
+
+Another worker may restore and re-archive a year at any time, so each
+cached engine remembers which archive file it was opened from (inode,
+mtime, size) and is reopened when the file on disk differs.
+"""
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+from os import getenv
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.engine import Engine
+
+from server.record import Record
+
+INSERT_BATCH = 1000
+
+
+class ArchiveStore:
+    """Write, open and remove per-year archive files under root."""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or getenv("EDMS_ARCHIVE_DIR") or "./archive")
+        self.cache_dir = self.root / ".cache"
+        self._engines: Dict[int, Tuple[Engine, Tuple[int, int, int]]] = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, year: int) -> Path:
+        return self.root / f"records_{int(year)}.sqlite.gz"
+
+    def exists(self, year: int) -> bool:
+        return self.path_for(year).is_file()
+
+    def write(self, year: int, rows: Iterable[Dict]) -> int:
+        """Write rows (column dicts) as the archive of year; return its size.
+
+        The database is built in a temporary file, compacted and compressed,
+        then renamed into place so a half-written archive is never visible.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, db_path = tempfile.mkstemp(dir=self.root, suffix=".sqlite")
+        os.close(fd)
+        final = self.path_for(year)
+        tmp_gz = final.with_suffix(".gz.tmp")
+        try:
+            engine = create_engine(f"sqlite:///{db_path}", future=True)
+            try:
+                Record.__table__.create(engine)
+                with engine.begin() as conn:
+                    batch: List[Dict] = []
+                    for row in rows:
+                        batch.append(row)
+                        if len(batch) >= INSERT_BATCH:
+                            conn.execute(insert(Record.__table__), batch)
+                            batch = []
+                    if batch:
+                        conn.execute(insert(Record.__table__), batch)
+                with engine.connect() as conn:
+                    conn.exec_driver_sql("VACUUM")
+            finally:
+                engine.dispose()
+            with open(db_path, "rb") as src, gzip.open(tmp_gz, "wb", compresslevel=9) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+            os.chmod(tmp_gz, 0o444)
+            with self._lock:
+                self._forget(year)
+                os.replace(tmp_gz, final)
+        finally:
+            for leftover in (db_path, tmp_gz):
+                try:
+                    os.unlink(leftover)
+                except FileNotFoundError:
+                    pass
+        return final.stat().st_size
+
+    def engine(self, year: int) -> Engine:
+        """Return a read-only engine over the current archive of year."""
+        try:
+            st = self.path_for(year).stat()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"no archive for {year}") from None
+        signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._engines.get(year)
+            if cached is not None and cached[1] == signature:
+                return cached[0]
+            if cached is not None:
+                # Replaced by another worker since it was opened
+                self._engines.pop(year)
+                cached[0].dispose()
+            path = self._extract(year)
+            engine = create_engine(
+                f"sqlite:///file:{path}?mode=ro&immutable=1&uri=true", future=True)
+            self._engines[year] = (engine, signature)
+            return engine
+
+    def close(self, year: int) -> None:
+        """Drop this process's engine for year; the next query reopens it.
+
+        The extracted copy is kept, since other workers may be reading it.
+        """
+        with self._lock:
+            cached = self._engines.pop(year, None)
+        if cached is not None:
+            cached[0].dispose()
+
+    def remove(self, year: int) -> None:
+        with self._lock:
+            self._forget(year)
+        path = self.path_for(year)
+        if path.exists():
+            os.chmod(path, 0o644)
+            path.unlink()
+
+    def dispose(self) -> None:
+        """Forget engines inherited from a parent process (after fork)."""
+        with self._lock:
+            engines, self._engines = self._engines, {}
+        for engine, _ in engines.values():
+            engine.dispose(close=False)
+
+    def _extract(self, year: int) -> Path:
+        """Decompress the archive of year into the cache unless it is current."""
+        src = self.path_for(year)
+        if not src.is_file():
+            raise FileNotFoundError(f"no archive for {year}")
+        dest = self.cache_dir / f"records_{int(year)}.sqlite"
+        if dest.is_file() and dest.stat().st_mtime_ns >= src.stat().st_mtime_ns:
+            return dest
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir)
+        with gzip.open(src, "rb") as f, os.fdopen(fd, "wb") as out:
+            shutil.copyfileobj(f, out, 1024 * 1024)
+        os.replace(tmp, dest)
+        return dest
+
+    def _forget(self, year: int) -> None:
+        """Drop the cached engine and extracted copy of year (lock held)."""
+        cached = self._engines.pop(year, None)
+        if cached is not None:
+            cached[0].dispose()
+        cached = self.cache_dir / f"records_{int(year)}.sqlite"
+        if cached.exists():
+            cached.unlink()
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+"""Batched, append-only audit trail.
+
+record() only appends an entry to an in-memory ring buffer, so auditing a
+request adds no database work to it. A background thread writes the
+buffer to the ``audit_events`` table, one transaction per batch, every
+EDMS_AUDIT_FLUSH_SECONDS or as soon as EDMS_AUDIT_BATCH entries are
+waiting. If writes fail the entries stay buffered and are retried; only
+when the buffer (EDMS_AUDIT_BUFFER entries) overflows are entries lost,
+and the loss is reported.
+"""
+import json
+import threading
+from collections import deque
+from datetime import datetime
+from os import getenv
+from typing import Any, Dict, List, Optional
+
+from server.audit import AuditEvent
+
+
+class AuditLog:
+    """Ring buffer of audit entries drained by a writer thread."""
+
+    def __init__(self, storage, buffer_size: Optional[int] = None,
+                 batch_size: Optional[int] = None, interval: Optional[float] = None):
+        self.storage = storage
+        self.batch_size = batch_size or int(getenv("EDMS_AUDIT_BATCH", "200"))
+        self.interval = interval or float(getenv("EDMS_AUDIT_FLUSH_SECONDS", "2"))
+        self._buffer: deque = deque(maxlen=buffer_size or int(getenv("EDMS_AUDIT_BUFFER", "10000")))
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def record(self, action: str, account_id: Optional[int] = None,
+               username: Optional[str] = None, target: Any = None,
+               address: Optional[str] = None, **detail) -> None:
+        """Queue one entry; detail is stored as a JSON object."""
+        entry = {
+            "at": datetime.utcnow(),
+            "account_id": account_id,
+            "username": username,
+            "action": action,
+            "target": None if target is None else str(target)[:255],
+            "address": address,
+            "detail": json.dumps(detail, default=str, separators=(",", ":")) if detail else None,
+        }
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(entry)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def flush(self) -> int:
+        """Write everything buffered so far; return how many entries were written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    count = min(self.batch_size, len(self._buffer))
+                    batch: List[Dict[str, Any]] = [self._buffer.popleft() for _ in range(count)]
+                    dropped, self.dropped = self.dropped, 0
+                if dropped:
+                    print(f"Audit buffer overflowed; {dropped} entries were lost")
+                if not batch:
+                    return written
+                try:
+                    self.storage.insert_rows(AuditEvent.__table__, batch)
+                except Exception as e:
+                    print("Audit write failed, will retry:", e)
+                    with self._lock:
+                        # Put the batch back in front of newer entries
+                        overflow = len(self._buffer) + len(batch) - self._buffer.maxlen
+                        self._buffer.extendleft(reversed(batch))
+                        self.dropped += max(overflow, 0)
+                    return written
+                written += len(batch)
+
+    def start(self) -> None:
+        """Start the writer thread (once per process; call after forking)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        """Stop the writer after a final flush."""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+        self.flush()
@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+"""Content-addressed storage for scanned documents.
+
+Blobs are stored on local disk under their SHA-256 digest, sharded into two
+levels of sub-directories (``ab/cd/abcd...``) so no directory grows too
+large. Identical uploads hash to the same path and are stored once.
+
+Writes stream into a temporary file while hashing and are moved into place
+with an atomic rename, so readers never see partial blobs.
+"""
+import hashlib
+import os
+import tempfile
+from os import getenv
+from pathlib import Path
+from typing import Optional
+
+
+class BlobTooLarge(Exception):
+    """Raised when a blob exceeds the configured maximum size."""
+
+
+class BlobWriter:
+    """Incrementally hash and write one blob to a temporary file."""
+
+    def __init__(self, store: "BlobStore", max_bytes: Optional[int] = None):
+        self._store = store
+        self._max_bytes = max_bytes
+        self._hash = hashlib.sha256()
+        self.size = 0
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.tmp_dir)
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self._max_bytes is not None and self.size > self._max_bytes:
+            self.abort()
+            raise BlobTooLarge(f"blob exceeds {self._max_bytes} bytes")
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self) -> "tuple[str, int, bool]":
+        """Move the blob into place. Returns (sha256, size, created).
+
+        ``created`` is False when an identical blob was already stored, in
+        which case the temporary copy is discarded.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        digest = self._hash.hexdigest()
+        final = self._store.path_for(digest)
+        if final.exists():
+            os.unlink(self._tmp_path)
+            return digest, self.size, False
+        final.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self._tmp_path, final)
+        return digest, self.size, True
+
+    def abort(self) -> None:
+        """Discard the partially written blob."""
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+
+
+class BlobStore:
+    """SHA-256 keyed blob store on the local filesystem."""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or getenv("EDMS_BLOB_DIR") or "./blobs")
+        self.tmp_dir = self.root / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, digest: str) -> Path:
+        """Return the sharded path where the blob with digest lives."""
+        digest = digest.lower()
+        if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            raise ValueError("invalid sha256 digest")
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def exists(self, digest: str) -> bool:
+        return self.path_for(digest).exists()
+
+    def writer(self, max_bytes: Optional[int] = None) -> BlobWriter:
+        """Start writing a new blob; call commit() or abort() when done."""
+        return BlobWriter(self, max_bytes=max_bytes)
+
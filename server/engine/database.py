@@ -4,19 +4,98 @@
 This file provides a small wrapper used by the rest of the project. It defaults
 to a local SQLite file for development when EDMS_MYSQL_DB is not provided. It
 imports project models (e.g. Account) so SQLAlchemy metadata is registered and
-created on reload().
+created on reload(). reload() only runs create_all when the models changed
+since the last start: a fingerprint of the metadata is kept in the
+``edms_schema`` table, so a routine start costs a single small query.
+Columns added to a model later are added to its existing table then too.
+
+Records are grouped by year, but live years share the one ``records``
+table: year filters are pruned by its year-leading indexes, not by
+database partitions, and dropping a live year is a DELETE. Only cold
+years are split off, archived to compressed read-only files (see
+server.engine.archives) that can be restored or dropped as a unit.
+partition_sessions() yields the live table and only the archives a query
+can touch.
+
+Writes that belong together go through transaction(), which commits once
+when the outermost block exits; save() inside it only flushes. savepoint()
+lets one row of a bulk operation fail without losing the others.
+
+Exports read through stream(), which fetches rows in batches instead of
+loading the whole result.
 """
 
+import hashlib
+from contextlib import contextmanager
+from datetime import datetime
 from os import getenv
-from typing import Optional
+from typing import Dict, Iterator, Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import (Column, MetaData, String, Table, create_engine, delete, event,
+                        func, insert, inspect, select, text)
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import scoped_session, sessionmaker, Session as SASession
 
 # Import Base and models so metadata is populated
 from server.base import Base
 # Import models that should be registered in metadata
 from server.account import Account  # ensure the Account table exists
+from server.document import Document  # ensure the Document table exists
+from server.record import Record  # ensure the Record table exists
+from server.upload import Upload  # ensure the Upload table exists
+from server.partition import ArchivedYear  # ensure the ArchivedYear table exists
+from server.audit import AuditEvent  # ensure the AuditEvent table exists
+from server.engine.archives import ArchiveStore
+
+
+# Rows fetched per round trip by stream()
+STREAM_BATCH_SIZE = int(getenv("EDMS_STREAM_BATCH", "1000"))
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL so readers in other processes do not block the writer."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+# Kept outside Base.metadata so it is not part of its own fingerprint
+_schema_table = Table("edms_schema", MetaData(),
+                      Column("fingerprint", String(40), primary_key=True))
+
+
+def schema_fingerprint(metadata=Base.metadata) -> str:
+    """Hash the tables, columns and indexes the models declare."""
+    parts = []
+    for table in sorted(metadata.tables.values(), key=lambda t: t.name):
+        parts.append(table.name)
+        for column in table.columns:
+            parts.append(f"{column.name}:{column.type!r}:{column.nullable}:{column.primary_key}")
+        parts.extend(sorted(index.name or "" for index in table.indexes))
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def _add_missing_columns(engine) -> None:
+    """ALTER existing tables to add model columns they lack.
+
+    create_all only creates missing tables. A column added to a model later
+    must be nullable or have a server_default.
+    """
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        preparer = conn.dialect.identifier_preparer
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    definition = CreateColumn(column).compile(dialect=conn.dialect)
+                    conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} "
+                                      f"ADD COLUMN {definition}"))
 
 
 class DBStorage:
@@ -29,14 +108,52 @@ class DBStorage:
     def __init__(self):
         db_url = getenv("EDMS_MYSQL_DB") or "sqlite:///./edms.db"
         # support URLs like sqlite:///./edms.db or a full postgres/mysql URL
-        self.__engine = create_engine(db_url, echo=False, future=True)
+        connect_args = {}
+        if db_url.startswith("sqlite"):
+            # Several worker processes may write; wait for locks instead of failing
+            connect_args["timeout"] = 30
+        self.__engine = create_engine(db_url, echo=False, future=True,
+                                      connect_args=connect_args)
+        self.__sqlite = db_url.startswith("sqlite")
+        if self.__sqlite:
+            event.listen(self.__engine, "connect", _sqlite_pragmas)
         self.__session_factory = scoped_session(sessionmaker(bind=self.__engine, expire_on_commit=False))
-        self.__session: Optional[SASession] = None
+        # Sessions connect lazily, so nothing touches the database until the
+        # first query
+        self.__session: Optional[SASession] = self.__session_factory
+        self.__archives = ArchiveStore()
+
+    def reload(self) -> bool:
+        """Bring the schema up to date; return True if tables were created.
 
-    def reload(self):
-        """Create tables and prepare a session factory."""
-        Base.metadata.create_all(self.__engine)
-        self.__session = self.__session_factory
+        Does nothing beyond reading the stored fingerprint when it matches
+        the models.
+        """
+        fingerprint = schema_fingerprint()
+        if self.stored_schema_fingerprint() == fingerprint:
+            return False
+        try:
+            Base.metadata.create_all(self.__engine)
+            _add_missing_columns(self.__engine)
+        except DBAPIError:
+            # Another worker may have been creating the same tables
+            if self.stored_schema_fingerprint() == fingerprint:
+                return False
+            Base.metadata.create_all(self.__engine)
+            _add_missing_columns(self.__engine)
+        with self.__engine.begin() as conn:
+            _schema_table.create(conn, checkfirst=True)
+            conn.execute(delete(_schema_table))
+            conn.execute(insert(_schema_table).values(fingerprint=fingerprint))
+        return True
+
+    def stored_schema_fingerprint(self) -> Optional[str]:
+        """Return the fingerprint recorded by the last reload(), if any."""
+        try:
+            with self.__engine.connect() as conn:
+                return conn.execute(select(_schema_table.c.fingerprint)).scalar()
+        except DBAPIError:
+            return None  # no edms_schema table yet
 
     def new(self, obj):
         """Add obj to current session."""
@@ -45,19 +162,93 @@ class DBStorage:
         self.__session.add(obj)
 
     def save(self):
-        """Commit current session."""
+        """Commit current session (only flush it inside transaction())."""
         if self.__session is None:
             self.reload()
-        self.__session.commit()
+        if self.in_transaction():
+            self.__session.flush()
+        else:
+            self.__session.commit()
 
     def delete(self, obj=None):
-        """Delete obj from session if provided."""
+        """Mark obj for deletion; it is removed by the next save()."""
         if obj is None:
             return
         if self.__session is None:
             self.reload()
         self.__session.delete(obj)
-        self.__session.commit()
+
+    def in_transaction(self) -> bool:
+        """True inside a transaction() block on this thread."""
+        return self.__session.info.get("transaction_depth", 0) > 0
+
+    @contextmanager
+    def transaction(self) -> Iterator[SASession]:
+        """Run a block of writes as one unit of work.
+
+        The outermost block commits once when it exits and rolls everything
+        back if it raises; nested blocks just join it. Yields the session.
+        """
+        if self.__session is None:
+            self.reload()
+        session = self.__session
+        depth = session.info.get("transaction_depth", 0)
+        session.info["transaction_depth"] = depth + 1
+        try:
+            yield session
+            if depth == 0:
+                session.commit()
+        except BaseException:
+            if depth == 0:
+                session.rollback()
+            raise
+        finally:
+            session.info["transaction_depth"] = depth
+
+    @contextmanager
+    def savepoint(self) -> Iterator[SASession]:
+        """Undo only this block's writes if it raises (the error propagates).
+
+        Use inside transaction() so a failing row of a bulk write leaves the
+        rows before it to be committed with the rest.
+        """
+        session = self.__session
+        if self.__sqlite:
+            # pysqlite only opens a transaction before DML, so a SAVEPOINT
+            # issued first would start (and its RELEASE commit) one of its own
+            connection = session.connection()
+            if not connection.connection.dbapi_connection.in_transaction:
+                connection.exec_driver_sql("BEGIN")
+        with session.begin_nested():
+            yield session
+
+    def insert_rows(self, table, rows) -> None:
+        """Insert rows (column dicts) into table in one transaction.
+
+        Uses its own connection rather than the thread's session, so
+        background writers never share a transaction with a request.
+        """
+        if rows:
+            with self.__engine.begin() as conn:
+                conn.execute(insert(table), rows)
+
+    def stream(self, statement, archived_year: Optional[int] = None,
+               batch_size: Optional[int] = None) -> Iterator[Row]:
+        """Yield the rows of a select statement a batch at a time.
+
+        stream_results asks the driver for a server-side cursor (MySQL,
+        PostgreSQL; SQLite steps through results anyway) and yield_per keeps
+        only batch_size rows buffered, so memory use does not grow with the
+        result. Runs on its own connection, held until the generator is
+        exhausted or closed, so it is safe to drain from a response body.
+        archived_year reads that year's archive instead of the live tables.
+        """
+        engine = self.__archives.engine(archived_year) if archived_year else self.__engine
+        with engine.connect() as conn:
+            result = conn.execution_options(
+                stream_results=True,
+                yield_per=batch_size or STREAM_BATCH_SIZE).execute(statement)
+            yield from result
 
     def get(self, cls, id):
         """Return an instance of cls by primary key id or None."""
@@ -78,3 +269,172 @@ class DBStorage:
         """Remove the scoped session."""
         if self.__session is not None:
             self.__session.remove()
+
+    def dispose(self):
+        """Drop pooled connections inherited from a parent process.
+
+        Call in each worker after fork when the app was preloaded; the
+        parent's connections are left open for the parent to use.
+        """
+        self.__engine.dispose(close=False)
+        self.__archives.dispose()
+
+    def forget_archive(self, year: int) -> None:
+        """Reopen the archive of year on its next use in this process."""
+        self.__archives.close(year)
+
+    def archived_years(self) -> Dict[int, ArchivedYear]:
+        """Return the archived partitions keyed by year."""
+        if self.__session is None:
+            self.reload()
+        return {a.year: a for a in self.__session.query(ArchivedYear)}
+
+    def partition_sessions(self, year: Optional[int] = None) -> Iterator[SASession]:
+        """Yield a session for each partition holding records of year.
+
+        With a year only that year's partition is visited: the live session,
+        or a read-only session over the year's archive. Without one the live
+        session comes first, followed by every archive.
+        """
+        if self.__session is None:
+            self.reload()
+        archived = self.archived_years()
+        if year and year not in archived:
+            yield self.__session
+            return
+        if not year:
+            yield self.__session
+        for archived_year in sorted(archived):
+            if year and archived_year != year:
+                continue
+            session = SASession(bind=self.__archives.engine(archived_year))
+            try:
+                yield session
+            finally:
+                session.close()
+
+    def _lock_year(self, session: SASession, year: int) -> None:
+        """Start a transaction that keeps other writers off year's records.
+
+        SQLite takes its database write lock up front (BEGIN IMMEDIATE);
+        PostgreSQL locks the table against writes; MySQL locks the year's
+        rows and, through the year index, the gaps new rows would go in.
+        """
+        session.commit()
+        connection = session.connection()
+        dialect = connection.dialect.name
+        if dialect == "sqlite":
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        elif dialect == "postgresql":
+            connection.exec_driver_sql("LOCK TABLE records IN SHARE ROW EXCLUSIVE MODE")
+        else:
+            session.execute(select(Record.id).where(Record.year == year).with_for_update())
+
+    def archive_year(self, year: int) -> ArchivedYear:
+        """Move the live records of year into a compressed archive.
+
+        The rows are copied without blocking writers. Then, under a write
+        lock, the year's count and latest change are checked against the
+        copy before the live rows are deleted, so nothing written in
+        between is lost. Raises ValueError if the year is already
+        archived, has no records, or changed while it was being copied.
+        """
+        if self.__session is None:
+            self.reload()
+        session = self.__session
+        if session.get(ArchivedYear, year) is not None:
+            raise ValueError(f"{year} is already archived")
+        table = Record.__table__
+        summary = session.query(
+            func.count(Record.id),
+            func.count(Record.id).filter(Record.status == "Pending"),
+            func.max(Record.updated_at)).filter(Record.year == year)
+        rows, pending, last_modified = summary.one()
+        if not rows:
+            raise ValueError(f"no records for {year}")
+
+        copied = 0
+
+        def copy_rows():
+            nonlocal copied
+            for row in self.stream(select(table).where(table.c.year == year)
+                                   .order_by(table.c.id)):
+                copied += 1
+                yield dict(row._mapping)
+
+        size = self.__archives.write(year, copy_rows())
+        try:
+            self._lock_year(session, year)
+            if copied != rows or tuple(summary.one()) != (rows, pending, last_modified):
+                raise ValueError(f"records of {year} changed while archiving; try again")
+            archived = ArchivedYear(year=year, rows=rows, pending=pending,
+                                    last_modified=last_modified, size=size,
+                                    archived_at=datetime.utcnow())
+            session.add(archived)
+            session.execute(delete(Record).where(Record.year == year),
+                            execution_options={"synchronize_session": False})
+            session.commit()
+        except Exception:
+            session.rollback()
+            self.__archives.remove(year)
+            raise
+        return archived
+
+    def restore_year(self, year: int) -> int:
+        """Move an archived year back into the live table; return its row count.
+
+        Raises ValueError if the year is not archived.
+        """
+        if self.__session is None:
+            self.reload()
+        session = self.__session
+        archived = session.get(ArchivedYear, year)
+        if archived is None:
+            raise ValueError(f"{year} is not archived")
+        table = Record.__table__
+        count = 0
+        try:
+            with self.__archives.engine(year).connect() as conn:
+                batch = []
+                for row in conn.execute(select(table).order_by(table.c.id)):
+                    batch.append(dict(row._mapping))
+                    if len(batch) >= 1000:
+                        session.execute(insert(table), batch)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    session.execute(insert(table), batch)
+                    count += len(batch)
+            session.delete(archived)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        self.__archives.remove(year)
+        return count
+
+    def drop_year(self, year: int) -> int:
+        """Remove every record of year, live or archived; return the count.
+
+        The year's upload history goes too, so its workbooks can be loaded
+        again from scratch.
+        """
+        if self.__session is None:
+            self.reload()
+        session = self.__session
+        try:
+            archived = session.get(ArchivedYear, year)
+            count = archived.rows if archived is not None else 0
+            if archived is not None:
+                session.delete(archived)
+            count += session.execute(
+                delete(Record).where(Record.year == year),
+                execution_options={"synchronize_session": False}).rowcount or 0
+            session.execute(delete(Upload).where(Upload.year == year))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        if archived is not None:
+            self.__archives.remove(year)
+        return count
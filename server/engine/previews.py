@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+"""First-page thumbnails for stored documents.
+
+Thumbnails are rendered in a process pool when a document is ingested and
+cached on disk as PNG files keyed by the blob digest, so they are rendered
+once per distinct document no matter how many records share it. PDFs are
+rendered with PyMuPDF and images with Pillow; both are optional, and
+documents whose renderer is missing simply have no preview.
+
+A document the renderer rejects is not tried again. Failures that say
+nothing about the document (a crashed worker process, a temporary I/O
+error) are retried once EDMS_PREVIEW_RETRY_SECONDS have passed.
+"""
+import os
+import threading
+import time
+from os import getenv
+from pathlib import Path
+from typing import Dict, Optional
+
+THUMBNAIL_SIZE = (360, 480)
+# Seconds before a render that failed for a transient reason is retried
+PREVIEW_RETRY_SECONDS = float(getenv("EDMS_PREVIEW_RETRY_SECONDS", "60"))
+
+PDF_TYPES = ("application/pdf",)
+IMAGE_TYPES = ("image/png", "image/jpeg", "image/tiff", "image/gif", "image/bmp")
+
+
+def can_render(content_type: Optional[str]) -> bool:
+    """Return True if there is a renderer for documents of content_type."""
+    return bool(content_type) and (content_type in PDF_TYPES or content_type in IMAGE_TYPES)
+
+
+def render_thumbnail(src_path: str, dest_path: str, content_type: str) -> bool:
+    """Render the first page of src_path to a PNG at dest_path.
+
+    Runs inside a worker process. Returns False if the needed library is not
+    installed or the document could not be rendered. System errors (an
+    OSError with an errno, such as a full disk) are raised instead, so the
+    caller can try again later.
+    """
+    tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+    try:
+        if content_type in PDF_TYPES:
+            try:
+                import fitz  # PyMuPDF
+            except ImportError:
+                return False
+            with fitz.open(src_path) as pdf:
+                if pdf.page_count == 0:
+                    return False
+                page = pdf.load_page(0)
+                zoom = min(THUMBNAIL_SIZE[0] / page.rect.width,
+                           THUMBNAIL_SIZE[1] / page.rect.height)
+                pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+                pixmap.save(tmp_path, output="png")
+        else:
+            try:
+                from PIL import Image
+            except ImportError:
+                return False
+            with Image.open(src_path) as image:
+                image.seek(0)  # first frame of multi-page TIFFs
+                image = image.convert("RGB")
+                image.thumbnail(THUMBNAIL_SIZE)
+                image.save(tmp_path, format="PNG", optimize=True)
+        os.replace(tmp_path, dest_path)
+        return True
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        # Decoders report bad content as OSError too, but without an errno
+        if isinstance(e, OSError) and e.errno is not None:
+            raise
+        return False
+
+
+class PreviewRenderer:
+    """Schedules thumbnail rendering and locates cached thumbnails."""
+
+    def __init__(self, blob_store, root: Optional[str] = None,
+                 max_workers: Optional[int] = None):
+        self.blobs = blob_store
+        self.root = Path(root or getenv("EDMS_PREVIEW_DIR") or blob_store.root / "previews")
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers or int(getenv("EDMS_PREVIEW_WORKERS", "2"))
+        self._executor = None  # ProcessPoolExecutor, started on first use
+        self._pending = {}
+        # digest -> when to retry, or None for documents never to retry
+        self._failed: Dict[str, Optional[float]] = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, digest: str) -> Path:
+        """Return where the thumbnail for digest is (or will be) cached."""
+        return self.root / digest[:2] / f"{digest}.png"
+
+    def exists(self, digest: str) -> bool:
+        return self.path_for(digest).exists()
+
+    def is_pending(self, digest: str) -> bool:
+        with self._lock:
+            return digest in self._pending
+
+    def schedule(self, digest: str, content_type: Optional[str]) -> bool:
+        """Queue rendering of digest's thumbnail unless cached or queued.
+
+        Returns True if a thumbnail exists or is being rendered.
+        """
+        if self.exists(digest):
+            return True
+        if not can_render(content_type):
+            return False
+        with self._lock:
+            if digest in self._failed:
+                retry_at = self._failed[digest]
+                if retry_at is None or retry_at > time.monotonic():
+                    return False
+                del self._failed[digest]
+            if digest in self._pending:
+                return True
+            from concurrent.futures import ProcessPoolExecutor
+            from concurrent.futures.process import BrokenProcessPool
+            dest = self.path_for(digest)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            args = (render_thumbnail, str(self.blobs.path_for(digest)), str(dest), content_type)
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            executor = self._executor
+            try:
+                future = executor.submit(*args)
+            except BrokenProcessPool:
+                # Died before its failed renders reported back; replace it
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                future = executor.submit(*args)
+            self._pending[digest] = future
+        future.add_done_callback(lambda f: self._done(digest, f, executor))
+        return True
+
+    def _done(self, digest: str, future, executor) -> None:
+        from concurrent.futures.process import BrokenProcessPool
+        error = None if future.cancelled() else future.exception()
+        with self._lock:
+            self._pending.pop(digest, None)
+            if future.cancelled() or error is not None:
+                # Not the document's fault; try again later
+                self._failed[digest] = time.monotonic() + PREVIEW_RETRY_SECONDS
+                if isinstance(error, BrokenProcessPool) and self._executor is executor:
+                    # A worker process died; start a fresh pool on next use
+                    self._executor = None
+                    executor.shutdown(wait=False, cancel_futures=True)
+            elif not future.result():
+                # don't retry documents that cannot be rendered
+                self._failed[digest] = None
+
+    def shutdown(self) -> None:
+        """Stop the worker processes, abandoning queued renders."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
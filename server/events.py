@@ -0,0 +1,261 @@
+#!/usr/bin/python3
+"""In-process change feed for connected clients.
+
+Route handlers publish small change events (an upload's progress, records
+added to a year, an account edited); every subscriber whose filter matches
+gets a copy on its own bounded asyncio queue and GET /events streams it as
+Server-Sent Events. publish() is safe to call from threadpool workers.
+
+Recent events are kept in a ring buffer so a client that reconnects with
+Last-Event-ID receives what it missed. A subscriber that falls too far
+behind, or asks to resume from an event no longer buffered, is sent a
+single "resync" event telling it to reload in full.
+
+When the server runs several worker processes each one has its own bus;
+enable_relay() links them through Unix datagram sockets in a shared
+directory so an event published by one worker reaches every client.
+Listeners added with add_listener() see every event too, wherever it was
+published, which lets per-process caches drop stale entries.
+"""
+import asyncio
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+HISTORY_SIZE = 1000
+QUEUE_SIZE = 256
+
+
+class Subscription:
+    """One client's filter and queue of pending events."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop,
+                 types: Optional[Iterable[str]] = None, year: Optional[int] = None):
+        self.loop = loop
+        self.types = tuple(t for t in (types or ()) if t)
+        self.year = year
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.lagged = False
+
+    def wants(self, event: Dict[str, Any]) -> bool:
+        """Match an event type by prefix ("records" matches "records.changed")."""
+        if event["type"] == "resync":
+            return True
+        if self.types and not any(event["type"] == t or event["type"].startswith(t + ".")
+                                  for t in self.types):
+            return False
+        year = event["data"].get("year")
+        return not self.year or year is None or year == self.year
+
+    def deliver(self, event: Dict[str, Any]) -> None:
+        """Queue event on the subscriber's loop (called from that loop)."""
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Drop the backlog; the client reloads instead of replaying it
+            self.lagged = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_resync_event())
+
+
+def _resync_event() -> Dict[str, Any]:
+    return {"id": None, "type": "resync", "time": time.time(), "data": {}}
+
+
+class EventBus:
+    """Fan events out to subscribers and remember the most recent ones."""
+
+    def __init__(self, history: int = HISTORY_SIZE):
+        # Ids are microsecond timestamps, so they keep increasing across
+        # restarts and workers; a client resuming with an id from before
+        # this process started is known to have missed events
+        self._started = int(time.time() * 1_000_000)
+        self._last_id = self._started
+        self._history: deque = deque(maxlen=history)
+        self._subscribers: List[Subscription] = []
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+        self._relay_dir: Optional[Path] = None
+        self._relay_path: Optional[Path] = None
+        self._relay_socket: Optional[socket.socket] = None
+        self._relay_transport = None
+
+    def publish(self, event_type: str, **data) -> Dict[str, Any]:
+        """Broadcast an event to every matching subscriber."""
+        with self._lock:
+            self._last_id = max(self._last_id + 1, int(time.time() * 1_000_000))
+            event = {"id": self._last_id, "type": event_type,
+                     "time": time.time(), "data": data}
+        self._relay(event)
+        self._dispatch(event)
+        return event
+
+    def _dispatch(self, event: Dict[str, Any]) -> None:
+        """Record event and hand it to local subscribers."""
+        with self._lock:
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print("Event listener failed:", e)
+        for sub in subscribers:
+            if sub.wants(event):
+                try:
+                    sub.loop.call_soon_threadsafe(sub.deliver, event)
+                except RuntimeError:
+                    pass  # the subscriber's loop is closed; it is going away
+        return event
+
+    def add_listener(self, listener: Callable[[Dict[str, Any]], None]) -> None:
+        """Call listener(event) synchronously for every event.
+
+        Listeners run on the publishing thread or the relay's event loop,
+        so they must be quick and must not block.
+        """
+        self._listeners.append(listener)
+
+    def subscribe(self, types: Optional[Iterable[str]] = None, year: Optional[int] = None,
+                  last_event_id: Optional[int] = None) -> Subscription:
+        """Register a subscriber on the running loop, replaying missed events."""
+        sub = Subscription(asyncio.get_running_loop(), types, year)
+        with self._lock:
+            if last_event_id is not None:
+                full = len(self._history) == self._history.maxlen
+                if last_event_id < self._started or (
+                        full and self._history[0]["id"] > last_event_id):
+                    sub.deliver(_resync_event())
+                else:
+                    for event in self._history:
+                        if event["id"] > last_event_id and sub.wants(event):
+                            sub.deliver(event)
+            self._subscribers.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def enable_relay(self, directory: str) -> None:
+        """Exchange events with the other worker processes using directory.
+
+        Must be called from the worker's event loop. Does nothing on
+        platforms without Unix domain sockets.
+        """
+        if not hasattr(socket, "AF_UNIX") or self._relay_transport is not None:
+            return
+        self._relay_dir = Path(directory)
+        self._relay_dir.mkdir(parents=True, exist_ok=True)
+        self._relay_path = self._relay_dir / f"{os.getpid()}.sock"
+        if self._relay_path.exists():
+            self._relay_path.unlink()
+        bus = self
+
+        class _Receiver(asyncio.DatagramProtocol):
+            def datagram_received(self, payload, addr):
+                try:
+                    event = json.loads(payload)
+                except ValueError:
+                    return
+                bus._dispatch(event)
+
+        loop = asyncio.get_running_loop()
+        self._relay_transport, _ = await loop.create_datagram_endpoint(
+            _Receiver, local_addr=str(self._relay_path), family=socket.AF_UNIX)
+        self._relay_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # Never block a request on a slow peer; it just misses the event
+        self._relay_socket.setblocking(False)
+
+    def disable_relay(self) -> None:
+        """Stop relaying and remove this worker's socket.
+
+        The last worker to leave also removes the relay directory; one
+        started later (a reload) creates it again.
+        """
+        if self._relay_transport is not None:
+            self._relay_transport.close()
+            self._relay_transport = None
+        if self._relay_socket is not None:
+            self._relay_socket.close()
+            self._relay_socket = None
+        if self._relay_path is not None and self._relay_path.exists():
+            self._relay_path.unlink()
+        if self._relay_dir is not None:
+            try:
+                self._relay_dir.rmdir()
+            except OSError:
+                pass  # other workers' sockets are still there
+
+    def _relay(self, event: Dict[str, Any]) -> None:
+        """Send event to every other worker's socket, pruning dead ones."""
+        if self._relay_socket is None:
+            return
+        payload = json.dumps(event, default=str).encode("utf-8")
+        for peer in self._relay_dir.glob("*.sock"):
+            if peer == self._relay_path:
+                continue
+            try:
+                self._relay_socket.sendto(payload, str(peer))
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    peer.unlink()  # left behind by a worker that has exited
+                except FileNotFoundError:
+                    pass
+            except OSError:
+                pass  # peer busy or event too large; that worker misses it
+
+
+def remove_relay_dir(directory: str) -> bool:
+    """Delete a relay directory unless a live worker still has a socket in it.
+
+    Sockets nobody listens on (left by workers that have exited) are
+    removed first. A directory shared with another master's workers, as
+    during a USR2 upgrade, is left for whichever master exits last.
+    Returns True if the directory was deleted.
+    """
+    path = Path(directory)
+    if not hasattr(socket, "AF_UNIX") or not path.is_dir():
+        return False
+    for peer in path.glob("*.sock"):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            probe.connect(str(peer))
+        except (ConnectionRefusedError, FileNotFoundError):
+            try:
+                peer.unlink()
+            except FileNotFoundError:
+                pass
+            continue
+        except OSError:
+            pass  # cannot tell; treat the peer as alive
+        finally:
+            probe.close()
+        return False
+    shutil.rmtree(path, ignore_errors=True)
+    return True
+
+
+def format_sse(event: Dict[str, Any]) -> bytes:
+    """Encode an event as one Server-Sent Events message."""
+    lines = []
+    if event.get("id") is not None:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append("data: " + json.dumps({**event["data"], "time": event["time"]},
+                                       default=str, separators=(",", ":")))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+"""Gunicorn settings for running the EDMS API with uvicorn workers.
+
+Used by ``python -m server.serve`` or directly:
+
+    gunicorn -c python:server.gunicorn_conf server.app:app
+
+The app and its models are imported once in the master (preload_app) and
+shared copy-on-write by the forked workers; each worker then drops the
+database connections it inherited. Workers are recycled after a jittered
+number of requests, and on reload or shutdown they get graceful_timeout
+seconds to finish in-flight requests such as large uploads.
+
+Signals: HUP starts fresh workers with the current settings, TTIN/TTOU add
+or remove a worker, and USR2 followed by QUIT to the old master upgrades
+to new code without dropping connections.
+"""
+import os
+import tempfile
+from os import getenv
+
+try:
+    import uvicorn_worker  # noqa: F401
+    _WORKER_CLASS = "uvicorn_worker.UvicornWorker"
+except ImportError:
+    _WORKER_CLASS = "uvicorn.workers.UvicornWorker"
+
+bind = f"{getenv('EDMS_HOST', '127.0.0.1')}:{getenv('EDMS_PORT', '8000')}"
+workers = int(getenv("EDMS_WORKERS") or (os.cpu_count() or 1))
+worker_class = _WORKER_CLASS
+preload_app = True
+
+# Recycle workers to cap memory growth; jitter keeps them from restarting together
+max_requests = int(getenv("EDMS_MAX_REQUESTS", "2000"))
+max_requests_jitter = max(max_requests // 10, 1) if max_requests else 0
+
+graceful_timeout = int(getenv("EDMS_GRACEFUL_TIMEOUT", "120"))
+timeout = int(getenv("EDMS_WORKER_TIMEOUT", "120"))
+keepalive = 5
+
+accesslog = getenv("EDMS_ACCESS_LOG") or None
+errorlog = "-"
+loglevel = getenv("EDMS_LOG_LEVEL", "info")
+
+# Relay directory managed by these hooks (None if the operator set one)
+_relay_dir = None
+
+
+def on_starting(server):
+    """Give this master's workers a directory to relay events through.
+
+    A master started by USR2 inherits the old master's environment and so
+    its directory; both generations' workers then relay through it while
+    they overlap, and EDMS_EVENT_RELAY_MANAGED tells the new master it
+    shares responsibility for removing it.
+    """
+    global _relay_dir
+    if not os.environ.get("EDMS_EVENT_RELAY_DIR"):
+        os.environ["EDMS_EVENT_RELAY_DIR"] = tempfile.mkdtemp(prefix="edms-events-")
+        os.environ["EDMS_EVENT_RELAY_MANAGED"] = "1"
+    if os.environ.get("EDMS_EVENT_RELAY_MANAGED"):
+        _relay_dir = os.environ["EDMS_EVENT_RELAY_DIR"]
+
+
+def on_exit(server):
+    """Remove the relay directory unless another master's workers still use it."""
+    if _relay_dir:
+        from server.events import remove_relay_dir
+        remove_relay_dir(_relay_dir)
+
+
+def when_ready(server):
+    """Bring the schema up to date once, before the workers start."""
+    from server import storage
+    storage.reload()
+    storage.dispose()
+
+
+def post_fork(server, worker):
+    """Drop connections inherited from the preloaded master."""
+    from server import storage
+    storage.dispose()
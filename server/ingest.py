@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+"""Workbook ingestion: parse uploaded spreadsheets into Record rows.
+
+Uploads arrive either as the original .xlsx workbook or, when the client
+pre-validated it, as a gzip-compressed CSV with canonical headers, which
+parses far faster than spreadsheet XML.
+"""
+import csv
+import gzip
+import hashlib
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import delete, insert, update
+
+from server import storage
+from server.partition import ArchivedYear
+from server.record import Record
+from server.upload import Upload
+
+
+BATCH_SIZE = 1000
+
+# Record fields taken from a workbook row; they make up its fingerprint
+FINGERPRINT_FIELDS = ("file_no", "name", "department", "lga", "status")
+
+# Accepted spellings of each column header, after normalization. Clients
+# fetch these from /api/workbook/headers to validate workbooks locally.
+HEADER_ALIASES = {
+    "file_no": ("file no", "file number", "file_no", "fileno", "file"),
+    "name": ("name", "full name", "staff name"),
+    "department": ("department", "dept"),
+    "year": ("year",),
+    "lga": ("lga", "local government", "local government area"),
+    "status": ("status",),
+}
+
+# Columns a workbook must have; the others may be left out
+REQUIRED_FIELDS = ("file_no", "name")
+
+
+class IngestError(Exception):
+    """Raised when an uploaded workbook cannot be ingested."""
+
+
+def _normalize(header: Any) -> str:
+    return " ".join(str(header or "").replace("_", " ").replace(".", " ").lower().split())
+
+
+def map_headers(headers: List[Any]) -> Dict[str, int]:
+    """Map record field names to column indexes in a header row."""
+    lookup = {}
+    for field, aliases in HEADER_ALIASES.items():
+        for alias in aliases:
+            lookup[_normalize(alias)] = field
+    mapping = {}
+    for index, header in enumerate(headers):
+        field = lookup.get(_normalize(header))
+        if field and field not in mapping:
+            mapping[field] = index
+    missing = [f for f in REQUIRED_FIELDS if f not in mapping]
+    if missing:
+        raise IngestError(f"missing required columns: {', '.join(missing)}")
+    return mapping
+
+
+def _rows_from_sheet(rows: Iterator[tuple]) -> Iterator[Dict[str, Any]]:
+    """Turn raw sheet rows (header first) into field dicts."""
+    try:
+        headers = next(rows)
+    except StopIteration:
+        raise IngestError("workbook is empty")
+    mapping = map_headers(list(headers))
+    for row in rows:
+        values = {}
+        for field, index in mapping.items():
+            value = row[index] if index < len(row) else None
+            values[field] = (str(value).strip() or None) if value is not None else None
+        if not values.get("file_no"):
+            continue  # skip blank lines
+        yield values
+
+
+def read_workbook(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield one dict per data row of the first sheet of an .xlsx file."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise IngestError("openpyxl is required to ingest Excel workbooks")
+    # Blobs have no file extension, so hand openpyxl an open file instead
+    with open(path, "rb") as f:
+        try:
+            workbook = load_workbook(f, read_only=True, data_only=True)
+        except Exception as e:
+            raise IngestError(f"cannot read workbook: {e}")
+        try:
+            yield from _rows_from_sheet(workbook.active.iter_rows(values_only=True))
+        finally:
+            workbook.close()
+
+
+def read_csv(path: str, compressed: bool = False) -> Iterator[Dict[str, Any]]:
+    """Yield one dict per data row of a (optionally gzipped) CSV file."""
+    opener = gzip.open if compressed else open
+    try:
+        with opener(path, "rt", encoding="utf-8-sig", newline="") as f:
+            yield from _rows_from_sheet(iter(csv.reader(f)))
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        raise IngestError(f"cannot read CSV: {e}")
+
+
+def upload_format(content_type: Optional[str], content_encoding: Optional[str]) -> str:
+    """Classify an upload as "xlsx", "csv" or "csv.gz" from its headers."""
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    gzipped = (content_encoding or "").lower() == "gzip" or media_type in (
+        "application/gzip", "application/x-gzip")
+    if media_type == "text/csv" or gzipped:
+        return "csv.gz" if gzipped else "csv"
+    return "xlsx"
+
+
+def read_upload(path: str, fmt: str) -> Iterator[Dict[str, Any]]:
+    """Dispatch to the reader for an upload format."""
+    if fmt == "xlsx":
+        return read_workbook(path)
+    return read_csv(path, compressed=(fmt == "csv.gz"))
+
+
+def record_fingerprint(values: Dict[str, Any]) -> str:
+    """Return a digest of the workbook-sourced fields of a record.
+
+    Two rows with the same fingerprint carry identical data, so re-uploads
+    only need to touch rows whose fingerprint changed.
+    """
+    joined = "\x1f".join(str(values.get(field) or "") for field in FINGERPRINT_FIELDS)
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()
+
+
+def _record_values(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "file_no": row["file_no"],
+        "name": row.get("name") or "",
+        "department": row.get("department"),
+        "lga": row.get("lga"),
+        "status": row.get("status") or "Active",
+    }
+
+
+def _chunks(items: List[Any], size: int = BATCH_SIZE) -> Iterator[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def ingest_workbook(path: str, year: int, sha256: str,
+                    filename: Optional[str] = None,
+                    account_id: Optional[int] = None,
+                    fmt: str = "xlsx",
+                    progress: Optional[Callable[[int, int], None]] = None) -> Upload:
+    """Synchronise the records of year with the upload at path.
+
+    Rows are matched to existing records of the year by file number and
+    compared by fingerprint: new file numbers are inserted, changed rows
+    are updated in place (keeping any attached document) and unchanged rows
+    are left alone. Records that an earlier upload of the same file created
+    and that are missing from this one are deleted. All statements are
+    batched and committed once, together with the Upload entry that records
+    the delta. progress, if given, is called with (rows applied, rows to
+    apply) after each batch.
+    """
+    now = datetime.utcnow()
+    incoming: Dict[str, Dict[str, Any]] = {}
+    total = 0
+    with storage.transaction() as sess:
+        for row in read_upload(path, fmt):
+            values = _record_values(row)
+            values["fingerprint"] = record_fingerprint(values)
+            incoming[values["file_no"]] = values  # a later duplicate row wins
+            total += 1
+
+        # The year may have been archived since the upload was accepted
+        if sess.get(ArchivedYear, year) is not None:
+            raise IngestError(f"{year} is archived; restore it before uploading")
+
+        existing = {}
+        duplicates = []
+        query = (sess.query(Record.id, Record.file_no, Record.source, Record.fingerprint,
+                            *(getattr(Record, field) for field in FINGERPRINT_FIELDS))
+                 .filter(Record.year == year)
+                 .order_by(Record.id))
+        for row in query:
+            # With duplicate file numbers in a year, the oldest record this
+            # workbook owns is matched (else the oldest one); its other copies
+            # of the file number are removed, anyone else's are left alone
+            current = existing.get(row.file_no)
+            owned = bool(filename) and row.source == filename
+            if current is None:
+                existing[row.file_no] = row
+            elif not owned:
+                continue
+            elif current.source != filename:
+                existing[row.file_no] = row
+            else:
+                duplicates.append(row.id)
+
+        inserts, updates = [], []
+        unchanged = 0
+        for file_no, values in incoming.items():
+            current = existing.get(file_no)
+            if current is None:
+                inserts.append({**values, "year": year, "source": filename,
+                                "created_at": now, "updated_at": now})
+                continue
+            fingerprint = current.fingerprint or record_fingerprint(current._mapping)
+            if fingerprint == values["fingerprint"]:
+                unchanged += 1
+            else:
+                updates.append({**values, "id": current.id, "source": filename,
+                                "updated_at": now})
+
+        # Only prune records this workbook put there; other workbooks for
+        # the same year and hand-entered records are left untouched.
+        deletes = [row.id for file_no, row in existing.items()
+                   if file_no not in incoming and filename and row.source == filename]
+        deletes.extend(duplicates)
+
+        pending = len(inserts) + len(updates) + len(deletes)
+        applied = 0
+        if progress is not None:
+            progress(applied, pending)
+        for batch in _chunks(inserts):
+            sess.execute(insert(Record), batch)
+            applied += len(batch)
+            if progress is not None:
+                progress(applied, pending)
+        for batch in _chunks(updates):
+            sess.execute(update(Record), batch)
+            applied += len(batch)
+            if progress is not None:
+                progress(applied, pending)
+        for batch in _chunks(deletes):
+            sess.execute(delete(Record).where(Record.id.in_(batch)),
+                         execution_options={"synchronize_session": False})
+            applied += len(batch)
+            if progress is not None:
+                progress(applied, pending)
+
+        upload = Upload()
+        upload.sha256 = sha256
+        upload.filename = filename
+        upload.year = year
+        upload.rows = total
+        upload.inserted = len(inserts)
+        upload.updated = len(updates)
+        upload.deleted = len(deletes)
+        upload.unchanged = unchanged
+        upload.account_id = account_id
+        sess.add(upload)
+    return upload
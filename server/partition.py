@@ -0,0 +1,31 @@
+#!/usr/bin/python3
+"""ArchivedYear SQLAlchemy model for EDMS"""
+from datetime import datetime
+from sqlalchemy import Column, Integer, BigInteger, DateTime
+from server.base import Base
+
+
+class ArchivedYear(Base):
+    """A year of records moved out of the live table into an archive file.
+
+    The summary columns answer counts and cache validators for the year
+    without opening its archive.
+    """
+    __tablename__ = "archived_years"
+
+    year = Column(Integer, primary_key=True, autoincrement=False)
+    rows = Column(Integer, default=0, nullable=False)
+    pending = Column(Integer, default=0, nullable=False)
+    last_modified = Column(DateTime, nullable=True)
+    size = Column(BigInteger, default=0, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            "year": self.year,
+            "rows": self.rows,
+            "pending": self.pending,
+            "last_modified": self.last_modified.isoformat() if self.last_modified else None,
+            "size": self.size,
+            "archived_at": self.archived_at.isoformat() if self.archived_at else None,
+        }
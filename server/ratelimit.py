@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+"""Token-bucket rate limiting, used to throttle login attempts.
+
+Every login costs a bcrypt verification, so /token checks its buckets
+before touching the password. Every attempt takes a token from its client
+address's bucket. The bucket for a username *at that address* is only
+checked up front and is charged when the password turns out wrong, so
+correct logins never use it up and failures elsewhere cannot lock a user
+out. Each bucket holds up to ``capacity`` tokens and refills at
+``per_second``; an attempt is refused while a bucket it needs is empty.
+
+Buckets live in process memory by default, so with several workers each
+one enforces the limits separately. Set EDMS_RATE_LIMIT_REDIS_URL (and
+install the redis package) to share them between workers and hosts.
+"""
+import threading
+import time
+from collections import OrderedDict
+from os import getenv
+from typing import NamedTuple, Optional, Tuple
+
+
+class Limit(NamedTuple):
+    capacity: float    # largest burst allowed
+    per_second: float  # tokens added back each second
+
+    @classmethod
+    def per_minute(cls, burst: float, rate: float) -> "Limit":
+        return cls(burst, rate / 60.0)
+
+
+# A username gets a burst of 5 failed attempts from an address, then one a
+# minute; an address (which may be an office behind NAT) gets 20 attempts,
+# then 20 a minute
+LOGIN_PER_USER = Limit.per_minute(float(getenv("EDMS_LOGIN_USER_BURST", "5")),
+                                  float(getenv("EDMS_LOGIN_USER_PER_MINUTE", "1")))
+LOGIN_PER_IP = Limit.per_minute(float(getenv("EDMS_LOGIN_IP_BURST", "20")),
+                                float(getenv("EDMS_LOGIN_IP_PER_MINUTE", "20")))
+
+
+class MemoryBackend:
+    """Buckets in a dict, bounded to the max_keys most recently used."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        """Take cost tokens; return 0 if allowed, else seconds until they are.
+
+        With cost 0 nothing is taken; the result says whether one token is
+        available.
+        """
+        now = time.monotonic()
+        need = cost or 1.0
+        with self._lock:
+            tokens, stamp = self._buckets.pop(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - stamp) * limit.per_second)
+            retry_after = 0.0
+            if tokens >= need:
+                tokens -= cost
+            else:
+                retry_after = (need - tokens) / limit.per_second
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+
+# Atomic refill-and-take on a Redis hash; returns the seconds to wait (0 if allowed)
+_REDIS_TAKE = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local need = cost
+if need == 0 then need = 1 end
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+local tokens = tonumber(state[1]) or capacity
+local stamp = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - stamp) * rate)
+local retry_after = 0
+if tokens >= need then
+    tokens = tokens - cost
+else
+    retry_after = (need - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'stamp', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+class RedisBackend:
+    """Buckets shared through Redis by every worker that points at it.
+
+    If Redis cannot be reached the process falls back to its own memory
+    buckets rather than refusing or waving through every login.
+    """
+
+    def __init__(self, url: str, prefix: str = "edms:ratelimit:"):
+        import redis
+        self._errors = (redis.RedisError,)
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5)
+        self._script = self._client.register_script(_REDIS_TAKE)
+        self._prefix = prefix
+        self._fallback = MemoryBackend()
+        self._down = False
+
+    def take(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        try:
+            retry_after = float(self._script(keys=[self._prefix + key],
+                                             args=[limit.capacity, limit.per_second,
+                                                   time.time(), cost]))
+        except self._errors as e:
+            # Report the outage once, not on every login attempt
+            if not self._down:
+                self._down = True
+                print("Rate limit store unavailable, limiting per process:", e)
+            return self._fallback.take(key, limit, cost)
+        if self._down:
+            self._down = False
+            print("Rate limit store reachable again")
+        return retry_after
+
+
+class RateLimiter:
+    """Check attempts against one or more named buckets."""
+
+    def __init__(self, backend=None):
+        if backend is None:
+            url = getenv("EDMS_RATE_LIMIT_REDIS_URL")
+            backend = RedisBackend(url) if url else MemoryBackend()
+        self.backend = backend
+
+    def hit(self, *buckets: Tuple[str, Limit], cost: float = 1.0) -> float:
+        """Take cost tokens from each (key, limit) bucket.
+
+        Returns 0 when the attempt may go ahead, otherwise the number of
+        seconds until every bucket has a token again. With cost 0 the
+        buckets are only checked.
+        """
+        return max((self.backend.take(key, limit, cost) for key, limit in buckets),
+                   default=0.0)
+
+    @staticmethod
+    def _login_user_bucket(address: Optional[str], username: str) -> Tuple[str, Limit]:
+        return f"login:user:{username.strip().lower()}:{address or '-'}", LOGIN_PER_USER
+
+    def hit_login(self, address: Optional[str], username: str) -> float:
+        """Throttle a password login before it is verified.
+
+        Charges the address's bucket and checks, without charging, the
+        bucket for this username from this address.
+        """
+        return max(self.hit((f"login:ip:{address or '-'}", LOGIN_PER_IP)),
+                   self.hit(self._login_user_bucket(address, username), cost=0))
+
+    def login_failed(self, address: Optional[str], username: str) -> None:
+        """Charge a wrong password to the username's bucket for address."""
+        self.hit(self._login_user_bucket(address, username))
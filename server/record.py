@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+"""Record SQLAlchemy model for EDMS"""
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Index, ForeignKey
+from server.base import Base
+
+
+class Record(Base):
+    """Represents a single document record imported from a workbook."""
+    __tablename__ = "records"
+    __table_args__ = (
+        # Covers every facet column so facet counts are an index-only scan
+        Index("ix_records_facets", "year", "department", "lga", "status"),
+        # Re-uploads match a year's rows by file number
+        Index("ix_records_year_file_no", "year", "file_no"),
+        # Never reuse ids, so archived years can be restored without clashes
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    file_no = Column(String(64), nullable=False, index=True)
+    name = Column(String(255), nullable=False)
+    department = Column(String(128), nullable=True)
+    year = Column(Integer, nullable=False, index=True)
+    lga = Column(String(128), nullable=True)
+    status = Column(String(32), default="Active", nullable=False)
+    document_sha256 = Column(String(64), ForeignKey("documents.sha256"),
+                             nullable=True, index=True)
+    document_name = Column(String(255), nullable=True)
+    # Workbook the row came from and a digest of its workbook fields, used to
+    # apply re-uploads incrementally (see server.ingest)
+    source = Column(String(255), nullable=True)
+    fingerprint = Column(String(40), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow,
+                        onupdate=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "file_no": self.file_no,
+            "name": self.name,
+            "department": self.department,
+            "year": self.year,
+            "lga": self.lga,
+            "status": self.status,
+            "document_sha256": self.document_sha256,
+            "document_name": self.document_name,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
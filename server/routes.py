@@ -1,45 +1,108 @@
 #!/usr/bin/python3
 """FastAPI routes for EDMS server"""
-from fastapi import APIRouter, HTTPException, Depends
+import asyncio
+import math
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
-from typing import List
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+from os import getenv
+from typing import List, Optional
+from server import analytics, audit_log, blobs, events, previews, rate_limiter, storage
 from server import crud
 from server import schemas
-from server.auth import create_access_token, verify_password, SECRET_KEY, ALGORITHM
-from jose import JWTError, jwt
+from server import ingest
+from server.engine.analytics import AnalyticsUnavailable
+from server.engine.blobstore import BlobTooLarge
+from server.events import format_sse
+from server.rows import AccountRow, RecordRow
+from server.utils import (
+	rows_response, make_etag, conditional_response, validator_headers,
+	export_response, EXPORT_FORMATS,
+)
+from server.auth import TokenUser, decode_access_token, decode_refresh_token, issue_tokens
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
+MAX_DOCUMENT_BYTES = int(getenv("EDMS_MAX_DOCUMENT_BYTES", str(500 * 1024 * 1024)))
+MAX_WORKBOOK_BYTES = int(getenv("EDMS_MAX_WORKBOOK_BYTES", str(100 * 1024 * 1024)))
+# Request body bytes gathered before each write to disk in the threadpool
+UPLOAD_WRITE_BYTES = 1024 * 1024
+# Seconds between keep-alive comments on an idle event stream
+EVENT_HEARTBEAT = float(getenv("EDMS_EVENT_HEARTBEAT", "15"))
+# Streams are closed after this many seconds and the client resumes with
+# Last-Event-ID; this keeps a graceful worker shutdown from waiting on them
+EVENT_MAX_AGE = float(getenv("EDMS_EVENT_MAX_AGE", "60"))
+
 router = APIRouter()
 
 
-def get_current_user_from_token(token: str = Depends(oauth2_scheme)):
-	try:
-		payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-		username: str = payload.get("sub")
-		if username is None:
-			raise HTTPException(status_code=401, detail="Invalid auth token")
-	except JWTError:
-		raise HTTPException(status_code=401, detail="Invalid auth token")
+def record_audit(request: Request, action: str, user: Optional[TokenUser] = None,
+				 target=None, username: Optional[str] = None, **detail):
+	"""Queue an audit entry for the request (written in batches later)."""
+	audit_log.record(action, account_id=user.id if user else None,
+					 username=user.username if user else username, target=target,
+					 address=request.client.host if request.client else None, **detail)
 
-	user = crud.get_account_by_username(username)
-	if not user:
+
+def get_current_user_from_token(token: str = Depends(oauth2_scheme)) -> TokenUser:
+	"""Authorize from the token's claims; no account lookup per request.
+
+	Tokens from before the account's last update (or deletion) are refused.
+	"""
+	payload = decode_access_token(token)
+	if not payload or payload.get("uid") is None or payload.get("sub") is None:
+		raise HTTPException(status_code=401, detail="Invalid auth token")
+	version = crud.token_versions.get(payload["uid"])
+	if version is None:
 		raise HTTPException(status_code=401, detail="User not found")
-	return user
+	if payload.get("ver") != version:
+		raise HTTPException(status_code=401, detail="Token has been revoked")
+	return TokenUser(payload["uid"], payload["sub"], payload.get("role", "staff"))
 
 
-@router.post("/token")
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-	user = crud.get_account_by_username(form_data.username)
-	if not user or not verify_password(form_data.password, user.password_hash):
+@router.post("/token", response_model=schemas.Token)
+def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+	# Refuse floods before spending a bcrypt verification on them
+	address = request.client.host if request.client else None
+	retry_after = rate_limiter.hit_login(address, form_data.username)
+	if retry_after:
+		raise HTTPException(status_code=429, detail="Too many login attempts, try again later",
+			headers={"Retry-After": str(math.ceil(retry_after))})
+
+	user = crud.authenticate(form_data.username, form_data.password)
+	if not user:
+		rate_limiter.login_failed(address, form_data.username)
+		record_audit(request, "login.failed", username=form_data.username[:128])
 		raise HTTPException(status_code=400, detail="Incorrect username or password")
 
-	access_token = create_access_token({"sub": user.username})
-	return {"access_token": access_token, "token_type": "bearer"}
+	record_audit(request, "login", TokenUser(user.id, user.username, user.role))
+	return issue_tokens(user)
+
+
+@router.post("/token/refresh", response_model=schemas.Token)
+def refresh_access_token(body: schemas.TokenRefresh):
+	"""Trade a refresh token for a new token pair without the password.
+
+	Refused once the account has changed since the token was issued.
+	"""
+	payload = decode_refresh_token(body.refresh_token)
+	if not payload or payload.get("uid") is None:
+		raise HTTPException(status_code=401, detail="Invalid refresh token")
+	version = crud.token_versions.get(payload["uid"])
+	if version is None or payload.get("ver") != version:
+		raise HTTPException(status_code=401, detail="Invalid refresh token")
+	user = crud.get_account_by_id(payload["uid"])
+	if not user:
+		raise HTTPException(status_code=401, detail="Invalid refresh token")
+	return issue_tokens(user)
 
 
 @router.post("/accounts", response_model=schemas.AccountRead)
-def create_account(account: schemas.AccountCreate, current_user=Depends(get_current_user_from_token)):
+def create_account(request: Request, account: schemas.AccountCreate,
+				   current_user=Depends(get_current_user_from_token)):
 	# only admin can create new accounts
 	if current_user.role != "admin":
 		raise HTTPException(status_code=403, detail="Insufficient permissions")
@@ -52,54 +115,499 @@ def create_account(account: schemas.AccountCreate, current_user=Depends(get_curr
 			role=account.role or "staff",
 		)
 	except ValueError as e:
-		if str(e) == "username_exists":
-			raise HTTPException(status_code=400, detail="Username already exists")
+		if str(e) in crud.CONFLICT_MESSAGES:
+			raise HTTPException(status_code=400, detail=crud.CONFLICT_MESSAGES[str(e)])
 		raise HTTPException(status_code=500, detail=str(e))
+	record_audit(request, "account.create", current_user, target=a.id,
+				 account=a.username, role=a.role)
+	events.publish("accounts.changed", id=a.id, action="created")
 	return a.to_dict()
 
 
+@router.post("/accounts/bulk", response_model=schemas.AccountBulkResult)
+def create_accounts(request: Request, accounts: List[schemas.AccountCreate],
+					current_user=Depends(get_current_user_from_token)):
+	"""Create many accounts with a single commit.
+
+	Entries that cannot be created (e.g. a taken username) are reported in
+	errors; the rest are still created.
+	"""
+	if current_user.role != "admin":
+		raise HTTPException(status_code=403, detail="Insufficient permissions")
+	created, errors = crud.create_accounts([
+		dict(username=a.username, password=a.password, email=a.email, role=a.role or "staff")
+		for a in accounts])
+	for a in created:
+		record_audit(request, "account.create", current_user, target=a.id,
+					 account=a.username, role=a.role)
+		events.publish("accounts.changed", id=a.id, action="created")
+	return {"created": [a.to_dict() for a in created], "errors": errors}
+
+
 @router.get("/accounts", response_model=List[schemas.AccountRead])
-def list_accounts(current_user=Depends(get_current_user_from_token)):
+def list_accounts(request: Request, current_user=Depends(get_current_user_from_token)):
 	# only admin can list all accounts
 	if current_user.role != "admin":
 		raise HTTPException(status_code=403, detail="Insufficient permissions")
-	items = crud.list_accounts()
-	return [i.to_dict() for i in items]
+	count, last_modified = crud.account_version()
+	etag = make_etag("accounts", count, last_modified)
+	cached = conditional_response(request, etag, last_modified)
+	if cached is not None:
+		return cached
+	return rows_response(crud.list_account_rows(), headers=validator_headers(etag, last_modified))
+
+
+@router.get("/accounts/export")
+def export_accounts(request: Request, format: str = "csv",
+					current_user=Depends(get_current_user_from_token)):
+	"""Download every account as CSV or NDJSON, streamed from the database."""
+	if current_user.role != "admin":
+		raise HTTPException(status_code=403, detail="Insufficient permissions")
+	if format not in EXPORT_FORMATS:
+		raise HTTPException(status_code=422, detail="format must be csv or ndjson")
+	record_audit(request, "accounts.export", current_user, format=format)
+	return export_response(crud.iter_account_rows(), AccountRow, format, "accounts")
 
 
 @router.get("/accounts/{account_id}", response_model=schemas.AccountRead)
-def get_account(account_id: int, current_user=Depends(get_current_user_from_token)):
+def get_account(account_id: int, request: Request, response: Response,
+				current_user=Depends(get_current_user_from_token)):
 	acct = crud.get_account_by_id(account_id)
 	if not acct:
 		raise HTTPException(status_code=404, detail="Account not found")
 	# allow admins or the user themselves
 	if current_user.role != "admin" and current_user.id != acct.id:
 		raise HTTPException(status_code=403, detail="Insufficient permissions")
+	etag = make_etag("account", acct.id, acct.updated_at)
+	cached = conditional_response(request, etag, acct.updated_at)
+	if cached is not None:
+		return cached
+	response.headers.update(validator_headers(etag, acct.updated_at))
 	return acct.to_dict()
 
 
 @router.put("/accounts/{account_id}", response_model=schemas.AccountRead)
-def update_account(account_id: int, updates: schemas.AccountUpdate, current_user=Depends(get_current_user_from_token)):
-	acct = crud.get_account_by_id(account_id)
-	if not acct:
-		raise HTTPException(status_code=404, detail="Account not found")
-	if current_user.role != "admin" and current_user.id != acct.id:
+def update_account(account_id: int, request: Request, updates: schemas.AccountUpdate,
+				   current_user=Depends(get_current_user_from_token)):
+	# The token says who is asking, so the account is only touched by the UPDATE
+	if current_user.role != "admin" and current_user.id != account_id:
 		raise HTTPException(status_code=403, detail="Insufficient permissions")
 
 	data = {k: v for k, v in updates.dict().items() if v is not None}
-	acct = crud.update_account(account_id, data)
+	try:
+		acct = crud.update_account(account_id, data)
+	except ValueError as e:
+		raise HTTPException(status_code=400, detail=crud.CONFLICT_MESSAGES.get(str(e), str(e)))
 	if not acct:
 		raise HTTPException(status_code=404, detail="Account not found")
+	# Only the names of changed fields are kept, so no password reaches the log
+	record_audit(request, "account.update", current_user, target=acct.id,
+				 fields=sorted(data), role=data.get("role"))
+	events.publish("accounts.changed", id=acct.id, action="updated")
 	return acct.to_dict()
 
 
 @router.delete("/accounts/{account_id}")
-def delete_account(account_id: int, current_user=Depends(get_current_user_from_token)):
+def delete_account(account_id: int, request: Request, current_user=Depends(get_current_user_from_token)):
 	# only admin can delete accounts
 	if current_user.role != "admin":
 		raise HTTPException(status_code=403, detail="Insufficient permissions")
 	ok = crud.delete_account(account_id)
 	if not ok:
 		raise HTTPException(status_code=404, detail="Account not found")
+	record_audit(request, "account.delete", current_user, target=account_id)
+	events.publish("accounts.changed", id=account_id, action="deleted")
 	return {"deleted": True}
 
+
+async def receive_blob(request: Request, writer) -> None:
+	"""Copy the request body into a blob writer off the event loop.
+
+	Chunks are gathered up to UPLOAD_WRITE_BYTES and written (and hashed)
+	in a worker thread, so a large upload does not stall other requests.
+	"""
+	pending, pending_bytes = [], 0
+	async for chunk in request.stream():
+		pending.append(chunk)
+		pending_bytes += len(chunk)
+		if pending_bytes >= UPLOAD_WRITE_BYTES:
+			await run_in_threadpool(writer.write, b"".join(pending))
+			pending, pending_bytes = [], 0
+	if pending:
+		await run_in_threadpool(writer.write, b"".join(pending))
+
+
+def publish_records_changed(year: int, action: str, **data):
+	"""Announce a bulk change to a year, with fresh dashboard counts."""
+	events.publish("records.changed", year=year, action=action,
+				   stats=crud.record_stats(), **data)
+
+
+@router.get("/events")
+async def change_feed(request: Request, types: Optional[str] = None,
+					  year: Optional[int] = None,
+					  last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+					  current_user=Depends(get_current_user_from_token)):
+	"""Stream change events to the client as Server-Sent Events.
+
+	types is a comma-separated list of event type prefixes (e.g.
+	"records,uploads") and year limits year-specific events to one year.
+	Reconnecting with Last-Event-ID replays missed events, or sends a
+	"resync" event when they are no longer available.
+	"""
+	async def stream():
+		sub = events.subscribe((types or "").split(","), year, last_event_id)
+		loop = asyncio.get_running_loop()
+		deadline = loop.time() + EVENT_MAX_AGE
+		try:
+			yield b"retry: 3000\n\n"
+			while loop.time() < deadline:
+				timeout = min(EVENT_HEARTBEAT, max(deadline - loop.time(), 0))
+				try:
+					event = await asyncio.wait_for(sub.queue.get(), timeout)
+				except asyncio.TimeoutError:
+					if await request.is_disconnected():
+						break
+					yield b": keep-alive\n\n"
+					continue
+				if event["type"] == "resync":
+					sub.lagged = False
+				yield format_sse(event)
+		finally:
+			events.unsubscribe(sub)
+
+	return StreamingResponse(stream(), media_type="text/event-stream",
+							 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get("/records", response_model=List[schemas.RecordRead])
+def search_records(request: Request, year: Optional[int] = None,
+				   department: Optional[str] = None, lga: Optional[str] = None,
+				   status: Optional[str] = None, q: Optional[str] = None,
+				   limit: int = Query(500, ge=1, le=10000), offset: int = Query(0, ge=0),
+				   current_user=Depends(get_current_user_from_token)):
+	filters = dict(year=year, department=department, lga=lga, status=status, keyword=q)
+	searched = {k: v for k, v in filters.items() if v is not None}
+	if searched:
+		record_audit(request, "records.search", current_user, limit=limit, offset=offset, **searched)
+	count, last_modified = crud.record_version(**filters)
+	etag = make_etag("records", sorted(filters.items()), limit, offset, count, last_modified)
+	cached = conditional_response(request, etag, last_modified)
+	if cached is not None:
+		return cached
+	rows = crud.search_record_rows(limit=limit, offset=offset, **filters)
+	return rows_response(rows, headers=validator_headers(etag, last_modified))
+
+
+@router.get("/records/export")
+def export_records(request: Request, format: str = "csv", year: Optional[int] = None,
+				   department: Optional[str] = None, lga: Optional[str] = None,
+				   status: Optional[str] = None, q: Optional[str] = None,
+				   current_user=Depends(get_current_user_from_token)):
+	"""Download every matching record (no paging) as CSV or NDJSON.
+
+	Rows are streamed from each partition as the client reads them, so a
+	full dump never sits in memory.
+	"""
+	if format not in EXPORT_FORMATS:
+		raise HTTPException(status_code=422, detail="format must be csv or ndjson")
+	filters = dict(year=year, department=department, lga=lga, status=status, keyword=q)
+	record_audit(request, "records.export", current_user, format=format,
+				 **{k: v for k, v in filters.items() if v is not None})
+	name = f"records-{year}" if year else "records"
+	return export_response(crud.iter_record_rows(**filters), RecordRow, format, name)
+
+
+@router.get("/records/stats", response_model=schemas.RecordStats)
+def record_stats(request: Request, response: Response,
+				 current_user=Depends(get_current_user_from_token)):
+	count, last_modified = crud.record_version()
+	etag = make_etag("record-stats", count, last_modified)
+	cached = conditional_response(request, etag, last_modified)
+	if cached is not None:
+		return cached
+	response.headers.update(validator_headers(etag, last_modified))
+	return crud.record_stats()
+
+
+@router.get("/records/facets", response_model=schemas.RecordFacets)
+def record_facets(request: Request, response: Response, year: Optional[int] = None,
+				  department: Optional[str] = None, lga: Optional[str] = None,
+				  status: Optional[str] = None, q: Optional[str] = None,
+				  current_user=Depends(get_current_user_from_token)):
+	filters = dict(year=year, department=department, lga=lga, status=status, keyword=q)
+	count, last_modified = crud.record_version()
+	etag = make_etag("record-facets", sorted(filters.items()), count, last_modified)
+	cached = conditional_response(request, etag, last_modified)
+	if cached is not None:
+		return cached
+	response.headers.update(validator_headers(etag, last_modified))
+	return crud.record_facets(**filters)
+
+
+@router.get("/records/partitions", response_model=List[schemas.PartitionRead])
+def list_partitions(current_user=Depends(get_current_user_from_token)):
+	"""List every year with its row count and whether it is archived."""
+	return crud.list_partitions()
+
+
+@router.post("/records/partitions/{year}/archive", response_model=schemas.PartitionRead)
+def archive_partition(year: int, request: Request, current_user=Depends(get_current_user_from_token)):
+	"""Move a cold year out of the live table into a compressed archive."""
+	if current_user.role != "admin":
+		raise HTTPException(status_code=403, detail="Insufficient permissions")
+	try:
+		archived = storage.archive_year(year)
+	except ValueError as e:
+		raise HTTPException(status_code=409, detail=str(e))
+	record_audit(request, "partition.archive", current_user, target=year)
+	publish_records_changed(year, "archived")
+	return {**archived.to_dict(), "archived": True}
+
+
+@router.post("/records/partitions/{year}/restore", response_model=schemas.PartitionRead)
+def restore_partition(year: int, request: Request, current_user=Depends(get_current_user_from_token)):
+	"""Bring an archived year back into the live table."""
+	if current_user.role != "admin":
+		raise HTTPException(status_code=403, detail="Insufficient permissions")
+	try:
+		rows = storage.restore_year(year)
+	except ValueError as e:
+		raise HTTPException(status_code=404, detail=str(e))
+	record_audit(request, "partition.restore", current_user, target=year, rows=rows)
+	publish_records_changed(year, "restored")
+	return {"year": year, "rows": rows, "archived": False}
+
+
+@router.delete("/records/partitions/{year}")
+def drop_partition(year: int, request: Request, current_user=Depends(get_current_user_from_token)):
+	"""Delete every record of year so its workbooks can be loaded afresh."""
+	if current_user.role != "admin":
+		raise HTTPException(status_code=403, detail="Insufficient permissions")
+	deleted = storage.drop_year(year)
+	record_audit(request, "partition.drop", current_user, target=year, deleted=deleted)
+	publish_records_changed(year, "dropped", deleted=deleted)
+	return {"year": year, "deleted": deleted}
+
+
+@router.put("/records/{record_id}/document", response_model=schemas.DocumentRead)
+async def upload_document(record_id: int, request: Request, filename: Optional[str] = None,
+						  current_user=Depends(get_current_user_from_token)):
+	"""Store the raw request body as the record's document.
+
+	The body is hashed and written to disk chunk by chunk as it arrives, so
+	memory use does not depend on the document size.
+	"""
+	if await run_in_threadpool(crud.get_record_by_id, record_id) is None:
+		if await run_in_threadpool(crud.find_record, record_id) is not None:
+			raise HTTPException(status_code=409, detail="Record belongs to an archived year")
+		raise HTTPException(status_code=404, detail="Record not found")
+
+	writer = blobs.writer(max_bytes=MAX_DOCUMENT_BYTES)
+	try:
+		await receive_blob(request, writer)
+		sha256, size, created = await run_in_threadpool(writer.commit)
+	except BlobTooLarge:
+		raise HTTPException(status_code=413, detail="Document too large")
+	except BaseException:
+		writer.abort()
+		raise
+
+	content_type = request.headers.get("content-type")
+	record = await run_in_threadpool(crud.attach_document, record_id, sha256, size,
+									 content_type, filename)
+	if record is None:
+		raise HTTPException(status_code=404, detail="Record not found")
+	record_audit(request, "document.upload", current_user, target=record_id,
+				 sha256=sha256, size=size, filename=filename)
+	events.publish("records.updated", year=record.year, record=record.to_dict())
+	# render the thumbnail now so View Details never waits for it
+	previews.schedule(sha256, content_type)
+	return {"sha256": sha256, "size": size, "content_type": content_type,
+			"deduplicated": not created}
+
+
+@router.get("/records/{record_id}/document")
+def download_document(record_id: int, request: Request, current_user=Depends(get_current_user_from_token)):
+	"""Serve the record's document straight from the blob store.
+
+	FileResponse answers Range / If-Range requests with 206 partial content,
+	so clients can resume interrupted downloads and seek within large PDFs.
+	The ETag is the blob digest, which never changes for a given blob. On
+	ASGI servers with the pathsend extension the file is sent by the server
+	itself without passing through Python.
+	"""
+	record = crud.find_record(record_id)
+	if not record or not record.document_sha256:
+		raise HTTPException(status_code=404, detail="Document not found")
+	doc = crud.get_document(record.document_sha256)
+	if doc is None or not blobs.exists(doc.sha256):
+		raise HTTPException(status_code=404, detail="Document not found")
+
+	# Resumed downloads send Range; only the first request is audited
+	if "range" not in request.headers:
+		record_audit(request, "document.download", current_user, target=record_id, sha256=doc.sha256)
+	return FileResponse(blobs.path_for(doc.sha256),
+						media_type=doc.content_type or "application/octet-stream",
+						filename=record.document_name or doc.sha256,
+						headers={"ETag": f'"{doc.sha256}"'})
+
+
+@router.get("/records/{record_id}/preview")
+def document_preview(record_id: int, request: Request, current_user=Depends(get_current_user_from_token)):
+	"""Return the cached first-page thumbnail of the record's document.
+
+	Answers 202 with Retry-After while the thumbnail is still rendering and
+	404 if the document type cannot be previewed. Every request for an
+	existing record is audited as a view, whichever answer it gets.
+	"""
+	record = crud.find_record(record_id)
+	if not record or not record.document_sha256:
+		raise HTTPException(status_code=404, detail="Document not found")
+	record_audit(request, "record.view", current_user, target=record_id)
+	sha256 = record.document_sha256
+	if previews.exists(sha256):
+		return FileResponse(previews.path_for(sha256), media_type="image/png",
+							headers={"ETag": f'"{sha256}"',
+									 "Cache-Control": "private, max-age=31536000, immutable"})
+
+	doc = crud.get_document(sha256)
+	if not previews.is_pending(sha256) and not previews.schedule(sha256, doc.content_type if doc else None):
+		raise HTTPException(status_code=404, detail="No preview available")
+	return Response(status_code=202, headers={"Retry-After": "1"})
+
+
+@router.get("/api/workbook/headers", response_model=schemas.WorkbookHeaders)
+def workbook_headers(current_user=Depends(get_current_user_from_token)):
+	"""Column header spellings the ingester accepts, for client-side checks."""
+	return {"aliases": ingest.HEADER_ALIASES, "required": list(ingest.REQUIRED_FIELDS)}
+
+
+@router.get("/api/uploads/{sha256}", response_model=schemas.UploadRead)
+def find_upload(sha256: str, year: int, current_user=Depends(get_current_user_from_token)):
+	"""Tell a client whether a workbook was already ingested for year."""
+	upload = crud.get_upload(sha256.lower(), year)
+	if upload is None:
+		raise HTTPException(status_code=404, detail="Upload not found")
+	return upload.to_dict()
+
+
+@router.post("/api/upload", response_model=schemas.UploadRead)
+async def upload_workbook(request: Request, year: int, filename: Optional[str] = None,
+						  source_sha256: Optional[str] = None,
+						  current_user=Depends(get_current_user_from_token)):
+	"""Ingest a workbook sent as the raw request body.
+
+	The body is either an .xlsx workbook or, with Content-Type text/csv and
+	Content-Encoding gzip, a client-validated CSV.gz conversion of one; then
+	source_sha256 is the digest of the original workbook. The payload is
+	kept in the blob store and a workbook already ingested for the same
+	year is recognised by its hash and skipped. Otherwise the year's records
+	are updated incrementally and the response reports the delta.
+	"""
+	if await run_in_threadpool(crud.is_archived, year):
+		raise HTTPException(status_code=409, detail=f"{year} is archived; restore it before uploading")
+	writer = blobs.writer(max_bytes=MAX_WORKBOOK_BYTES)
+	try:
+		await receive_blob(request, writer)
+		sha256, size, created = await run_in_threadpool(writer.commit)
+	except BlobTooLarge:
+		raise HTTPException(status_code=413, detail="Workbook too large")
+	except BaseException:
+		writer.abort()
+		raise
+
+	upload_key = (source_sha256 or sha256).lower()
+
+	def skipped(existing):
+		record_audit(request, "workbook.upload", current_user, target=year,
+					 filename=filename, sha256=upload_key, skipped=True)
+		return {**existing.to_dict(), "skipped": True}
+
+	existing = await run_in_threadpool(crud.get_upload, upload_key, year)
+	if existing is not None:
+		return skipped(existing)
+
+	fmt = ingest.upload_format(request.headers.get("content-type"),
+							   request.headers.get("content-encoding"))
+	def progress(applied, total):
+		events.publish("uploads.progress", year=year, filename=filename,
+					   sha256=upload_key, applied=applied, total=total)
+
+	try:
+		upload = await run_in_threadpool(ingest.ingest_workbook, str(blobs.path_for(sha256)),
+										 year, upload_key, filename, current_user.id, fmt,
+										 progress)
+	except ingest.IngestError as e:
+		raise HTTPException(status_code=422, detail=str(e))
+	except IntegrityError:
+		# An identical upload committed first (uq_uploads_sha256_year); this
+		# one was rolled back and the other's changes already apply
+		existing = await run_in_threadpool(crud.get_upload, upload_key, year)
+		if existing is None:
+			raise
+		return skipped(existing)
+	result = upload.to_dict()
+	record_audit(request, "workbook.upload", current_user, target=year, filename=filename,
+				 sha256=upload_key, inserted=result.get("inserted"),
+				 updated=result.get("updated"), deleted=result.get("deleted"))
+	await run_in_threadpool(publish_records_changed, year, "upload", upload=result)
+	return result
+
+
+@router.get("/analytics/records", response_model=schemas.AnalyticsResult)
+def records_report(request: Request, response: Response,
+				   group_by: List[str] = Query([]), year: Optional[int] = None,
+				   department: Optional[str] = None, lga: Optional[str] = None,
+				   status: Optional[str] = None,
+				   current_user=Depends(get_current_user_from_token)):
+	"""Count records per combination of the group_by dimensions.
+
+	Answered from the latest columnar snapshot rather than the live tables,
+	so reports may lag behind by up to a day.
+	"""
+	manifest = analytics.current()
+	if manifest is None:
+		raise HTTPException(status_code=503, detail="No analytics snapshot available yet")
+	filters = dict(year=year, department=department, lga=lga, status=status)
+	generated_at = datetime.fromisoformat(manifest["generated_at"])
+	etag = make_etag("analytics", manifest["snapshot"], group_by, sorted(filters.items()))
+	cached = conditional_response(request, etag, generated_at)
+	if cached is not None:
+		return cached
+	try:
+		result = analytics.query(group_by, **filters)
+	except ValueError as e:
+		raise HTTPException(status_code=422, detail=str(e))
+	except AnalyticsUnavailable as e:
+		raise HTTPException(status_code=503, detail=str(e))
+	response.headers.update(validator_headers(etag, generated_at))
+	return result
+
+
+@router.post("/analytics/snapshot", response_model=schemas.AnalyticsResult)
+def refresh_snapshot(current_user=Depends(get_current_user_from_token)):
+	"""Take a new analytics snapshot now instead of waiting for the nightly run."""
+	if current_user.role != "admin":
+		raise HTTPException(status_code=403, detail="Insufficient permissions")
+	try:
+		crud.snapshot_records()
+	except AnalyticsUnavailable as e:
+		raise HTTPException(status_code=503, detail=str(e))
+	return analytics.query()
+
+
+@router.get("/audit", response_model=List[schemas.AuditEventRead])
+def list_audit_events(account_id: Optional[int] = None, username: Optional[str] = None,
+					  action: Optional[str] = None, since: Optional[datetime] = None,
+					  until: Optional[datetime] = None,
+					  limit: int = Query(100, ge=1, le=1000), offset: int = Query(0, ge=0),
+					  current_user=Depends(get_current_user_from_token)):
+	"""Audit entries, newest first; action also matches its sub-actions."""
+	if current_user.role != "admin":
+		raise HTTPException(status_code=403, detail="Insufficient permissions")
+	# Include what this worker has buffered but not written yet
+	audit_log.flush()
+	return rows_response(crud.list_audit_events(account_id=account_id, username=username,
+												action=action, since=since, until=until,
+												limit=limit, offset=offset))
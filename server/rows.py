@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+"""Compact row objects for list and search results.
+
+The fast paths in server.crud select only the columns a listing shows and
+wrap each result row in one of these classes instead of an ORM instance
+or a dict. With ``__slots__`` a row holds just its values (no per-object
+``__dict__``), and orjson serializes dataclasses natively, so a page of
+rows is encoded in bulk without building a dict per row first.
+
+Field order matches the column tuples in server.crud, so rows are built
+positionally: ``AccountRow(*row)``.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+
+@dataclass
+class AccountRow:
+    __slots__ = ("id", "username", "email", "role", "status", "created_at", "updated_at")
+    id: int
+    username: str
+    email: Optional[str]
+    role: str
+    status: str
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+
+@dataclass
+class RecordRow:
+    __slots__ = ("id", "file_no", "name", "department", "year", "lga", "status",
+                 "document_sha256", "document_name", "created_at", "updated_at")
+    id: int
+    file_no: str
+    name: str
+    department: Optional[str]
+    year: int
+    lga: Optional[str]
+    status: str
+    document_sha256: Optional[str]
+    document_name: Optional[str]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+
+@dataclass
+class AuditEventRow:
+    __slots__ = ("id", "at", "account_id", "username", "action", "target", "address",
+                 "detail")
+    id: int
+    at: datetime
+    account_id: Optional[int]
+    username: Optional[str]
+    action: str
+    target: Optional[str]
+    address: Optional[str]
+    detail: Optional[Dict[str, Any]]
+
+
+def row_to_dict(row) -> Dict[str, Any]:
+    """Return a row's fields as a dict (for encoders without dataclass support)."""
+    return {name: getattr(row, name) for name in row.__slots__}
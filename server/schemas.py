@@ -1,7 +1,20 @@
 #!/usr/bin/python3
 """Pydantic schemas for server API"""
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Any, Dict, List, Optional, Union
+
+
+class Token(BaseModel):
+	access_token: str
+	refresh_token: str
+	token_type: str = "bearer"
+	expires_in: int
+	username: str
+	role: str
+
+
+class TokenRefresh(BaseModel):
+	refresh_token: str
 
 
 class AccountCreate(BaseModel):
@@ -30,3 +43,106 @@ class AccountRead(BaseModel):
 
 	class Config:
 		orm_mode = True
+
+
+class AccountBulkError(BaseModel):
+	index: int
+	username: Optional[str] = None
+	detail: str
+
+
+class AccountBulkResult(BaseModel):
+	created: List[AccountRead]
+	errors: List[AccountBulkError]
+
+
+class RecordRead(BaseModel):
+	id: int
+	file_no: str
+	name: str
+	department: Optional[str] = None
+	year: int
+	lga: Optional[str] = None
+	status: str
+	document_sha256: Optional[str] = None
+	document_name: Optional[str] = None
+	created_at: Optional[str] = None
+	updated_at: Optional[str] = None
+
+	class Config:
+		orm_mode = True
+
+
+class RecordStats(BaseModel):
+	total: int
+	this_year: int
+	pending: int
+
+
+class FacetValue(BaseModel):
+	value: Union[int, str]
+	count: int
+
+
+class RecordFacets(BaseModel):
+	year: List[FacetValue]
+	department: List[FacetValue]
+	lga: List[FacetValue]
+	status: List[FacetValue]
+
+
+class DocumentRead(BaseModel):
+	sha256: str
+	size: int
+	content_type: Optional[str] = None
+	created_at: Optional[str] = None
+	deduplicated: bool = False
+
+
+class UploadRead(BaseModel):
+	id: int
+	sha256: str
+	filename: Optional[str] = None
+	year: int
+	rows: int
+	inserted: int = 0
+	updated: int = 0
+	deleted: int = 0
+	unchanged: int = 0
+	account_id: Optional[int] = None
+	created_at: Optional[str] = None
+	skipped: bool = False
+
+
+class WorkbookHeaders(BaseModel):
+	aliases: Dict[str, List[str]]
+	required: List[str]
+
+
+class PartitionRead(BaseModel):
+	year: int
+	rows: int
+	archived: bool = False
+	pending: Optional[int] = None
+	last_modified: Optional[str] = None
+	size: Optional[int] = None
+	archived_at: Optional[str] = None
+
+
+class AuditEventRead(BaseModel):
+	id: int
+	at: str
+	account_id: Optional[int] = None
+	username: Optional[str] = None
+	action: str
+	target: Optional[str] = None
+	address: Optional[str] = None
+	detail: Optional[Dict[str, Any]] = None
+
+
+class AnalyticsResult(BaseModel):
+	snapshot: str
+	generated_at: str
+	engine: str
+	group_by: List[str]
+	rows: List[Dict[str, Any]]
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+"""Production launcher for the EDMS API.
+
+    python -m server.serve --workers 4 --port 8000
+
+Runs gunicorn with uvicorn workers (see server/gunicorn_conf.py) when
+gunicorn is installed, which gives a preloaded app, graceful reloads and
+worker recycling. Elsewhere (e.g. Windows) it falls back to uvicorn's own
+process manager with the same worker count, request limit and graceful
+shutdown timeout. Every option can also be set through its EDMS_*
+environment variable.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run the EDMS API server")
+    parser.add_argument("--host", default=os.environ.get("EDMS_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("EDMS_PORT", "8000")))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("EDMS_WORKERS") or (os.cpu_count() or 1)))
+    parser.add_argument("--max-requests", type=int,
+                        default=int(os.environ.get("EDMS_MAX_REQUESTS", "2000")),
+                        help="recycle a worker after this many requests (0 disables)")
+    parser.add_argument("--graceful-timeout", type=int,
+                        default=int(os.environ.get("EDMS_GRACEFUL_TIMEOUT", "120")),
+                        help="seconds in-flight requests get to finish on reload/shutdown")
+    parser.add_argument("--server", choices=("auto", "gunicorn", "uvicorn"), default="auto")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(sys.argv[1:] if argv is None else argv)
+    # gunicorn_conf reads its settings from the environment
+    os.environ.update({
+        "EDMS_HOST": args.host,
+        "EDMS_PORT": str(args.port),
+        "EDMS_WORKERS": str(args.workers),
+        "EDMS_MAX_REQUESTS": str(args.max_requests),
+        "EDMS_GRACEFUL_TIMEOUT": str(args.graceful_timeout),
+    })
+
+    use_gunicorn = args.server == "gunicorn"
+    if args.server == "auto":
+        try:
+            import gunicorn  # noqa: F401
+            use_gunicorn = True
+        except ImportError:
+            use_gunicorn = False
+
+    if use_gunicorn:
+        from gunicorn.app.wsgiapp import run
+        sys.argv = ["gunicorn", "-c", "python:server.gunicorn_conf", "server.app:app"]
+        run()
+        return
+
+    import uvicorn
+    relay_dir = None
+    if args.workers > 1 and not os.environ.get("EDMS_EVENT_RELAY_DIR"):
+        relay_dir = tempfile.mkdtemp(prefix="edms-events-")
+        os.environ["EDMS_EVENT_RELAY_DIR"] = relay_dir
+    try:
+        uvicorn.run("server.app:app", host=args.host, port=args.port, workers=args.workers,
+                    limit_max_requests=args.max_requests or None,
+                    timeout_graceful_shutdown=args.graceful_timeout)
+    finally:
+        if relay_dir:
+            from server.events import remove_relay_dir
+            remove_relay_dir(relay_dir)
+
+
+if __name__ == "__main__":
+    main()
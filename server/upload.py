@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+"""Upload SQLAlchemy model for EDMS"""
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+from server.base import Base
+
+
+class Upload(Base):
+    """A workbook ingested into the records table.
+
+    The workbook's SHA-256 lets clients skip files that were already
+    uploaded for the same year. inserted/updated/deleted/unchanged record
+    what ingesting it changed in the records table.
+    """
+    __tablename__ = "uploads"
+    __table_args__ = (UniqueConstraint("sha256", "year", name="uq_uploads_sha256_year"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    sha256 = Column(String(64), nullable=False, index=True)
+    filename = Column(String(255), nullable=True)
+    year = Column(Integer, nullable=False)
+    rows = Column(Integer, default=0, nullable=False)
+    inserted = Column(Integer, default=0, nullable=False)
+    updated = Column(Integer, default=0, nullable=False)
+    deleted = Column(Integer, default=0, nullable=False)
+    unchanged = Column(Integer, default=0, nullable=False)
+    account_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "sha256": self.sha256,
+            "filename": self.filename,
+            "year": self.year,
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "deleted": self.deleted,
+            "unchanged": self.unchanged,
+            "account_id": self.account_id,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
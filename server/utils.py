@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+"""Response helpers shared by the API routes."""
+import csv
+import hashlib
+import io
+import json
+from datetime import date, datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from dataclasses import is_dataclass
+from typing import Any, Iterable, Iterator, Optional, Type
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from server.rows import row_to_dict
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+
+def _json_default(obj):
+    """Encode the values the stdlib json module does not know about."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if is_dataclass(obj):
+        return row_to_dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when it is installed.
+
+    orjson encodes datetimes and dataclasses natively, so the row objects
+    of server.rows can be returned without converting every value first.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, default=_json_default, ensure_ascii=False,
+                          separators=(",", ":")).encode("utf-8")
+
+
+# Rows encoded per chunk of an export body
+EXPORT_CHUNK_ROWS = 500
+EXPORT_FORMATS = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+def _csv_chunks(rows: Iterable[Any], row_type: Type) -> Iterator[bytes]:
+    """Encode server.rows objects as CSV, header first, EXPORT_CHUNK_ROWS at a time.
+
+    The header comes from row_type, so an export with no rows still has one.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    fields = row_type.__slots__
+    writer.writerow(fields)
+    count = 0
+    for row in rows:
+        writer.writerow([value.isoformat() if isinstance(value, (datetime, date)) else value
+                         for value in (getattr(row, name) for name in fields)])
+        count += 1
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _ndjson_chunks(rows: Iterable[Any]) -> Iterator[bytes]:
+    """Encode server.rows objects as one JSON object per line."""
+    chunk = []
+    for row in rows:
+        if orjson is not None:
+            chunk.append(orjson.dumps(row))
+        else:
+            chunk.append(json.dumps(row_to_dict(row), default=_json_default,
+                                    ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        if len(chunk) == EXPORT_CHUNK_ROWS:
+            yield b"\n".join(chunk) + b"\n"
+            chunk = []
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
+
+
+def export_response(rows: Iterable[Any], row_type: Type, fmt: str,
+                    filename: str) -> StreamingResponse:
+    """Stream rows (row_type instances from server.rows) as a CSV or NDJSON download.
+
+    The body is produced while the client reads it, so with a streaming
+    row source (DBStorage.stream) an export of any size uses a bounded
+    amount of memory.
+    """
+    chunks = _csv_chunks(rows, row_type) if fmt == "csv" else _ndjson_chunks(rows)
+    return StreamingResponse(chunks, media_type=EXPORT_FORMATS[fmt],
+                             headers={"Content-Disposition":
+                                      f'attachment; filename="{filename}.{fmt}"',
+                                      "Cache-Control": "no-store"})
+
+
+def make_etag(*parts: Any) -> str:
+    """Build a weak ETag from the values that identify a representation."""
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def http_date(value: datetime) -> str:
+    """Format a naive UTC datetime as an HTTP date."""
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0),
+                           usegmt=True)
+
+
+def _not_modified(request: Request, etag: str,
+                  last_modified: Optional[datetime]) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since against the current state."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        current = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+        return current <= since
+    return False
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime]) -> dict:
+    """Headers that let clients revalidate instead of refetching."""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def conditional_response(request: Request, etag: str,
+                         last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """Return a 304 response if the client copy is current, else None.
+
+    Call this with a cheap version (e.g. count and max(updated_at)) before
+    running the real query, so unchanged refreshes skip the fetch entirely.
+    """
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304,
+                        headers=validator_headers(etag, last_modified))
+    return None
+
+
+def rows_response(rows: Iterable[Any], headers: Optional[dict] = None) -> ORJSONResponse:
+    """Serialize server.rows objects directly, bypassing ORM objects and pydantic."""
+    return ORJSONResponse(list(rows), headers=headers)